@@ -1,7 +1,13 @@
 import pandas as pd
 import numpy as np
 import random
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
+from dataset_stats import DatasetStatistics
+from features import FEATURE_NAMES, add_feature_columns
+
+# Incrementar cuando cambie la generación de forma que no se refleje en los landmarks de referencia
+# (shards.cell_key), para invalidar las celdas cacheadas
+GENERATOR_VERSION = 1
 
 class HybridPhysioDatasetGenerator:
     def __init__(self):
@@ -35,6 +41,9 @@ class HybridPhysioDatasetGenerator:
             "INCORRECT_POSTURE", "INSUFFICIENT_RANGE", "TOO_FAST_MOVEMENT",
             "ASYMMETRIC_MOVEMENT", "INCORRECT_ALIGNMENT", "INCOMPLETE_HOLD"
         ]
+        
+        # Desviación estándar del ruido de MediaPipe
+        self.noise_std = 0.003
     
     def generate_base_landmarks(self) -> List[float]:
         """Landmarks base (persona neutral de pie)"""
@@ -237,11 +246,11 @@ class HybridPhysioDatasetGenerator:
         return modified
     
     def introduce_errors(self, landmarks: List[float], exercise_id: str, 
-                        phase: str) -> Tuple[List[float], str]:
-        """Introduce errores específicos según exercise + phase"""
+                        phase: str, error_type: Optional[str] = None) -> Tuple[List[float], str]:
+        """Introduce errores específicos según exercise + phase (error_type aleatorio si no se indica)"""
         
         modified = landmarks.copy()
-        error_type = random.choice(self.error_types)
+        error_type = error_type or random.choice(self.error_types)
         
         if error_type == "ASYMMETRIC_MOVEMENT":
             # Asimetría corporal
@@ -294,10 +303,11 @@ class HybridPhysioDatasetGenerator:
     
     def add_realistic_noise(self, landmarks: List[float]) -> List[float]:
         """Ruido realista de MediaPipe"""
-        return [coord + random.gauss(0, 0.003) for coord in landmarks]
+        return [coord + random.gauss(0, self.noise_std) for coord in landmarks]
     
-    def generate_sample(self, exercise_id: str, phase: str, is_correct: bool) -> Dict:
-        """Genera UNA muestra para exercise_id + phase específicos"""
+    def generate_landmarks(self, exercise_id: str, phase: str, is_correct: bool,
+                           error_type: Optional[str] = None) -> Tuple[List[float], str]:
+        """Landmarks sin ruido y error_type de una muestra (pasos 1-3 de generate_sample)"""
         
         # 1. Landmarks base
         base_landmarks = self.generate_base_landmarks()
@@ -309,12 +319,14 @@ class HybridPhysioDatasetGenerator:
         
         # 3. Introducir errores si es incorrecto
         if is_correct:
-            final_landmarks = exercise_landmarks
-            error_type = "NONE"
-        else:
-            final_landmarks, error_type = self.introduce_errors(
-                exercise_landmarks, exercise_id, phase
-            )
+            return exercise_landmarks, "NONE"
+        return self.introduce_errors(exercise_landmarks, exercise_id, phase, error_type)
+    
+    def generate_sample(self, exercise_id: str, phase: str, is_correct: bool) -> Dict:
+        """Genera UNA muestra para exercise_id + phase específicos"""
+        
+        # 1-3. Landmarks para exercise + phase, con errores si es incorrecto
+        final_landmarks, error_type = self.generate_landmarks(exercise_id, phase, is_correct)
         
         # 4. Ruido realista
         final_landmarks = self.add_realistic_noise(final_landmarks)
@@ -337,8 +349,19 @@ class HybridPhysioDatasetGenerator:
         return sample
     
     def generate_dataset(self, samples_per_exercise_phase: int = 300, 
-                        error_rate: float = 0.35) -> pd.DataFrame:
-        """Generate dataset for hybrid approach"""
+                        error_rate: float = 0.35,
+                        statistics: Optional[DatasetStatistics] = None,
+                        columns: str = "landmarks") -> pd.DataFrame:
+        """Genera el dataset para el enfoque híbrido; statistics acumula las estadísticas de landmarks por celda.
+
+        columns: "landmarks" (66 coordenadas en bruto), "features" (features biomecánicas de features.py
+        en lugar de las coordenadas) o "both".
+        """
+        
+        if columns not in ("landmarks", "features", "both"):
+            raise ValueError(f"Columnas desconocidas: {columns}")
+        if statistics is None:
+            statistics = DatasetStatistics()
         
         print("GENERATING HYBRID DATASET")
         print("=" * 50)
@@ -362,11 +385,13 @@ class HybridPhysioDatasetGenerator:
                 # Generate correct samples
                 for _ in range(correct_count):
                     sample = self.generate_sample(exercise_id, phase, is_correct=True)
+                    statistics.add_sample(sample)
                     all_samples.append(sample)
                 
                 # Generate incorrect samples  
                 for _ in range(incorrect_count):
                     sample = self.generate_sample(exercise_id, phase, is_correct=False)
+                    statistics.add_sample(sample)
                     all_samples.append(sample)
                 
                 total_combinations += 1
@@ -374,24 +399,25 @@ class HybridPhysioDatasetGenerator:
         # Create DataFrame
         df = pd.DataFrame(all_samples)
         df = df.sample(frac=1, random_state=42).reset_index(drop=True)
+        if columns != "landmarks":
+            # Mismos ángulos y simetrías que las reglas de landmark_mappings, calculados en bloque
+            df = add_feature_columns(df, keep_landmarks=columns == "both")
         
         print(f"\n✅ DATASET HÍBRIDO GENERADO:")
         print(f"   📊 Total muestras: {len(df):,}")
         print(f"   🏋️ Ejercicios: {len(self.exercise_definitions)}")
         print(f"   📋 Combinaciones (ejercicio×fase): {total_combinations}")
-        print(f"   ✅ Muestras correctas: {df['is_correct'].sum():,}")
-        print(f"   ❌ Muestras incorrectas: {(~df['is_correct']).sum():,}")
-        print(f"   🔢 Features: exercise_id + expected_phase + {len([c for c in df.columns if 'landmark_' in c])} landmarks")
+        print(f"   ✅ Muestras correctas: {statistics.combined(is_correct=True).count:,}")
+        print(f"   ❌ Muestras incorrectas: {statistics.combined(is_correct=False).count:,}")
+        print(f"   🔢 Features: exercise_id + expected_phase + {len([c for c in df.columns if 'landmark_' in c])} landmarks"
+              f" + {len([c for c in df.columns if c in FEATURE_NAMES])} biomecánicas")
         
-        # Verificar separabilidad por ejercicio
+        # Verificar separabilidad por ejercicio (estadísticas acumuladas, sin recorrer el DataFrame)
         print(f"\n🔍 VERIFICACIÓN DE SEPARABILIDAD:")
         for exercise_id in list(self.exercise_definitions.keys())[:3]:
             for phase in self.exercise_definitions[exercise_id]['phases'][:2]:  # Solo primeras 2 fases
-                subset = df[(df['exercise_id'] == exercise_id) & (df['expected_phase'] == phase)]
-                if len(subset) > 0:
-                    correct_mean = subset[subset['is_correct']]['landmark_11_y'].mean()
-                    incorrect_mean = subset[~subset['is_correct']]['landmark_11_y'].mean()
-                    diff = abs(correct_mean - incorrect_mean)
+                diff = statistics.separability(exercise_id, phase)
+                if not np.isnan(diff):
                     print(f"   {exercise_id}_{phase}: landmark_11_y diff = {diff:.3f}")
         
         return df
@@ -400,29 +426,42 @@ def create_hybrid_dataset():
     """Función principal para generar dataset híbrido"""
     
     generator = HybridPhysioDatasetGenerator()
+    statistics = DatasetStatistics()
     
     df = generator.generate_dataset(
         samples_per_exercise_phase=300,  # 300 por cada (ejercicio × fase)
-        error_rate=0.35                  # 35% incorrectas
+        error_rate=0.35,                 # 35% incorrectas
+        statistics=statistics,
+        columns="both"                   # Coordenadas + ángulos/simetrías/distancias
     )
     
     filename = 'physio_hybrid_dataset.csv'
     df.to_csv(filename, index=False)
     
+    # Matriz de features cacheada: se carga con np.load sin parsear el CSV
+    features_filename = 'physio_hybrid_dataset_features.npy'
+    np.save(features_filename, df[FEATURE_NAMES].to_numpy(dtype=np.float32))
+    
+    stats_filename = 'physio_hybrid_dataset_stats.json'
+    statistics.save(stats_filename)
+    
     print(f"\n💾 DATASET GUARDADO: {filename}")
+    print(f"📈 ESTADÍSTICAS GUARDADAS: {stats_filename}")
+    print(f"📐 MATRIZ DE FEATURES: {features_filename} ({len(df):,} × {len(FEATURE_NAMES)}, orden de features.FEATURE_NAMES)")
     print(f"\n🎯 PERFECTO PARA:")
     print(f"   ✅ Modelo 1: exercise_id + expected_phase + landmarks → is_correct")
     print(f"   ✅ Modelo 2: exercise_id + expected_phase + landmarks → error_type")
+    print(f"   ✅ Modelos ligeros: exercise_id + expected_phase + {len(FEATURE_NAMES)} features → is_correct")
     print(f"   ✅ Enfoque híbrido con control de secuencias")
     print(f"   ✅ Fácil escalabilidad a nuevos ejercicios")
     
     # Mostrar estadísticas detalladas
     print(f"\n📊 ESTADÍSTICAS DETALLADAS:")
-    exercise_stats = df.groupby(['exercise_id', 'expected_phase']).agg({
-        'is_correct': ['count', 'sum']
-    }).round(0)
-    exercise_stats.columns = ['Total', 'Correctas']
-    exercise_stats['Incorrectas'] = exercise_stats['Total'] - exercise_stats['Correctas']
+    exercise_stats = pd.DataFrame([
+        {'exercise_id': cell['exercise_id'], 'expected_phase': cell['expected_phase'],
+         'Total': cell['correct'] + cell['incorrect'], 'Correctas': cell['correct'], 'Incorrectas': cell['incorrect']}
+        for cell in statistics.report()['separability']
+    ]).set_index(['exercise_id', 'expected_phase'])
     print(exercise_stats.head(10))
     
     return df, filename
@@ -0,0 +1,145 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+# MediaPipe Pose: índice del landmark simétrico en espejo (la nariz se queda)
+MIRROR_INDEX = np.array([
+    0, 4, 5, 6, 1, 2, 3, 8, 7, 10, 9,
+    12, 11, 14, 13, 16, 15, 18, 17, 20, 19, 22, 21,
+    24, 23, 26, 25, 28, 27, 30, 29, 32, 31,
+])
+
+LIMBS = ("upper_arm", "forearm", "thigh", "shank")
+NO_LIMB = len(LIMBS)  # Manos y pies siguen rígidamente unidos a muñecas y tobillos
+
+# Huesos (padre, hijo, segmento) agrupados por profundidad: cada nivel es una sola actualización indexada
+SKELETON_LEVELS = [
+    [(11, 13, 0), (12, 14, 0), (23, 25, 2), (24, 26, 2)],
+    [(13, 15, 1), (14, 16, 1), (25, 27, 3), (26, 28, 3)],
+    [(15, 17, NO_LIMB), (15, 19, NO_LIMB), (15, 21, NO_LIMB), (16, 18, NO_LIMB), (16, 20, NO_LIMB),
+     (16, 22, NO_LIMB), (27, 29, NO_LIMB), (27, 31, NO_LIMB), (28, 30, NO_LIMB), (28, 32, NO_LIMB)],
+]
+SKELETON_ARRAYS = [tuple(np.array(column) for column in zip(*level)) for level in SKELETON_LEVELS]
+
+HIPS = [23, 24]
+
+
+def identities(n: int) -> np.ndarray:
+    return np.tile(np.eye(3, dtype=np.float32), (n, 1, 1))
+
+
+def translations(offsets: np.ndarray) -> np.ndarray:
+    matrices = identities(len(offsets))
+    matrices[:, :2, 2] = offsets
+    return matrices
+
+
+def perturb_limbs(points: np.ndarray, factors: np.ndarray) -> np.ndarray:
+    """Escala cada segmento de cada muestra por factors[limb], arrastrando todo lo que cuelga de él.
+
+    points va por landmark (33, 2, N) y factors es (len(LIMBS), N).
+    """
+    factors = np.concatenate([factors, np.ones((1, factors.shape[1]), dtype=factors.dtype)])
+    perturbed = points.copy()
+    for parents, children, limbs in SKELETON_ARRAYS:
+        bones = points[children] - points[parents]
+        perturbed[children] = perturbed[parents] + factors[limbs, None] * bones
+    return perturbed
+
+
+def apply_homographies(points: np.ndarray, matrices: np.ndarray) -> np.ndarray:
+    """Proyecta puntos (33, 2, N) ordenados por landmark con una matriz 3x3 por muestra.
+
+    Escrito como multiplicaciones y sumas in-place por muestra: el matmul por lotes
+    de numpy es lento con muchas matrices pequeñas.
+    """
+    a, b, c, d, e, f, g, h, i = np.ascontiguousarray(matrices.reshape(-1, 9).T)
+    x, y = points[:, 0], points[:, 1]
+    inverse_w = g * x
+    inverse_w += h * y
+    inverse_w += i
+    np.reciprocal(inverse_w, out=inverse_w)
+    projected = np.empty_like(points)
+    for row, (first, second, offset) in enumerate(((a, b, c), (d, e, f))):
+        out = projected[:, row]
+        np.multiply(first, x, out=out)
+        out += second * y
+        out += offset
+        out *= inverse_w
+    return projected
+
+
+class LandmarkAugmenter:
+    """Variación geométrica aleatoria de batches de landmarks (N, 33, 2).
+
+    Primero se perturban las longitudes de los segmentos. Después el espejo (con el
+    intercambio de índices izquierda/derecha), la escala, la rotación en el plano y una
+    deformación de perspectiva alrededor del centro de la cadera, más una traslación, se
+    componen en una matriz 3x3 por muestra y se aplican a todo el batch de una vez.
+    Un parámetro a None o 0 desactiva esa transformación.
+    """
+
+    def __init__(self, scale: Optional[Tuple[float, float]] = (0.85, 1.15), translation: float = 0.05,
+                 rotation_degrees: float = 10.0, mirror_probability: float = 0.5,
+                 limb_scale: Optional[Tuple[float, float]] = (0.9, 1.1), perspective: float = 0.15):
+        self.scale = scale
+        self.translation = translation
+        self.rotation_degrees = rotation_degrees
+        self.mirror_probability = mirror_probability
+        self.limb_scale = limb_scale
+        self.perspective = perspective
+
+    def transforms(self, centers: np.ndarray, mirrored: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """Matrices (N, 3, 3): trasladar · centrar · perspectiva · rotar · escalar · espejo · descentrar"""
+        n = len(centers)
+
+        linear = identities(n)
+        if self.scale:
+            linear[:, :2, :2] *= rng.uniform(*self.scale, n).astype(np.float32)[:, None, None]
+        linear[:, :, 0] *= np.where(mirrored, -1, 1).astype(np.float32)[:, None]
+        if self.rotation_degrees:
+            angles = np.radians(rng.uniform(-self.rotation_degrees, self.rotation_degrees, n))
+            rotations = identities(n)
+            rotations[:, 0, 0] = rotations[:, 1, 1] = np.cos(angles)
+            rotations[:, 0, 1] = -np.sin(angles)
+            rotations[:, 1, 0] = np.sin(angles)
+            linear = np.matmul(rotations, linear)
+        if self.perspective:
+            warps = identities(n)
+            warps[:, 2, :2] = rng.uniform(-self.perspective, self.perspective, (n, 2))
+            linear = np.matmul(warps, linear)
+
+        shifts = centers
+        if self.translation:
+            shifts = centers + rng.uniform(-self.translation, self.translation, (n, 2)).astype(np.float32)
+        return np.matmul(np.matmul(translations(shifts), linear), translations(-centers))
+
+    def __call__(self, landmarks: np.ndarray, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        rng = rng if rng is not None else np.random.default_rng()
+        n = len(landmarks)
+        # Ordenado por landmark (33, 2, N): las selecciones por landmark son copias de bloques y
+        # los parámetros por muestra se propagan a lo largo del eje contiguo
+        points = np.asarray(landmarks, dtype=np.float32).transpose(1, 2, 0).copy()
+
+        if self.limb_scale:
+            points = perturb_limbs(points, rng.uniform(*self.limb_scale, (len(LIMBS), n)).astype(np.float32))
+
+        mirrored = rng.random(n) < self.mirror_probability
+        if mirrored.any():
+            np.copyto(points, points[MIRROR_INDEX], where=mirrored)
+
+        centers = points[HIPS].mean(axis=0).T
+        augmented = apply_homographies(points, self.transforms(centers, mirrored, rng))
+        return np.ascontiguousarray(augmented.transpose(2, 0, 1), dtype=np.float32)
+
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    batch = rng.uniform(0.2, 0.8, (1_000_000, 33, 2)).astype(np.float32)
+    augmenter = LandmarkAugmenter()
+    start = time.perf_counter()
+    augmented = augmenter(batch, rng)
+    elapsed = time.perf_counter() - start
+    print(f"{len(batch):,} muestras aumentadas en {elapsed:.2f}s ({len(batch) / elapsed:,.0f} muestras/s)")
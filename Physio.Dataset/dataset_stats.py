@@ -0,0 +1,157 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+LANDMARK_COUNT = 33
+COORDINATE_NAMES = [f"landmark_{index}_{axis}" for index in range(LANDMARK_COUNT) for axis in "xy"]
+
+CellKey = Tuple[str, str, bool, str]
+
+
+class WelfordAccumulator:
+    """Conteo, media y varianza de cada coordenada en una sola pasada (Welford), combinables (Chan et al.)"""
+
+    def __init__(self, size: int = len(COORDINATE_NAMES)):
+        self.count = 0
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+
+    def update_batch(self, values: np.ndarray):
+        """Añade de una vez un bloque (n, size) de muestras"""
+        values = np.asarray(values, dtype=np.float64).reshape(len(values), -1)
+        if len(values) == 0:
+            return
+        batch = WelfordAccumulator(values.shape[1])
+        batch.count = len(values)
+        batch.mean = values.mean(axis=0)
+        batch.m2 = ((values - batch.mean) ** 2).sum(axis=0)
+        self.merge(batch)
+
+    def merge(self, other: "WelfordAccumulator"):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+
+    @property
+    def variance(self) -> np.ndarray:
+        return self.m2 / (self.count - 1) if self.count > 1 else np.zeros_like(self.m2)
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.variance)
+
+    def to_dict(self) -> Dict:
+        return {"count": self.count, "mean": self.mean.tolist(), "m2": self.m2.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "WelfordAccumulator":
+        accumulator = cls(len(data["mean"]))
+        accumulator.count = data["count"]
+        accumulator.mean = np.asarray(data["mean"])
+        accumulator.m2 = np.asarray(data["m2"])
+        return accumulator
+
+
+class DatasetStatistics:
+    """Estadísticas de landmarks por (exercise_id, expected_phase, is_correct, error_type), según se generan"""
+
+    def __init__(self):
+        self.cells: Dict[CellKey, WelfordAccumulator] = {}
+
+    def accumulator(self, key: CellKey) -> WelfordAccumulator:
+        if key not in self.cells:
+            self.cells[key] = WelfordAccumulator()
+        return self.cells[key]
+
+    def add_sample(self, sample: Dict):
+        """Una fila de generate_sample"""
+        key = (sample['exercise_id'], sample['expected_phase'], bool(sample['is_correct']), sample['error_type'])
+        self.accumulator(key).update([sample[name] for name in COORDINATE_NAMES])
+
+    def add_batch(self, exercise_id: str, phase: str, is_correct: bool, error_type: str, landmarks: np.ndarray):
+        """Un bloque de landmarks (n, 33, 2) o (n, 66) de una sola celda"""
+        self.accumulator((exercise_id, phase, bool(is_correct), error_type)).update_batch(landmarks)
+
+    def merge(self, other: "DatasetStatistics"):
+        for key, accumulator in other.cells.items():
+            self.accumulator(key).merge(accumulator)
+
+    def combined(self, exercise_id: Optional[str] = None, phase: Optional[str] = None,
+                 is_correct: Optional[bool] = None) -> WelfordAccumulator:
+        """Estadísticas de todas las celdas que coinciden con los campos dados"""
+        total = WelfordAccumulator()
+        for (cell_exercise, cell_phase, cell_correct, _), accumulator in self.cells.items():
+            if ((exercise_id is None or cell_exercise == exercise_id) and (phase is None or cell_phase == phase)
+                    and (is_correct is None or cell_correct == is_correct)):
+                total.merge(accumulator)
+        return total
+
+    def exercise_phases(self) -> List[Tuple[str, str]]:
+        return list(dict.fromkeys((exercise_id, phase) for exercise_id, phase, _, _ in self.cells))
+
+    def separability(self, exercise_id: str, phase: str, coordinate: str = "landmark_11_y") -> float:
+        """|media(correctas) - media(incorrectas)| de una coordenada en una celda (ejercicio, fase)"""
+        index = COORDINATE_NAMES.index(coordinate)
+        correct = self.combined(exercise_id, phase, True)
+        incorrect = self.combined(exercise_id, phase, False)
+        if correct.count == 0 or incorrect.count == 0:
+            return float("nan")
+        return float(abs(correct.mean[index] - incorrect.mean[index]))
+
+    def report(self) -> Dict:
+        """Reporte para JSON: conteo, media y desviación estándar por celda y separabilidad por (ejercicio, fase)"""
+        cells = []
+        for (exercise_id, phase, is_correct, error_type), accumulator in self.cells.items():
+            cells.append({
+                "exercise_id": exercise_id,
+                "expected_phase": phase,
+                "is_correct": is_correct,
+                "error_type": error_type,
+                "count": accumulator.count,
+                "mean": dict(zip(COORDINATE_NAMES, np.round(accumulator.mean, 6).tolist())),
+                "std": dict(zip(COORDINATE_NAMES, np.round(accumulator.std, 6).tolist())),
+            })
+
+        separability = []
+        for exercise_id, phase in self.exercise_phases():
+            correct = self.combined(exercise_id, phase, True)
+            incorrect = self.combined(exercise_id, phase, False)
+            entry = {"exercise_id": exercise_id, "expected_phase": phase,
+                     "correct": correct.count, "incorrect": incorrect.count}
+            if correct.count and incorrect.count:
+                differences = np.abs(correct.mean - incorrect.mean)
+                entry["landmark_11_y_diff"] = round(self.separability(exercise_id, phase), 6)
+                entry["max_diff_coordinate"] = COORDINATE_NAMES[int(differences.argmax())]
+                entry["max_diff"] = round(float(differences.max()), 6)
+            separability.append(entry)
+
+        return {"total": sum(a.count for a in self.cells.values()), "cells": cells, "separability": separability}
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def to_dict(self) -> Dict:
+        """Forma sin pérdida (conteos, medias y M2) para combinar después"""
+        return {"cells": [{"key": list(key), **accumulator.to_dict()} for key, accumulator in self.cells.items()]}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "DatasetStatistics":
+        statistics = cls()
+        for cell in data["cells"]:
+            exercise_id, phase, is_correct, error_type = cell["key"]
+            statistics.cells[(exercise_id, phase, bool(is_correct), error_type)] = WelfordAccumulator.from_dict(cell)
+        return statistics
+
@@ -0,0 +1,96 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from dataset_stats import COORDINATE_NAMES, LANDMARK_COUNT
+
+# Incrementar al cambiar la definición de una feature, para invalidar las matrices de features en caché
+FEATURES_VERSION = 1
+
+# Mismos tripletes que landmark_mappings en Physio.Scripts/database/seeder.sql (ángulo en el landmark
+# central), más el otro lado y las articulaciones de los demás ejercicios del generador
+ANGLE_TRIPLETS: Dict[str, Tuple[int, int, int]] = {
+    "trunk": (11, 23, 25),
+    "knee": (23, 25, 27),
+    "chest_lift": (23, 11, 0),
+    "spine_curve": (23, 11, 7),
+    "trunk_right": (12, 24, 26),
+    "knee_right": (24, 26, 28),
+    "shoulder_abduction": (23, 11, 13),
+    "shoulder_abduction_right": (24, 12, 14),
+    "elbow": (11, 13, 15),
+    "elbow_right": (12, 14, 16),
+}
+
+# Desfase vertical entre dos landmarks, como los parámetros *_symmetry en tiempo de ejecución
+SYMMETRY_PAIRS: Dict[str, Tuple[int, int]] = {
+    "shoulders": (11, 12),
+    "neck_alignment": (0, 11),
+    "hips": (23, 24),
+    "wrists": (15, 16),
+    "knees": (25, 26),
+    "ankles": (27, 28),
+}
+
+# Distancias euclidianas normalizadas por la longitud del torso (centro de hombros a centro de caderas),
+# para no depender del encuadre
+DISTANCE_PAIRS: Dict[str, Tuple[int, int]] = {
+    "wrist_to_ankle": (15, 27),
+    "wrist_to_ankle_right": (16, 28),
+    "knee_to_shoulder": (25, 11),
+    "knee_to_shoulder_right": (26, 12),
+    "ankle_to_hip": (27, 23),
+    "ankle_to_hip_right": (28, 24),
+}
+
+FEATURE_NAMES: List[str] = (
+    [f"{name}_angle" for name in ANGLE_TRIPLETS]
+    + [f"{name}_symmetry" for name in SYMMETRY_PAIRS]
+    + [f"{name}_distance" for name in DISTANCE_PAIRS]
+)
+
+TRIPLETS = np.array(list(ANGLE_TRIPLETS.values()), dtype=np.intp)
+SYMMETRIES = np.array(list(SYMMETRY_PAIRS.values()), dtype=np.intp)
+DISTANCES = np.array(list(DISTANCE_PAIRS.values()), dtype=np.intp)
+
+
+def joint_angles(landmarks: np.ndarray, triplets: np.ndarray) -> np.ndarray:
+    """Ángulo en grados en el landmark central de cada triplete, igual que lo calcula el validador del Processor"""
+    a = landmarks[..., triplets[:, 0], :2]
+    b = landmarks[..., triplets[:, 1], :2]
+    c = landmarks[..., triplets[:, 2], :2]
+    ba = a - b
+    bc = c - b
+    cross = ba[..., 0] * bc[..., 1] - ba[..., 1] * bc[..., 0]
+    dot = (ba * bc).sum(axis=-1)
+    return np.degrees(np.abs(np.arctan2(cross, dot)))
+
+
+def pair_asymmetry(landmarks: np.ndarray, pairs: np.ndarray) -> np.ndarray:
+    """Desfase vertical entre los dos landmarks de cada par"""
+    return np.abs(landmarks[..., pairs[:, 0], 1] - landmarks[..., pairs[:, 1], 1])
+
+
+def pair_distances(landmarks: np.ndarray, pairs: np.ndarray) -> np.ndarray:
+    """Distancia entre los dos landmarks de cada par, en longitudes de torso"""
+    torso = np.linalg.norm(landmarks[..., [11, 12], :2].mean(axis=-2) - landmarks[..., [23, 24], :2].mean(axis=-2),
+                           axis=-1)
+    distances = np.linalg.norm(landmarks[..., pairs[:, 0], :2] - landmarks[..., pairs[:, 1], :2], axis=-1)
+    return distances / np.maximum(torso, 1e-6)[..., None]
+
+
+def compute_features(landmarks: np.ndarray) -> np.ndarray:
+    """Features float32 (..., len(FEATURE_NAMES)) de landmarks (..., 33, 2), en el orden de FEATURE_NAMES"""
+    landmarks = np.asarray(landmarks, dtype=np.float32)
+    return np.concatenate(
+        (joint_angles(landmarks, TRIPLETS), pair_asymmetry(landmarks, SYMMETRIES), pair_distances(landmarks, DISTANCES)),
+        axis=-1,
+    ).astype(np.float32)
+
+
+def add_feature_columns(df, keep_landmarks: bool = True):
+    """DataFrame con las columnas de features añadidas (o reemplazando las columnas landmark_*)"""
+    landmarks = df[COORDINATE_NAMES].to_numpy(dtype=np.float32).reshape(len(df), LANDMARK_COUNT, 2)
+    features = compute_features(landmarks).round(4)
+    base = df if keep_landmarks else df.drop(columns=COORDINATE_NAMES)
+    return base.assign(**dict(zip(FEATURE_NAMES, features.T)))
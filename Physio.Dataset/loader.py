@@ -0,0 +1,194 @@
+import multiprocessing
+import queue
+import random
+from itertools import product
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app import HybridPhysioDatasetGenerator
+from augmentation import LandmarkAugmenter
+from features import compute_features
+
+LANDMARK_COUNT = 33
+
+
+def label_vocabularies(generator: HybridPhysioDatasetGenerator) -> Dict[str, List[str]]:
+    """Tablas etiqueta → índice para las etiquetas de los batches codificadas como enteros"""
+    phases: List[str] = []
+    for exercise_info in generator.exercise_definitions.values():
+        phases.extend(phase for phase in exercise_info['phases'] if phase not in phases)
+    return {
+        'exercise_id': list(generator.exercise_definitions),
+        'expected_phase': phases,
+        'error_type': ["NONE"] + generator.error_types,
+    }
+
+
+def strata(generator: HybridPhysioDatasetGenerator,
+           exercise_ids: Optional[List[str]] = None) -> List[Tuple[str, str, bool]]:
+    """Todas las combinaciones (exercise_id, expected_phase, is_correct), opcionalmente solo de algunos ejercicios"""
+    return [
+        (exercise_id, phase, is_correct)
+        for exercise_id, exercise_info in generator.exercise_definitions.items()
+        if exercise_ids is None or exercise_id in exercise_ids
+        for phase, is_correct in product(exercise_info['phases'], (True, False))
+    ]
+
+
+def generate_batch(generator: HybridPhysioDatasetGenerator, batch_size: int, rng: np.random.Generator,
+                   augmenter: Optional[LandmarkAugmenter] = None, features: bool = False,
+                   exercise_ids: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+    """Un minibatch estratificado: cada estrato recibe batch_size // len(strata) muestras y
+    el resto va a estratos elegidos al azar.
+
+    Los landmarks son (batch_size, 33, 2) float32; reshape(batch_size, -1) da el orden de
+    columnas del CSV. Augmentation y ruido se aplican a todo el batch de una vez.
+    features añade la matriz 'features' (batch_size, len(FEATURE_NAMES)) de los
+    landmarks finales. exercise_ids limita el batch a esos ejercicios.
+    """
+    combinations = strata(generator, exercise_ids)
+    vocabularies = label_vocabularies(generator)
+    indices = {name: {label: i for i, label in enumerate(labels)} for name, labels in vocabularies.items()}
+
+    counts = np.full(len(combinations), batch_size // len(combinations))
+    counts[rng.choice(len(combinations), batch_size % len(combinations), replace=False)] += 1
+
+    landmarks = []
+    labels = []
+    for (exercise_id, phase, is_correct), count in zip(combinations, counts):
+        for _ in range(count):
+            sample_landmarks, error_type = generator.generate_landmarks(exercise_id, phase, is_correct)
+            landmarks.append(sample_landmarks)
+            labels.append((indices['exercise_id'][exercise_id], indices['expected_phase'][phase],
+                           int(is_correct), indices['error_type'][error_type]))
+
+    order = rng.permutation(batch_size)
+    landmarks = np.asarray(landmarks, dtype=np.float32)[order].reshape(batch_size, LANDMARK_COUNT, 2)
+    if augmenter is not None:
+        landmarks = augmenter(landmarks, rng)
+    landmarks += rng.normal(0, generator.noise_std, landmarks.shape).astype(np.float32)
+    labels = np.asarray(labels, dtype=np.int64)[order]
+
+    batch = {
+        'landmarks': np.ascontiguousarray(landmarks),
+        'exercise_id': np.ascontiguousarray(labels[:, 0]),
+        'expected_phase': np.ascontiguousarray(labels[:, 1]),
+        'is_correct': np.ascontiguousarray(labels[:, 2]),
+        'error_type': np.ascontiguousarray(labels[:, 3]),
+    }
+    if features:
+        batch['features'] = compute_features(landmarks)
+    return batch
+
+
+def _worker(batches: multiprocessing.Queue, batch_size: int, seed: Optional[int],
+            augmenter: Optional[LandmarkAugmenter], features: bool, exercise_ids: Optional[List[str]]):
+    # Los workers creados con fork heredan el estado aleatorio del padre: resembrar para no repetir batches
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
+    generator = HybridPhysioDatasetGenerator()
+    while True:
+        batches.put(generate_batch(generator, batch_size, rng, augmenter, features, exercise_ids))
+
+
+class StreamingBatchLoader:
+    """Minibatches estratificados infinitos directamente de HybridPhysioDatasetGenerator, sin pasar por CSV.
+
+    Los batches los generan num_workers procesos en segundo plano, con hasta
+    prefetch batches por worker en cola. num_workers=0 genera en el proceso que
+    itera. Un augmenter (augmentation.LandmarkAugmenter) añade variación
+    geométrica a cada batch. features añade la matriz de features biomecánicas
+    (features.FEATURE_NAMES) a cada batch. exercise_ids limita los batches a
+    esos ejercicios.
+    """
+
+    def __init__(self, batch_size: int = 500, num_workers: int = 2, prefetch: int = 4,
+                 seed: Optional[int] = None, augmenter: Optional[LandmarkAugmenter] = None,
+                 features: bool = False, exercise_ids: Optional[List[str]] = None):
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.prefetch = prefetch
+        self.seed = seed
+        self.augmenter = augmenter
+        self.features = features
+        self.exercise_ids = exercise_ids
+        self.generator = HybridPhysioDatasetGenerator()
+        self.vocabularies = label_vocabularies(self.generator)
+        self.workers: List[multiprocessing.Process] = []
+        self.batches: Optional[multiprocessing.Queue] = None
+
+    def start(self):
+        if self.workers or self.num_workers == 0:
+            return
+        self.batches = multiprocessing.Queue(self.prefetch * self.num_workers)
+        for worker_id in range(self.num_workers):
+            worker_seed = None if self.seed is None else self.seed + worker_id
+            worker = multiprocessing.Process(
+                target=_worker, args=(self.batches, self.batch_size, worker_seed, self.augmenter, self.features,
+                                      self.exercise_ids),
+                daemon=True
+            )
+            worker.start()
+            self.workers.append(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.terminate()
+            worker.join()
+        self.workers = []
+        if self.batches is not None:
+            self.batches.close()
+            self.batches = None
+
+    def __iter__(self) -> Iterator[Dict[str, np.ndarray]]:
+        if self.num_workers == 0:
+            random.seed(self.seed)
+            rng = np.random.default_rng(self.seed)
+            while True:
+                yield generate_batch(self.generator, self.batch_size, rng, self.augmenter, self.features,
+                                     self.exercise_ids)
+
+        self.start()
+        while True:
+            try:
+                yield self.batches.get(timeout=60)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in self.workers):
+                    raise RuntimeError("Todos los workers de batches terminaron")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def torch_dataset(self):
+        """El loader como IterableDataset de torch que entrega tensores; usar con DataLoader(batch_size=None)"""
+        import torch  # type: ignore
+        from torch.utils.data import IterableDataset  # type: ignore
+
+        loader = self
+
+        class GeneratedBatches(IterableDataset):
+            def __iter__(self):
+                for batch in loader:
+                    yield {name: torch.from_numpy(values) for name, values in batch.items()}
+
+        return GeneratedBatches()
+
+
+if __name__ == "__main__":
+    import time
+
+    with StreamingBatchLoader(batch_size=500, num_workers=2, seed=42, augmenter=LandmarkAugmenter()) as loader:
+        start = time.perf_counter()
+        for count, batch in enumerate(loader, 1):
+            if count == 100:
+                break
+        elapsed = time.perf_counter() - start
+
+    print(f"{count} batches de {loader.batch_size} en {elapsed:.2f}s "
+          f"({count * loader.batch_size / elapsed:,.0f} muestras/s)")
+    print({name: (values.shape, values.dtype) for name, values in batch.items()})
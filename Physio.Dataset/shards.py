@@ -0,0 +1,350 @@
+import argparse
+import bisect
+import hashlib
+import json
+import os
+import random
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app import GENERATOR_VERSION, HybridPhysioDatasetGenerator
+from dataset_stats import DatasetStatistics, WelfordAccumulator
+from features import FEATURE_NAMES, FEATURES_VERSION, compute_features
+from loader import LANDMARK_COUNT, label_vocabularies
+
+MANIFEST = "manifest.json"
+STATISTICS = "stats.json"
+FORMAT_VERSION = 2
+# Archivos de celda direccionados por contenido, nombrados por cell_key
+CELL_DIR = "cells"
+
+# Una fila por muestra; las etiquetas son índices en los vocabularios del manifest
+RECORD_DTYPE = np.dtype([
+    ('landmarks', '<f4', (LANDMARK_COUNT, 2)),
+    ('is_correct', 'u1'),
+    ('error_type', 'u1'),
+])
+
+
+def cell_counts(generator: HybridPhysioDatasetGenerator, samples: int, error_rate: float) -> Dict[str, int]:
+    """Filas por error_type en una celda (exercise_id, expected_phase); las incorrectas se reparten por igual"""
+    incorrect_count = int(samples * error_rate)
+    per_error, remainder = divmod(incorrect_count, len(generator.error_types))
+    counts = {"NONE": samples - incorrect_count}
+    for index, error_type in enumerate(generator.error_types):
+        counts[error_type] = per_error + (index < remainder)
+    return counts
+
+
+def cell_key(generator: HybridPhysioDatasetGenerator, exercise_id: str, phase: str, error_type: str,
+             seed: int) -> str:
+    """Hash de todo aquello de lo que depende el contenido de una celda.
+
+    La lógica de ejercicio/fase/error es código, así que entra en el hash a través de
+    una muestra de referencia generada con un estado aleatorio fijo: editar los landmarks
+    de una fase o los desplazamientos de un error solo cambia las claves de las celdas afectadas.
+    """
+    state = random.getstate()
+    random.seed(0)
+    try:
+        reference, _ = generator.generate_landmarks(exercise_id, phase, error_type == "NONE", error_type)
+    finally:
+        random.setstate(state)
+    definition = {
+        "exercise_id": exercise_id,
+        "expected_phase": phase,
+        "error_type": error_type,
+        "seed": seed,
+        "generator_version": GENERATOR_VERSION,
+        "noise_std": generator.noise_std,
+        "reference": [round(value, 6) for value in reference],
+    }
+    return hashlib.sha256(json.dumps(definition, sort_keys=True).encode()).hexdigest()[:24]
+
+
+def cell_seed(seed: int, exercise_id: str, phase: str, error_type: str) -> int:
+    """Secuencia aleatoria independiente por celda: sus filas nunca dependen de qué otras celdas existen"""
+    digest = hashlib.sha256(f"{seed}/{exercise_id}/{phase}/{error_type}".encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def generate_cell(generator: HybridPhysioDatasetGenerator, exercise_id: str, phase: str, error_type: str,
+                  rows: int, seed: int) -> np.ndarray:
+    """Registros de una celda (exercise_id, expected_phase, error_type).
+
+    Las filas salen una tras otra de la secuencia propia de la celda, así que las primeras k
+    son las mismas sea cual sea el total: una celda cacheada sirve para cualquier cantidad menor.
+    """
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
+    is_correct = error_type == "NONE"
+    landmarks = [generator.generate_landmarks(exercise_id, phase, is_correct, error_type)[0] for _ in range(rows)]
+
+    records = np.empty(rows, dtype=RECORD_DTYPE)
+    records['is_correct'] = is_correct
+    records['error_type'] = label_vocabularies(generator)['error_type'].index(error_type)
+    records['landmarks'] = np.asarray(landmarks, dtype=np.float32).reshape(rows, LANDMARK_COUNT, 2)
+    records['landmarks'] += rng.normal(0, generator.noise_std, records['landmarks'].shape).astype(np.float32)
+    return records
+
+
+def cached_rows(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    return len(np.load(path, mmap_mode="r"))
+
+
+def cell_statistics(output_dir: str, key: str, rows: int, records: Optional[np.ndarray] = None) -> WelfordAccumulator:
+    """Estadísticas de landmarks de las primeras rows filas de un archivo de celda.
+
+    Junto a cada celda completa se escribe un <key>.stats.json, así que las celdas
+    reutilizadas no se recorren; solo se lee una celda usada como prefijo.
+    """
+    sidecar = os.path.join(output_dir, CELL_DIR, f"{key}.stats.json")
+    if records is None and os.path.exists(sidecar):
+        with open(sidecar) as f:
+            data = json.load(f)
+        if data["count"] == rows:
+            return WelfordAccumulator.from_dict(data)
+    if records is None:
+        records = np.load(os.path.join(output_dir, CELL_DIR, f"{key}.npy"), mmap_mode="r")
+    accumulator = WelfordAccumulator()
+    accumulator.update_batch(records['landmarks'][:rows])
+    if len(records) == rows:
+        with open(sidecar, "w") as f:
+            json.dump(accumulator.to_dict(), f)
+    return accumulator
+
+
+def features_path(key: str) -> str:
+    return os.path.join(CELL_DIR, f"{key}.features-v{FEATURES_VERSION}.npy")
+
+
+def cell_features(output_dir: str, key: str, records: Optional[np.ndarray] = None) -> np.ndarray:
+    """Matriz de features (rows, len(FEATURE_NAMES)) de un archivo de celda completo, mapeada en memoria.
+
+    Se calcula una vez y se cachea en un archivo junto a la celda; si ya no coincide
+    con la longitud de su celda (la celda creció) se recalcula.
+    """
+    path = os.path.join(output_dir, features_path(key))
+    if records is None:
+        records = np.load(os.path.join(output_dir, CELL_DIR, f"{key}.npy"), mmap_mode="r")
+        if os.path.exists(path):
+            cached = np.load(path, mmap_mode="r")
+            if len(cached) == len(records):
+                return cached
+    temporary = f"{path}.tmp.npy"
+    np.save(temporary, compute_features(records['landmarks']))
+    os.replace(temporary, path)
+    return np.load(path, mmap_mode="r")
+
+
+def write_sharded_dataset(output_dir: str, samples_per_exercise_phase: int = 300, error_rate: float = 0.35,
+                          seed: int = 42, generator: Optional[HybridPhysioDatasetGenerator] = None,
+                          prune: bool = False, features: bool = False) -> str:
+    """Genera el dataset híbrido como celdas direccionadas por contenido más un manifest que las
+    agrupa por (exercise_id, expected_phase).
+
+    Solo se generan las celdas cuya clave falta en output_dir/cells (o que tienen menos filas
+    de las necesarias); todo lo demás se reutiliza. Las estadísticas de landmarks por celda
+    se combinan en output_dir/stats.json. features precalcula las matrices de features
+    (si no, ShardedDataset las crea en el primer uso). prune borra los archivos de celda
+    que el nuevo manifest ya no referencia.
+    """
+    generator = generator or HybridPhysioDatasetGenerator()
+    os.makedirs(os.path.join(output_dir, CELL_DIR), exist_ok=True)
+    counts = cell_counts(generator, samples_per_exercise_phase, error_rate)
+
+    cells = []
+    generated = 0
+    statistics = DatasetStatistics()
+    for exercise_id, exercise_info in generator.exercise_definitions.items():
+        for phase in exercise_info['phases']:
+            shards = []
+            offset = 0
+            for error_type, rows in counts.items():
+                if rows == 0:
+                    continue
+                key = cell_key(generator, exercise_id, phase, error_type, seed)
+                path = os.path.join(CELL_DIR, f"{key}.npy")
+                records = None
+                if cached_rows(os.path.join(output_dir, path)) < rows:
+                    records = generate_cell(generator, exercise_id, phase, error_type, rows,
+                                            cell_seed(seed, exercise_id, phase, error_type))
+                    temporary = os.path.join(output_dir, f"{path}.tmp.npy")
+                    np.save(temporary, records)
+                    os.replace(temporary, os.path.join(output_dir, path))
+                    generated += 1
+                if features:
+                    cell_features(output_dir, key, records)
+                statistics.accumulator((exercise_id, phase, error_type == "NONE", error_type)).merge(
+                    cell_statistics(output_dir, key, rows, records)
+                )
+                shards.append({"path": path, "offset": offset, "rows": rows, "error_type": error_type, "key": key})
+                offset += rows
+            cells.append({"exercise_id": exercise_id, "expected_phase": phase, "rows": offset, "shards": shards})
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "generator_version": GENERATOR_VERSION,
+        "vocabularies": label_vocabularies(generator),
+        "samples_per_exercise_phase": samples_per_exercise_phase,
+        "error_rate": error_rate,
+        "seed": seed,
+        "features": FEATURE_NAMES,
+        "features_version": FEATURES_VERSION,
+        "cells": cells,
+    }
+    manifest_path = os.path.join(output_dir, MANIFEST)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    statistics.save(os.path.join(output_dir, STATISTICS))
+
+    total = sum(len(cell["shards"]) for cell in cells)
+    print(f"   🔄 Celdas generadas: {generated} de {total} ({total - generated} reutilizadas)")
+
+    if prune:
+        referenced = {shard["key"] for cell in cells for shard in cell["shards"]}
+        for name in os.listdir(os.path.join(output_dir, CELL_DIR)):
+            stale_features = ".features-v" in name and not name.endswith(f".features-v{FEATURES_VERSION}.npy")
+            if name.split(".")[0] not in referenced or stale_features:
+                os.remove(os.path.join(output_dir, CELL_DIR, name))
+    return manifest_path
+
+
+class ShardedDataset:
+    """Acceso aleatorio a un dataset particionado por (exercise_id, expected_phase).
+
+    Los shards se mapean en memoria en el primer uso, así que solo se leen del disco las
+    celdas que se tocan. Un shard puede usar solo las primeras filas de su archivo de celda.
+    Las filas se localizan con los offsets del manifest en O(log shards por celda).
+    La matriz de features de una celda (columnas de features.FEATURE_NAMES) sale de los
+    archivos cacheados, creados en el primer uso.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Formato de dataset no soportado: {self.manifest.get('format')}")
+        self.vocabularies: Dict[str, List[str]] = self.manifest["vocabularies"]
+        self.index: Dict[Tuple[str, str], Dict] = {
+            (cell["exercise_id"], cell["expected_phase"]): cell for cell in self.manifest["cells"]
+        }
+        self.maps: Dict[str, np.ndarray] = {}
+        self.feature_maps: Dict[str, np.ndarray] = {}
+
+    def cells(self) -> List[Tuple[str, str]]:
+        return list(self.index)
+
+    def rows(self, exercise_id: str, phase: str) -> int:
+        return self.index[(exercise_id, phase)]["rows"]
+
+    def shard(self, path: str) -> np.ndarray:
+        if path not in self.maps:
+            self.maps[path] = np.load(os.path.join(self.path, path), mmap_mode="r")
+        return self.maps[path]
+
+    def shards(self, exercise_id: str, phase: str) -> Iterator[np.ndarray]:
+        for entry in self.index[(exercise_id, phase)]["shards"]:
+            yield self.shard(entry["path"])[:entry["rows"]]
+
+    def feature_shard(self, key: str) -> np.ndarray:
+        if key not in self.feature_maps:
+            self.feature_maps[key] = cell_features(self.path, key)
+        return self.feature_maps[key]
+
+    def features(self, exercise_id: str, phase: str) -> np.ndarray:
+        """Matriz de features float32 (rows, len(FEATURE_NAMES)) de una celda, en orden de filas"""
+        return np.concatenate([self.feature_shard(entry["key"])[:entry["rows"]]
+                               for entry in self.index[(exercise_id, phase)]["shards"]])
+
+    def read_cell(self, exercise_id: str, phase: str) -> np.ndarray:
+        """Todos los registros de una celda, sin leer nada más"""
+        return np.concatenate(list(self.shards(exercise_id, phase)))
+
+    def locate(self, exercise_id: str, phase: str, rows: np.ndarray) -> Iterator[Tuple[Dict, np.ndarray]]:
+        """(entrada del shard, máscara de las filas que contiene) por cada shard que tocan las filas dadas"""
+        cell = self.index[(exercise_id, phase)]
+        offsets = [entry["offset"] for entry in cell["shards"]]
+        shard_indices = np.searchsorted(offsets, rows, side="right") - 1
+        for shard_index in np.unique(shard_indices):
+            yield cell["shards"][shard_index], shard_indices == shard_index
+
+    def take(self, exercise_id: str, phase: str, rows: np.ndarray) -> np.ndarray:
+        """Registros de una celda en los números de fila dados"""
+        records = np.empty(len(rows), dtype=RECORD_DTYPE)
+        for entry, selected in self.locate(exercise_id, phase, rows):
+            records[selected] = self.shard(entry["path"])[rows[selected] - entry["offset"]]
+        return records
+
+    def take_features(self, exercise_id: str, phase: str, rows: np.ndarray) -> np.ndarray:
+        """Filas de features de una celda en los números de fila dados"""
+        features = np.empty((len(rows), len(FEATURE_NAMES)), dtype=np.float32)
+        for entry, selected in self.locate(exercise_id, phase, rows):
+            features[selected] = self.feature_shard(entry["key"])[rows[selected] - entry["offset"]]
+        return features
+
+    def get(self, exercise_id: str, phase: str, row: int) -> np.void:
+        cell = self.index[(exercise_id, phase)]
+        entry = cell["shards"][bisect.bisect_right([s["offset"] for s in cell["shards"]], row) - 1]
+        return self.shard(entry["path"])[row - entry["offset"]]
+
+    def sample(self, batch_size: int, rng: np.random.Generator,
+               cells: Optional[List[Tuple[str, str]]] = None, features: bool = False) -> Dict[str, np.ndarray]:
+        """Un minibatch muestreado uniformemente entre celdas y luego dentro de cada una, como los batches del loader.
+
+        features añade la matriz 'features' (batch_size, len(FEATURE_NAMES)) cacheada.
+        """
+        cells = cells or self.cells()
+        counts = np.bincount(rng.integers(len(cells), size=batch_size), minlength=len(cells))
+        exercise_indices = {label: i for i, label in enumerate(self.vocabularies['exercise_id'])}
+        phase_indices = {label: i for i, label in enumerate(self.vocabularies['expected_phase'])}
+
+        parts = []
+        feature_parts = []
+        exercise_labels = []
+        phase_labels = []
+        for (exercise_id, phase), count in zip(cells, counts):
+            if count:
+                rows = rng.integers(self.rows(exercise_id, phase), size=count)
+                parts.append(self.take(exercise_id, phase, rows))
+                if features:
+                    feature_parts.append(self.take_features(exercise_id, phase, rows))
+                exercise_labels.append(np.full(count, exercise_indices[exercise_id], dtype=np.int64))
+                phase_labels.append(np.full(count, phase_indices[phase], dtype=np.int64))
+
+        order = rng.permutation(batch_size)
+        records = np.concatenate(parts)[order]
+        batch = {
+            'landmarks': np.ascontiguousarray(records['landmarks']),
+            'exercise_id': np.concatenate(exercise_labels)[order],
+            'expected_phase': np.concatenate(phase_labels)[order],
+            'is_correct': records['is_correct'].astype(np.int64),
+            'error_type': records['error_type'].astype(np.int64),
+        }
+        if features:
+            batch['features'] = np.concatenate(feature_parts)[order]
+        return batch
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dataset híbrido en shards cacheados por (ejercicio, fase)")
+    parser.add_argument("output_dir", help="Directorio del dataset")
+    parser.add_argument("--samples", type=int, default=300, help="Muestras por (ejercicio × fase)")
+    parser.add_argument("--error-rate", type=float, default=0.35, help="Fracción de muestras incorrectas")
+    parser.add_argument("--seed", type=int, default=42, help="Semilla del dataset; forma parte de cada clave de celda")
+    parser.add_argument("--prune", action="store_true", help="Borra los archivos de celda que el manifest ya no usa")
+    parser.add_argument("--features", action="store_true", help="Precalcula las matrices de features biomecánicas")
+
+    args = parser.parse_args()
+
+    manifest_path = write_sharded_dataset(args.output_dir, args.samples, args.error_rate, args.seed,
+                                          prune=args.prune, features=args.features)
+    dataset = ShardedDataset(args.output_dir)
+    print(f"💾 DATASET GUARDADO: {manifest_path}")
+    print(f"   📋 Celdas (ejercicio×fase): {len(dataset.cells())}")
+    print(f"   📊 Total muestras: {sum(dataset.rows(*cell) for cell in dataset.cells()):,}")
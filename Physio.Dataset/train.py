@@ -0,0 +1,315 @@
+import argparse
+import json
+import os
+import pickle
+import time
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app import HybridPhysioDatasetGenerator
+from dataset_stats import WelfordAccumulator
+from features import ANGLE_TRIPLETS, DISTANCE_PAIRS, SYMMETRY_PAIRS
+from loader import StreamingBatchLoader, label_vocabularies
+from shards import ShardedDataset
+
+TARGETS = ("is_correct", "error_type")
+INPUT_BLOCKS = ("phase", "landmarks", "features")
+CHECKPOINT = "checkpoint.npz"
+
+
+class InputEncoder:
+    """Batches del loader/shards → entradas del modelo (N, num_inputs) de un ejercicio.
+
+    Los bloques siguen el formato de bundle del clasificador del Processor (app/classifier.py):
+    un one-hot de las fases del ejercicio, las 66 coordenadas en el orden del CSV y las
+    columnas de features.FEATURE_NAMES.
+    """
+
+    def __init__(self, vocabularies: Dict[str, List[str]], phases: List[str], inputs: List[str]):
+        unknown = set(inputs) - set(INPUT_BLOCKS)
+        if unknown:
+            raise ValueError(f"Bloques de entrada desconocidos: {sorted(unknown)}")
+        self.inputs = inputs
+        self.phases = phases
+        # Índice de fase del dataset → posición en el one-hot de este ejercicio
+        self.phase_column = np.array([phases.index(p) if p in phases else -1
+                                      for p in vocabularies['expected_phase']])
+
+    def __call__(self, batch: Dict[str, np.ndarray]) -> np.ndarray:
+        blocks = []
+        for block in self.inputs:
+            if block == "phase":
+                one_hot = np.zeros((len(batch['landmarks']), len(self.phases)), dtype=np.float32)
+                columns = self.phase_column[batch['expected_phase']]
+                rows = np.flatnonzero(columns >= 0)
+                one_hot[rows, columns[rows]] = 1.0
+                blocks.append(one_hot)
+            elif block == "landmarks":
+                blocks.append(batch['landmarks'].reshape(len(batch['landmarks']), -1))
+            else:
+                blocks.append(batch['features'])
+        return np.concatenate(blocks, axis=1).astype(np.float32, copy=False)
+
+
+class SoftmaxRegression:
+    """Regresión logística multinomial entrenada con SGD por minibatches con momentum, en NumPy.
+
+    Las entradas se estandarizan con una media/escala ajustada en los primeros batches
+    (fit_scaler); export() incorpora el escalado a los pesos.
+    """
+
+    def __init__(self, num_inputs: int, num_classes: int, learning_rate: float = 0.05, momentum: float = 0.9,
+                 l2: float = 1e-4):
+        self.learning_rate = learning_rate
+        self.momentum = momentum
+        self.l2 = l2
+        self.weights = np.zeros((num_inputs, num_classes))
+        self.bias = np.zeros(num_classes)
+        self.weights_velocity = np.zeros_like(self.weights)
+        self.bias_velocity = np.zeros_like(self.bias)
+        self.mean = np.zeros(num_inputs)
+        self.scale = np.ones(num_inputs)
+
+    def fit_scaler(self, accumulator: WelfordAccumulator):
+        self.mean = accumulator.mean.copy()
+        # Las entradas constantes (p. ej. una columna de fase sin uso) mantienen escala 1
+        self.scale = np.where(accumulator.std > 1e-8, accumulator.std, 1.0)
+
+    def scores(self, inputs: np.ndarray) -> np.ndarray:
+        return ((inputs - self.mean) / self.scale) @ self.weights + self.bias
+
+    def predict_proba(self, inputs: np.ndarray) -> np.ndarray:
+        scores = self.scores(inputs)
+        scores -= scores.max(axis=1, keepdims=True)
+        probabilities = np.exp(scores)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def partial_fit(self, inputs: np.ndarray, labels: np.ndarray) -> float:
+        """Un paso de SGD sobre un minibatch; devuelve su entropía cruzada antes del paso"""
+        scaled = (inputs - self.mean) / self.scale
+        probabilities = self.predict_proba(inputs)
+        loss = float(-np.log(np.maximum(probabilities[np.arange(len(labels)), labels], 1e-12)).mean())
+
+        probabilities[np.arange(len(labels)), labels] -= 1.0
+        probabilities /= len(labels)
+        weights_gradient = scaled.T @ probabilities + self.l2 * self.weights
+        bias_gradient = probabilities.sum(axis=0)
+
+        self.weights_velocity *= self.momentum
+        self.weights_velocity -= self.learning_rate * weights_gradient
+        self.bias_velocity *= self.momentum
+        self.bias_velocity -= self.learning_rate * bias_gradient
+        self.weights += self.weights_velocity
+        self.bias += self.bias_velocity
+        return loss
+
+    def export(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(coef (num_classes, num_inputs), intercept) sobre entradas sin escalar"""
+        coef = (self.weights / self.scale[:, None]).T
+        return coef, self.bias - coef @ self.mean
+
+    STATE = ("weights", "bias", "weights_velocity", "bias_velocity", "mean", "scale")
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self.STATE}
+
+    def load_state(self, state):
+        for name in self.STATE:
+            setattr(self, name, np.array(state[name]))
+
+
+def target_classes(vocabularies: Dict[str, List[str]], target: str) -> List:
+    """Clase de cada columna de salida, numerada como las etiquetas de los batches del loader"""
+    return [False, True] if target == "is_correct" else vocabularies['error_type']
+
+
+def batch_stream(exercise_id: str, batch_size: int, seed: int, num_workers: int,
+                 shards_dir: Optional[str] = None) -> Iterator[Dict[str, np.ndarray]]:
+    """Batches de entrenamiento de un ejercicio, del generador o de un dataset particionado en disco"""
+    if shards_dir is None:
+        with StreamingBatchLoader(batch_size, num_workers=num_workers, seed=seed, features=True,
+                                  exercise_ids=[exercise_id]) as loader:
+            yield from loader
+        return
+
+    dataset = ShardedDataset(shards_dir)
+    cells = [cell for cell in dataset.cells() if cell[0] == exercise_id]
+    if not cells:
+        raise ValueError(f"{exercise_id} no está en {shards_dir}")
+    rng = np.random.default_rng(seed)
+    while True:
+        yield dataset.sample(batch_size, rng, cells, features=True)
+
+
+def held_out_set(exercise_id: str, samples: int, batch_size: int, seed: int) -> Dict[str, np.ndarray]:
+    """Conjunto de evaluación fijo sacado de su propia secuencia del generador con semilla"""
+    loader = StreamingBatchLoader(batch_size, num_workers=0, seed=seed, features=True, exercise_ids=[exercise_id])
+    batches = list(islice(loader, -(-samples // batch_size)))
+    return {name: np.concatenate([batch[name] for batch in batches])[:samples] for name in batches[0]}
+
+
+def evaluate(model: SoftmaxRegression, inputs: np.ndarray, labels: np.ndarray) -> Dict[str, float]:
+    probabilities = model.predict_proba(inputs)
+    predicted = probabilities.argmax(axis=1)
+    recalls = [np.mean(predicted[labels == c] == c) for c in np.unique(labels)]
+    return {
+        "accuracy": float(np.mean(predicted == labels)),
+        "balanced_accuracy": float(np.mean(recalls)),
+        "log_loss": float(-np.log(np.maximum(probabilities[np.arange(len(labels)), labels], 1e-12)).mean()),
+    }
+
+
+def save_checkpoint(path: str, model: SoftmaxRegression, step: int, config: Dict):
+    temporary = f"{path}.tmp.npz"
+    np.savez(temporary, step=step, config=json.dumps(config), **model.state())
+    os.replace(temporary, path)
+
+
+def export_bundle(path: str, model: SoftmaxRegression, classes: List, encoder: InputEncoder,
+                  phase_names: Optional[List[str]] = None):
+    """Escribe un bundle de clasificador del Processor (MODELS_DIR/<exercise_id>/<version>/<target>.pkl).
+
+    El bundle solo contiene arrays y listas, así que servirlo no necesita ni este
+    módulo ni scikit-learn. phase_names renombra las columnas del one-hot a las
+    fases de las reglas del ejercicio (en el orden de fases del dataset).
+    """
+    coef, intercept = model.export()
+    bundle = {
+        "linear": {"coef": coef, "intercept": intercept, "softmax": True},
+        "classes": classes,
+        "inputs": encoder.inputs,
+        "phases": phase_names or encoder.phases,
+        "features": {
+            "angle_triplets": [list(triplet) for triplet in ANGLE_TRIPLETS.values()],
+            "symmetry_pairs": [list(pair) for pair in SYMMETRY_PAIRS.values()],
+            "distance_pairs": [list(pair) for pair in DISTANCE_PAIRS.values()],
+        },
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        pickle.dump(bundle, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, path)
+
+
+def train(exercise_id: str, target: str = "is_correct", inputs: Optional[List[str]] = None, steps: int = 2000,
+          batch_size: int = 512, learning_rate: float = 0.05, momentum: float = 0.9, l2: float = 1e-4,
+          scaler_batches: int = 10, seed: int = 42, eval_seed: int = 10_042, eval_samples: int = 5000,
+          eval_every: int = 200, checkpoint_dir: Optional[str] = None, checkpoint_every: int = 500,
+          resume: bool = False, num_workers: int = 2,
+          shards_dir: Optional[str] = None) -> Tuple[SoftmaxRegression, InputEncoder, Dict]:
+    """Entrena el clasificador de un ejercicio con un flujo infinito de batches; en memoria solo hay un batch
+    y el conjunto held-out.
+
+    El escalado se ajusta con los primeros scaler_batches batches. Cada eval_every
+    pasos el modelo se evalúa en un flujo held-out con semilla eval_seed, y cada
+    checkpoint_every pasos su estado se guarda en checkpoint_dir; resume continúa
+    desde ahí (con un flujo nuevo de semilla seed + step, para no repetir batches).
+    """
+    generator = HybridPhysioDatasetGenerator()
+    if exercise_id not in generator.exercise_definitions:
+        raise ValueError(f"Ejercicio desconocido: {exercise_id}")
+    if target not in TARGETS:
+        raise ValueError(f"Objetivo desconocido: {target}")
+    vocabularies = label_vocabularies(generator)
+    classes = target_classes(vocabularies, target)
+    encoder = InputEncoder(vocabularies, generator.exercise_definitions[exercise_id]['phases'],
+                           inputs or ["phase", "features"])
+    config = {"exercise_id": exercise_id, "target": target, "inputs": encoder.inputs, "classes": classes}
+
+    held_out = held_out_set(exercise_id, eval_samples, batch_size, eval_seed)
+    held_out_inputs, held_out_labels = encoder(held_out), held_out[target]
+    model = SoftmaxRegression(held_out_inputs.shape[1], len(classes), learning_rate, momentum, l2)
+
+    step = 0
+    checkpoint = os.path.join(checkpoint_dir, CHECKPOINT) if checkpoint_dir else None
+    if resume and checkpoint and os.path.exists(checkpoint):
+        state = np.load(checkpoint)
+        if json.loads(str(state["config"])) != config:
+            raise ValueError(f"{checkpoint} se entrenó con otra configuración")
+        model.load_state(state)
+        step = int(state["step"])
+        print(f"   ↩️ Reanudando desde el paso {step}")
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    stream = batch_stream(exercise_id, batch_size, seed + step, num_workers, shards_dir)
+    warmup = []
+    if step == 0:
+        accumulator = WelfordAccumulator(held_out_inputs.shape[1])
+        for batch in islice(stream, scaler_batches):
+            batch_inputs = encoder(batch)
+            accumulator.update_batch(batch_inputs)
+            warmup.append((batch_inputs, batch[target]))
+        model.fit_scaler(accumulator)
+
+    metrics = evaluate(model, held_out_inputs, held_out_labels)
+    started = time.perf_counter()
+    first_step = step
+    losses = []
+    # Primero se entrena con los batches del escalado y luego sigue el flujo
+    batches = iter(warmup)
+    try:
+        while step < steps:
+            batch = next(batches, None)
+            if batch is None:
+                raw = next(stream)
+                batch = encoder(raw), raw[target]
+            losses.append(model.partial_fit(*batch))
+            step += 1
+
+            if step % eval_every == 0 or step == steps:
+                metrics = evaluate(model, held_out_inputs, held_out_labels)
+                rate = (step - first_step) * batch_size / (time.perf_counter() - started)
+                print(f"   paso {step:>6}: loss {np.mean(losses):.4f} | held-out accuracy {metrics['accuracy']:.3f}, "
+                      f"balanced {metrics['balanced_accuracy']:.3f}, log loss {metrics['log_loss']:.4f} "
+                      f"({rate:,.0f} muestras/s)")
+                losses = []
+            if checkpoint and (step % checkpoint_every == 0 or step == steps):
+                save_checkpoint(checkpoint, model, step, config)
+    finally:
+        stream.close()
+    return model, encoder, {"steps": step, **metrics}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entrenamiento incremental de un clasificador is_correct / error_type")
+    parser.add_argument("exercise_id", help="Ejercicio del dataset, p. ej. TRUNK_FLEXION")
+    parser.add_argument("--target", choices=TARGETS, default="is_correct")
+    parser.add_argument("--inputs", nargs="+", choices=INPUT_BLOCKS, default=["phase", "features"],
+                        help="Bloques de entrada, en orden")
+    parser.add_argument("--steps", type=int, default=2000, help="Minibatches de entrenamiento")
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--learning-rate", type=float, default=0.05)
+    parser.add_argument("--momentum", type=float, default=0.9)
+    parser.add_argument("--l2", type=float, default=1e-4)
+    parser.add_argument("--seed", type=int, default=42, help="Semilla del flujo de entrenamiento")
+    parser.add_argument("--eval-seed", type=int, default=10_042, help="Semilla del flujo held-out")
+    parser.add_argument("--eval-samples", type=int, default=5000)
+    parser.add_argument("--eval-every", type=int, default=200, help="Pasos entre evaluaciones held-out")
+    parser.add_argument("--checkpoint-dir", help="Directorio de los checkpoints periódicos")
+    parser.add_argument("--checkpoint-every", type=int, default=500)
+    parser.add_argument("--resume", action="store_true", help="Continúa desde el checkpoint de --checkpoint-dir")
+    parser.add_argument("--workers", type=int, default=2, help="Procesos generadores de batches")
+    parser.add_argument("--shards", help="Directorio de dataset particionado en lugar del generador")
+    parser.add_argument("--export", help="Bundle del Processor a escribir, p. ej. models/1/1/is_correct.pkl")
+    parser.add_argument("--phase-names", nargs="+", help="Fases de las reglas para el bundle, en el orden del dataset")
+
+    args = parser.parse_args()
+
+    print(f"🏋️ ENTRENAMIENTO INCREMENTAL: {args.exercise_id} → {args.target}")
+    model, encoder, metrics = train(
+        args.exercise_id, args.target, args.inputs, args.steps, args.batch_size, args.learning_rate, args.momentum,
+        args.l2, seed=args.seed, eval_seed=args.eval_seed, eval_samples=args.eval_samples,
+        eval_every=args.eval_every, checkpoint_dir=args.checkpoint_dir, checkpoint_every=args.checkpoint_every,
+        resume=args.resume, num_workers=args.workers, shards_dir=args.shards,
+    )
+    print(f"\n✅ {metrics['steps']} pasos: accuracy {metrics['accuracy']:.3f}, "
+          f"balanced accuracy {metrics['balanced_accuracy']:.3f}, log loss {metrics['log_loss']:.4f}")
+
+    if args.export:
+        classes = target_classes(label_vocabularies(HybridPhysioDatasetGenerator()), args.target)
+        export_bundle(args.export, model, classes, encoder, args.phase_names)
+        print(f"💾 MODELO EXPORTADO: {args.export}")
@@ -0,0 +1,111 @@
+import asyncio
+import os
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np  # type: ignore
+
+from app.classifier import model_cache
+from app.models import NUM_LANDMARKS, CompiledExercise, FrameResult
+from app.session import Session
+from app.validator import compute_parameters, position_errors
+
+BATCH_MAX_FRAMES = int(os.environ.get("BATCH_MAX_FRAMES", "64"))
+BATCH_MAX_DELAY_MS = float(os.environ.get("BATCH_MAX_DELAY_MS", "2"))
+
+
+def validate_batch(exercise: CompiledExercise, frames: np.ndarray, sessions: Sequence[Session],
+                   timestamps_ms: Sequence[float]) -> List[FrameResult]:
+    """Validate one already recorded frame per entry of sessions, all of the same exercise.
+
+    Angles and position rules run once over the stacked (N, 33, 3) frames; only
+    the phase trackers, which carry per-session state, are stepped one by one.
+    Classifier models of the exercise also run once over the whole batch.
+    """
+    parameters = compute_parameters(frames, exercise)
+    phases = np.empty(len(sessions), dtype=np.intp)
+    updates = []
+    for i, (session, timestamp_ms) in enumerate(zip(sessions, timestamps_ms)):
+        updates.append(session.tracker.update(parameters[i], timestamp_ms))
+        phases[i] = session.tracker.phase
+    violated = position_errors(parameters, phases, exercise)
+    predictions = model_cache.predict(exercise.exercise_id, frames, [exercise.phase_names[p] for p in phases])
+    return [
+        session.result(phase_changed, errors, violated[i], predictions[i] if predictions is not None else None)
+        for i, (session, (phase_changed, errors)) in enumerate(zip(sessions, updates))
+    ]
+
+
+class MicroBatcher:
+    """Collects frames of every session of one exercise version and validates them together.
+
+    A batch is flushed when it holds max_frames frames or when its oldest frame
+    has waited max_delay_ms, which bounds the latency added under light load.
+    """
+
+    def __init__(self, exercise: CompiledExercise, max_frames: int = BATCH_MAX_FRAMES,
+                 max_delay_ms: float = BATCH_MAX_DELAY_MS):
+        self.exercise = exercise
+        self.max_frames = max_frames
+        self.max_delay = max_delay_ms / 1000.0
+        self.frames = np.empty((max_frames, NUM_LANDMARKS, 3), dtype=np.float32)
+        self.pending: List[Tuple[Session, float, asyncio.Future]] = []
+        self.flush_handle = None
+
+    async def submit(self, session: Session, landmarks: np.ndarray, timestamp_ms: float) -> FrameResult:
+        session.record(landmarks, timestamp_ms)
+        self.frames[len(self.pending)] = session.history.latest()
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((session, timestamp_ms, future))
+        if len(self.pending) >= self.max_frames:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.max_delay, self.flush)
+        return await future
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+
+        sessions = [session for session, _, _ in batch]
+        timestamps_ms = [timestamp_ms for _, timestamp_ms, _ in batch]
+        try:
+            results = validate_batch(self.exercise, self.frames[:len(batch)], sessions, timestamps_ms)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+batchers: Dict[Tuple[int, int], MicroBatcher] = {}
+
+
+def prune_batchers(in_use: Iterable[Tuple[int, int]]):
+    """Forget the batchers of exercise versions no session uses any more (after a rules refresh).
+
+    A dropped batcher still holding frames is flushed by its pending timer.
+    """
+    for key in batchers.keys() - set(in_use):
+        del batchers[key]
+
+
+async def process_frame(session: Session, landmarks: np.ndarray, timestamp_ms: float) -> FrameResult:
+    """Validate a frame through the micro-batcher of its exercise, or directly when batching is off"""
+    if BATCH_MAX_DELAY_MS <= 0 or BATCH_MAX_FRAMES <= 1:
+        return session.process(landmarks, timestamp_ms)
+
+    exercise = session.exercise
+    key = (exercise.exercise_id, exercise.version)
+    batcher = batchers.get(key)
+    if batcher is None or batcher.exercise is not exercise:
+        batcher = batchers[key] = MicroBatcher(exercise)
+    return await batcher.submit(session, landmarks, timestamp_ms)
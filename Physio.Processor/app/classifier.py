@@ -0,0 +1,304 @@
+"""is_correct / error_type classifiers trained on the Physio.Dataset data, served next to the rules.
+
+Models live in MODELS_DIR/<exercise_id>/<version>/<target>.pkl (or .onnx) with
+target "is_correct" or "error_type". A .pkl holds a bundle dict:
+
+    {"estimator": fitted model, "classes": [...], "inputs": ["phase", "landmarks", "features"],
+     "phases": [...], "features": {"angle_triplets": [...], "symmetry_pairs": [...], "distance_pairs": [...]}}
+
+Instead of "estimator" a bundle may hold "linear": {"coef", "intercept", "softmax"}
+arrays (Physio.Dataset/train.py exports these), which need no scikit-learn.
+An .onnx model reads the same keys (without "estimator") from <target>.json.
+"inputs" lists the blocks of the model's input vector in order: a one-hot of the
+frame's phase over "phases", the 66 x/y coordinates in CSV order, and the
+feature columns described by "features".
+
+Every worker loads each (exercise, version) once into its own ModelCache.
+Linear models and decision-tree ensembles are evaluated with plain NumPy; other
+estimators go through their own predict_proba and ONNX models through
+onnxruntime on CPU (optional dependencies, only needed by models that use them).
+"""
+import json
+import logging
+import os
+import pickle
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np  # type: ignore
+
+from app.validator import joint_angles, pair_asymmetry
+
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = os.environ.get("MODELS_DIR")
+TARGETS = ("is_correct", "error_type")
+
+
+@dataclass
+class ClassifierModel:
+    """One loaded model and the description of its input vector"""
+
+    exercise_id: int
+    version: int
+    target: str
+    backend: str
+    classes: List
+    inputs: List[str]
+    predict_proba: Callable[[np.ndarray], np.ndarray]
+    phases: List[str] = field(default_factory=list)
+    angle_triplets: np.ndarray = field(default_factory=lambda: np.empty((0, 3), dtype=np.intp))
+    symmetry_pairs: np.ndarray = field(default_factory=lambda: np.empty((0, 2), dtype=np.intp))
+    distance_pairs: np.ndarray = field(default_factory=lambda: np.empty((0, 2), dtype=np.intp))
+
+    def predict(self, frames: np.ndarray, phase_names: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """(class index, probability) per frame of a (N, 33, 3) stack"""
+        probabilities = self.predict_proba(model_inputs(self, frames, phase_names))
+        labels = probabilities.argmax(axis=1)
+        return labels, probabilities[np.arange(len(labels)), labels]
+
+
+def pair_distances(landmarks: np.ndarray, pairs: np.ndarray) -> np.ndarray:
+    """Distance between the two landmarks of each pair, in torso lengths (mid-shoulder to mid-hip)"""
+    torso = np.linalg.norm(landmarks[..., [11, 12], :2].mean(axis=-2) - landmarks[..., [23, 24], :2].mean(axis=-2),
+                           axis=-1)
+    distances = np.linalg.norm(landmarks[..., pairs[:, 0], :2] - landmarks[..., pairs[:, 1], :2], axis=-1)
+    return distances / np.maximum(torso, 1e-6)[..., None]
+
+
+def model_inputs(model: ClassifierModel, frames: np.ndarray, phase_names: Sequence[str]) -> np.ndarray:
+    """(N, num_inputs) float32 input matrix of a model for (N, 33, 3) frames"""
+    blocks = []
+    for block in model.inputs:
+        if block == "phase":
+            one_hot = np.zeros((len(frames), len(model.phases)), dtype=np.float32)
+            for i, phase in enumerate(phase_names):
+                if phase in model.phases:
+                    one_hot[i, model.phases.index(phase)] = 1.0
+            blocks.append(one_hot)
+        elif block == "landmarks":
+            blocks.append(frames[:, :, :2].reshape(len(frames), -1))
+        elif block == "features":
+            blocks.append(joint_angles(frames, model.angle_triplets))
+            blocks.append(pair_asymmetry(frames, model.symmetry_pairs))
+            blocks.append(pair_distances(frames, model.distance_pairs))
+        else:
+            raise ValueError(f"Unknown model input block: {block}")
+    return np.concatenate(blocks, axis=1).astype(np.float32, copy=False)
+
+
+def linear_proba(coef: np.ndarray, intercept: np.ndarray, softmax: bool) -> Callable[[np.ndarray], np.ndarray]:
+    """predict_proba of a fitted linear classifier: logistic for two classes, softmax or normalized one-vs-rest"""
+    coef = np.ascontiguousarray(coef.T, dtype=np.float64)
+
+    def predict_proba(inputs: np.ndarray) -> np.ndarray:
+        scores = inputs @ coef + intercept
+        if scores.shape[1] == 1:
+            positive = 1.0 / (1.0 + np.exp(-scores[:, 0]))
+            return np.column_stack((1.0 - positive, positive))
+        if softmax:
+            scores -= scores.max(axis=1, keepdims=True)
+            probabilities = np.exp(scores)
+        else:
+            probabilities = 1.0 / (1.0 + np.exp(-scores))
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    return predict_proba
+
+
+def tree_proba(trees: Sequence) -> Callable[[np.ndarray], np.ndarray]:
+    """predict_proba of one decision tree or the average of a forest, traversing all trees level by level"""
+    structures = [tree.tree_ for tree in trees]
+    size = max(structure.node_count for structure in structures)
+    depth = max(structure.max_depth for structure in structures)
+    num_classes = structures[0].value.shape[2]
+
+    # Padded (trees, nodes) tables; a leaf points to itself so extra levels are no-ops
+    left = np.tile(np.arange(size), (len(structures), 1))
+    right = left.copy()
+    feature = np.zeros((len(structures), size), dtype=np.intp)
+    threshold = np.zeros((len(structures), size))
+    value = np.zeros((len(structures), size, num_classes))
+    for t, structure in enumerate(structures):
+        nodes = structure.node_count
+        split = structure.children_left >= 0
+        left[t, :nodes][split] = structure.children_left[split]
+        right[t, :nodes][split] = structure.children_right[split]
+        feature[t, :nodes][split] = structure.feature[split]
+        threshold[t, :nodes] = structure.threshold
+        leaf_values = structure.value[:, 0, :]
+        value[t, :nodes] = leaf_values / np.maximum(leaf_values.sum(axis=1, keepdims=True), 1e-12)
+    tree_index = np.arange(len(structures))[:, None]
+
+    def predict_proba(inputs: np.ndarray) -> np.ndarray:
+        rows = np.arange(len(inputs))[None, :]
+        node = np.zeros((len(structures), len(inputs)), dtype=np.intp)
+        for _ in range(depth):
+            goes_left = inputs[rows, feature[tree_index, node]] <= threshold[tree_index, node]
+            node = np.where(goes_left, left[tree_index, node], right[tree_index, node])
+        return value[tree_index, node].mean(axis=0)
+
+    return predict_proba
+
+
+def compile_estimator(estimator) -> Optional[Tuple[str, Callable[[np.ndarray], np.ndarray]]]:
+    """NumPy predict_proba for linear and tree models (optionally behind a StandardScaler), else None"""
+    steps = [step for _, step in getattr(estimator, "steps", [(None, estimator)])]
+    final = steps[-1]
+    mean, scale = None, None
+    for step in steps[:-1]:
+        if not (hasattr(step, "mean_") and hasattr(step, "scale_")) or mean is not None:
+            return None
+        mean = step.mean_ if getattr(step, "with_mean", True) else np.zeros_like(step.scale_)
+        scale = step.scale_ if getattr(step, "with_std", True) else np.ones_like(step.mean_)
+
+    if hasattr(final, "coef_") and hasattr(final, "intercept_") and hasattr(final, "predict_proba"):
+        coef = np.asarray(final.coef_, dtype=np.float64)
+        intercept = np.asarray(final.intercept_, dtype=np.float64)
+        if mean is not None:
+            # Fold the scaler into the weights: w · (x - mean) / scale = (w / scale) · x - w · mean / scale
+            coef = coef / scale
+            intercept = intercept - coef @ mean
+        # SGDClassifier and liblinear/OvR logistic regression normalize per-class sigmoids
+        one_vs_rest = hasattr(final, "loss") or getattr(final, "solver", None) == "liblinear" \
+            or getattr(final, "multi_class", None) == "ovr"
+        return "linear", linear_proba(coef, intercept, softmax=not one_vs_rest)
+
+    if hasattr(final, "tree_"):
+        trees = [final]
+    elif isinstance(getattr(final, "estimators_", None), list) and all(hasattr(t, "tree_") for t in final.estimators_) \
+            and not hasattr(final, "estimator_weights_"):
+        trees = final.estimators_
+    else:
+        return None
+    if getattr(final, "n_outputs_", 1) != 1:
+        return None
+    predict_proba = tree_proba(trees)
+    if mean is None:
+        return "tree", predict_proba
+    # Trees compare float32 inputs, as scikit-learn casts them
+    return "tree", lambda inputs: predict_proba(((inputs - mean) / scale).astype(np.float32))
+
+
+def onnx_proba(path: str, classes: List) -> Callable[[np.ndarray], np.ndarray]:
+    import onnxruntime  # type: ignore
+
+    session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+    input_name = session.get_inputs()[0].name
+    outputs = [output.name for output in session.get_outputs()]
+    output = "probabilities" if "probabilities" in outputs else outputs[-1]
+
+    def predict_proba(inputs: np.ndarray) -> np.ndarray:
+        probabilities = session.run([output], {input_name: inputs})[0]
+        if isinstance(probabilities, list):
+            # skl2onnx's default ZipMap output: one {class: probability} dict per row
+            return np.array([[row[c] for c in classes] for row in probabilities])
+        return np.asarray(probabilities)
+
+    return predict_proba
+
+
+def load_model(path: str, exercise_id: int, version: int, target: str) -> ClassifierModel:
+    if path.endswith(".onnx"):
+        with open(f"{path[:-len('.onnx')]}.json") as f:
+            bundle = json.load(f)
+        backend, predict_proba = "onnx", onnx_proba(path, bundle["classes"])
+    else:
+        with open(path, "rb") as f:
+            bundle = pickle.load(f)
+        if "linear" in bundle:
+            linear = bundle["linear"]
+            backend, predict_proba = "linear", linear_proba(np.asarray(linear["coef"], dtype=np.float64),
+                                                            np.asarray(linear["intercept"], dtype=np.float64),
+                                                            softmax=linear.get("softmax", True))
+        else:
+            estimator = bundle["estimator"]
+            compiled = compile_estimator(estimator)
+            backend, predict_proba = compiled if compiled is not None else ("estimator", estimator.predict_proba)
+            bundle.setdefault("classes", list(estimator.classes_))
+
+    features = bundle.get("features") or {}
+    return ClassifierModel(
+        exercise_id=exercise_id,
+        version=version,
+        target=target,
+        backend=backend,
+        classes=list(bundle["classes"]),
+        inputs=list(bundle["inputs"]),
+        predict_proba=predict_proba,
+        phases=list(bundle.get("phases", [])),
+        angle_triplets=np.array(features.get("angle_triplets", []), dtype=np.intp).reshape(-1, 3),
+        symmetry_pairs=np.array(features.get("symmetry_pairs", []), dtype=np.intp).reshape(-1, 2),
+        distance_pairs=np.array(features.get("distance_pairs", []), dtype=np.intp).reshape(-1, 2),
+    )
+
+
+class ModelCache:
+    """Latest model version of every exercise and target, loaded once per process"""
+
+    def __init__(self, models_dir: Optional[str] = MODELS_DIR):
+        self.models_dir = models_dir
+        self.versions: Dict[int, int] = {}
+        self.models: Dict[Tuple[int, str], ClassifierModel] = {}
+
+    def get(self, exercise_id: int, target: str) -> Optional[ClassifierModel]:
+        return self.models.get((exercise_id, target))
+
+    def refresh(self) -> List[int]:
+        """Load exercises with a newer version directory than the cached one; return the changed ids"""
+        if not self.models_dir or not os.path.isdir(self.models_dir):
+            return []
+        changed = []
+        for name in os.listdir(self.models_dir):
+            exercise_dir = os.path.join(self.models_dir, name)
+            if not name.isdigit() or not os.path.isdir(exercise_dir):
+                continue
+            versions = [int(v) for v in os.listdir(exercise_dir) if v.isdigit()]
+            exercise_id = int(name)
+            if not versions or max(versions) <= self.versions.get(exercise_id, -1):
+                continue
+            version = max(versions)
+            try:
+                loaded = self.load_version(exercise_id, version, os.path.join(exercise_dir, str(version)))
+            except Exception as e:
+                logger.warning("Models of exercise %s version %s not loaded: %s", exercise_id, version, e)
+                continue
+            self.versions[exercise_id] = version
+            for target in TARGETS:
+                self.models.pop((exercise_id, target), None)
+            self.models.update(loaded)
+            changed.append(exercise_id)
+        if changed:
+            logger.info("Classifier models updated for exercises %s", changed)
+        return changed
+
+    @staticmethod
+    def load_version(exercise_id: int, version: int, directory: str) -> Dict[Tuple[int, str], ClassifierModel]:
+        loaded = {}
+        for target in TARGETS:
+            for extension in (".pkl", ".onnx"):
+                path = os.path.join(directory, f"{target}{extension}")
+                if os.path.exists(path):
+                    loaded[(exercise_id, target)] = load_model(path, exercise_id, version, target)
+                    break
+        return loaded
+
+    def predict(self, exercise_id: int, frames: np.ndarray,
+                phase_names: Sequence[str]) -> Optional[List[Dict[str, Dict]]]:
+        """Per frame {target: {"label", "confidence"}} from every model of the exercise, in one call per model"""
+        models = [model for model in (self.get(exercise_id, target) for target in TARGETS) if model is not None]
+        if not models:
+            return None
+        predictions: List[Dict[str, Dict]] = [{} for _ in range(len(frames))]
+        for model in models:
+            labels, confidences = model.predict(frames, phase_names)
+            for prediction, label, confidence in zip(predictions, labels.tolist(), confidences.tolist()):
+                value = model.classes[label]
+                prediction[model.target] = {
+                    "label": value.item() if isinstance(value, np.generic) else value,
+                    "confidence": round(confidence, 4),
+                }
+        return predictions
+
+
+model_cache = ModelCache()
@@ -0,0 +1,279 @@
+"""Multi-process Processor: N uvicorn workers behind a session-affinity router.
+
+    python -m app.cluster --workers 4 --port 8000
+
+Connections to /ws/{session_uuid} are routed with a consistent hash on the
+session uuid, so all frames (and reconnects) of a session reach the worker
+that holds its phase tracker and landmark history. The router only peeks at
+the request head and then passes the accepted socket to the worker over a Unix
+socket (SCM_RIGHTS); the worker serves the connection itself, so session
+traffic never goes through the router. Rules are compiled once by the
+supervisor and handed to the workers through a per-run cache file.
+"""
+import argparse
+import asyncio
+import bisect
+import contextlib
+import hashlib
+import logging
+import multiprocessing
+import os
+import socket
+import tempfile
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+import uvicorn  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_BYTES = 16 * 1024
+HEAD_TIMEOUT_SECONDS = 5.0
+HEAD_POLL_SECONDS = 0.002
+HANDOFF_TIMEOUT_SECONDS = 5.0
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, nodes: List[int], replicas: int = 64):
+        self.ring = sorted(
+            (self._hash(f"{node}:{replica}"), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        self.keys = [h for h, _ in self.ring]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+    def node_for(self, key: str) -> int:
+        index = bisect.bisect(self.keys, self._hash(key)) % len(self.ring)
+        return self.ring[index][1]
+
+
+def affinity_key(request_head: bytes) -> str:
+    """Session uuid of a /ws/{session_uuid} upgrade request, else the request path"""
+    request_line = request_head.split(b"\r\n", 1)[0].decode("latin-1")
+    parts = request_line.split(" ")
+    path = urlsplit(parts[1]).path if len(parts) > 1 else ""
+    segments = [s for s in path.split("/") if s]
+    if len(segments) >= 2 and segments[0] == "ws":
+        return segments[1]
+    return path
+
+
+async def wait_readable(sock: socket.socket):
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    loop.add_reader(sock.fileno(), lambda: future.done() or future.set_result(None))
+    try:
+        await future
+    finally:
+        loop.remove_reader(sock.fileno())
+
+
+async def wait_writable(sock: socket.socket):
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    loop.add_writer(sock.fileno(), lambda: future.done() or future.set_result(None))
+    try:
+        await future
+    finally:
+        loop.remove_writer(sock.fileno())
+
+
+async def peek_request_head(sock: socket.socket) -> bytes:
+    """HTTP request head of a new connection, read with MSG_PEEK so every byte stays queued for the worker"""
+    while True:
+        await wait_readable(sock)
+        data = sock.recv(MAX_HEADER_BYTES, socket.MSG_PEEK)
+        if not data or b"\r\n\r\n" in data or len(data) >= MAX_HEADER_BYTES:
+            return data
+        # Head split across segments: peeked bytes keep the socket readable, so poll for the rest
+        await asyncio.sleep(HEAD_POLL_SECONDS)
+
+
+class AffinityRouter:
+    """Accepts connections, picks a worker from the request head and passes the socket itself to it.
+
+    The worker serves the connection directly, so the router only ever peeks
+    at the first bytes of each connection and never relays session traffic.
+    """
+
+    def __init__(self, channels: List[socket.socket]):
+        self.channels = channels
+        for channel in channels:
+            channel.setblocking(False)
+        # One sender per channel, as the event loop keeps a single writer callback per socket
+        self.channel_locks = [asyncio.Lock() for _ in channels]
+        self.ring = HashRing(list(range(len(channels))))
+        self.tasks = set()
+
+    async def pass_socket(self, worker: int, client: socket.socket):
+        """Send client to a worker, waiting for room in the channel while the worker is behind"""
+        channel = self.channels[worker]
+        async with self.channel_locks[worker]:
+            while True:
+                try:
+                    socket.send_fds(channel, [b"c"], [client.fileno()])
+                    return
+                except BlockingIOError:
+                    await wait_writable(channel)
+
+    async def handle(self, client: socket.socket):
+        try:
+            head = await asyncio.wait_for(peek_request_head(client), HEAD_TIMEOUT_SECONDS)
+        except (asyncio.TimeoutError, OSError):
+            head = b""
+        try:
+            if b"\r\n\r\n" not in head:
+                return
+            worker = self.ring.node_for(affinity_key(head))
+            try:
+                await asyncio.wait_for(self.pass_socket(worker, client), HANDOFF_TIMEOUT_SECONDS)
+            except (asyncio.TimeoutError, OSError) as e:
+                logger.warning("Worker %s unavailable: %s", worker, str(e) or "handoff timed out")
+                with contextlib.suppress(OSError):
+                    client.send(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n")
+        finally:
+            # The worker holds its own copy of the socket from here on
+            client.close()
+
+    async def serve(self, host: str, port: int):
+        loop = asyncio.get_running_loop()
+        listener = socket.create_server((host, port), backlog=1024)
+        listener.setblocking(False)
+        logger.info("Router listening on %s:%s -> %s workers", host, port, len(self.channels))
+        with listener:
+            while True:
+                client, _ = await loop.sock_accept(listener)
+                task = asyncio.create_task(self.handle(client))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+
+class HandoffServer(uvicorn.Server):
+    """uvicorn server that also serves the connections the router passes over its channel"""
+
+    def __init__(self, config: uvicorn.Config, channel: socket.socket):
+        super().__init__(config)
+        self.channel = channel
+        self.handoffs = set()
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets)
+        if self.should_exit:
+            return
+        self.channel.setblocking(False)
+        asyncio.get_running_loop().add_reader(self.channel.fileno(), self.receive_handoffs)
+
+    def create_protocol(self) -> asyncio.Protocol:
+        # Same protocol uvicorn builds for its own listeners, so handed-off connections
+        # share the worker's app, connection tracking and graceful shutdown. server_state
+        # and lifespan.state are uvicorn internals, written against uvicorn 0.54.0: keep
+        # the pin in requirements.txt in step when upgrading.
+        return self.config.http_protocol_class(
+            config=self.config, server_state=self.server_state, app_state=self.lifespan.state,
+        )
+
+    def receive_handoffs(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                message, fds, _, _ = socket.recv_fds(self.channel, 1, 1)
+            except BlockingIOError:
+                return
+            if not message and not fds:
+                # The router is gone
+                loop.remove_reader(self.channel.fileno())
+                self.should_exit = True
+                return
+            for fd in fds:
+                client = socket.socket(fileno=fd)
+                client.setblocking(False)
+                task = loop.create_task(loop.connect_accepted_socket(self.create_protocol, client))
+                self.handoffs.add(task)
+                task.add_done_callback(self.handoffs.discard)
+
+
+async def build_rules_cache(path: str):
+    """Load and compile every active exercise once, for all workers"""
+    import asyncpg  # type: ignore
+    from app.main import DATABASE_URL
+    from app.rules import RulesStore
+
+    store = RulesStore()
+    connection = await asyncpg.connect(DATABASE_URL)
+    try:
+        await store.refresh(connection)
+    finally:
+        await connection.close()
+    store.save_cache(path)
+    logger.info("Compiled rules for %s exercises into %s", len(store.compiled), path)
+
+
+def run_worker(host: str, port: int, rules_cache: Optional[str], channel: socket.socket):
+    if rules_cache:
+        os.environ["RULES_CACHE_PATH"] = rules_cache
+    config = uvicorn.Config("app.main:app", host=host, port=port, log_level="warning")
+    HandoffServer(config, channel).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Physio Processor with session-affinity workers")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes")
+    parser.add_argument("--host", default="0.0.0.0", help="Router bind address")
+    parser.add_argument("--port", type=int, default=8000, help="Router port")
+    parser.add_argument("--worker-base-port", type=int, default=8100,
+                        help="First of the local ports the workers also listen on (health checks)")
+    parser.add_argument("--rules-cache", default=None,
+                        help="Precompiled rules file shared with the workers (default: a new temporary file per run)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    rules_cache = args.rules_cache
+    if rules_cache is None:
+        fd, rules_cache = tempfile.mkstemp(prefix="physio_rules_", suffix=".cache")
+        os.close(fd)
+    try:
+        asyncio.run(build_rules_cache(rules_cache))
+    except Exception as e:
+        logger.warning("Could not precompile rules, workers will load them from the database: %s", e)
+        # Never let workers start from a cache left over by an earlier run
+        with contextlib.suppress(OSError):
+            os.remove(rules_cache)
+        rules_cache = None
+
+    # Spawned workers import app.main themselves, after RULES_CACHE_PATH is set
+    context = multiprocessing.get_context("spawn")
+    channels, workers = [], []
+    for i in range(args.workers):
+        router_end, worker_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        worker = context.Process(
+            target=run_worker, args=("127.0.0.1", args.worker_base_port + i, rules_cache, worker_end), daemon=True,
+        )
+        worker.start()
+        worker_end.close()
+        channels.append(router_end)
+        workers.append(worker)
+
+    try:
+        asyncio.run(AffinityRouter(channels).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for channel in channels:
+            channel.close()
+        for worker in workers:
+            worker.terminate()
+            worker.join()
+        if rules_cache and args.rules_cache is None:
+            with contextlib.suppress(OSError):
+                os.remove(rules_cache)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import math
+
+import numpy as np  # type: ignore
+
+from app.models import NUM_LANDMARKS
+
+
+class ExponentialFilter:
+    """Exponential moving average over all landmarks at once"""
+
+    def __init__(self, alpha: float = 0.5, shape=(NUM_LANDMARKS, 3)):
+        self.alpha = alpha
+        self.state = np.zeros(shape, dtype=np.float32)
+        self.initialized = False
+
+    def reset(self):
+        self.initialized = False
+
+    def __call__(self, landmarks: np.ndarray, timestamp_ms: float) -> np.ndarray:
+        if not self.initialized:
+            self.state[...] = landmarks
+            self.initialized = True
+        else:
+            # state += alpha * (x - state), without temporaries
+            self.state *= 1.0 - self.alpha
+            self.state += self.alpha * landmarks
+        return self.state
+
+
+class OneEuroFilter:
+    """One Euro filter (Casiez et al. 2012) vectorized across all landmarks.
+
+    Slow movement gets a low cutoff (strong smoothing of jitter), fast movement
+    raises the cutoff per coordinate so real motion is followed with little lag.
+    """
+
+    def __init__(self, min_cutoff: float = 1.0, beta: float = 5.0, d_cutoff: float = 1.0,
+                 shape=(NUM_LANDMARKS, 3)):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.value = np.zeros(shape, dtype=np.float32)
+        self.derivative = np.zeros(shape, dtype=np.float32)
+        self.scratch = np.zeros(shape, dtype=np.float32)
+        self.alpha = np.zeros(shape, dtype=np.float32)
+        self.last_ms = None
+
+    def reset(self):
+        self.last_ms = None
+
+    @staticmethod
+    def _alpha(dt: float, cutoff):
+        tau = 1.0 / (2.0 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def __call__(self, landmarks: np.ndarray, timestamp_ms: float) -> np.ndarray:
+        if self.last_ms is None:
+            self.value[...] = landmarks
+            self.derivative.fill(0.0)
+            self.last_ms = timestamp_ms
+            return self.value
+
+        dt = max((timestamp_ms - self.last_ms) / 1000.0, 1e-3)
+        self.last_ms = timestamp_ms
+
+        # Smoothed derivative: derivative += a_d * ((x - value) / dt - derivative)
+        np.subtract(landmarks, self.value, out=self.scratch)
+        self.scratch /= dt
+        self.scratch -= self.derivative
+        self.scratch *= self._alpha(dt, self.d_cutoff)
+        self.derivative += self.scratch
+
+        # Per-coordinate cutoff: min_cutoff + beta * |derivative|
+        np.abs(self.derivative, out=self.alpha)
+        self.alpha *= self.beta
+        self.alpha += self.min_cutoff
+        # alpha = 1 / (1 + 1 / (2 pi cutoff dt))
+        self.alpha *= 2.0 * math.pi * dt
+        np.reciprocal(self.alpha, out=self.alpha)
+        self.alpha += 1.0
+        np.reciprocal(self.alpha, out=self.alpha)
+
+        # value += alpha * (x - value)
+        np.subtract(landmarks, self.value, out=self.scratch)
+        self.scratch *= self.alpha
+        self.value += self.scratch
+        return self.value
+
+
+FILTERS = {
+    "ema": ExponentialFilter,
+    "one_euro": OneEuroFilter,
+}
+
+
+def make_filter(name: str):
+    """Landmark filter by name; None or "none" disables smoothing"""
+    if not name or name == "none":
+        return None
+    if name not in FILTERS:
+        raise ValueError(f"Unknown landmark filter: {name} (expected one of {', '.join(FILTERS)})")
+    return FILTERS[name]()
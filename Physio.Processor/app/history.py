@@ -0,0 +1,64 @@
+import numpy as np  # type: ignore
+
+from app.models import NUM_LANDMARKS
+
+
+class LandmarkHistory:
+    """Fixed-memory ring buffer of the most recent landmark frames of a session.
+
+    Every frame is written twice, at slot i and i + capacity, so the last n
+    frames are always one contiguous slice and windows are returned as views.
+    """
+
+    def __init__(self, capacity: int = 256, num_landmarks: int = NUM_LANDMARKS, dims: int = 3):
+        if capacity < 2:
+            raise ValueError("capacity must be at least 2")
+        self.capacity = capacity
+        self.landmarks = np.zeros((2 * capacity, num_landmarks, dims), dtype=np.float32)
+        self.timestamps = np.zeros(2 * capacity, dtype=np.float64)
+        self.head = 0
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return self.landmarks.nbytes + self.timestamps.nbytes
+
+    def append(self, landmarks: np.ndarray, timestamp_ms: float):
+        """Copy one (33, dims) frame into the buffer"""
+        head = self.head
+        self.landmarks[head] = landmarks
+        self.landmarks[head + self.capacity] = landmarks
+        self.timestamps[head] = timestamp_ms
+        self.timestamps[head + self.capacity] = timestamp_ms
+        self.head = (head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def window(self, n: int = None):
+        """Views (landmarks, timestamps) of the last n frames, oldest first"""
+        n = self.count if n is None else min(n, self.count)
+        end = self.head + self.capacity
+        return self.landmarks[end - n:end], self.timestamps[end - n:end]
+
+    def latest(self) -> np.ndarray:
+        return self.landmarks[self.head + self.capacity - 1]
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def velocity(self, n: int = None) -> np.ndarray:
+        """Per-landmark velocity (n - 1, 33, dims) in units per second over the last n frames"""
+        landmarks, timestamps = self.window(n)
+        dt = np.diff(timestamps) / 1000.0
+        dt[dt <= 0] = np.nan
+        return np.diff(landmarks, axis=0) / dt[:, None, None]
+
+    def peak_speed(self, n: int = None) -> float:
+        """Largest landmark speed over the last n frames (0 with fewer than two frames)"""
+        if min(self.count, n or self.count) < 2:
+            return 0.0
+        speeds = np.linalg.norm(self.velocity(n)[..., :2], axis=-1)
+        return float(np.nanmax(speeds)) if np.isfinite(speeds).any() else 0.0
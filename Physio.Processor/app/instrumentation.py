@@ -0,0 +1,98 @@
+"""Hot-path instrumentation: stage timings, counters, a periodic reporter and an opt-in connection profiler.
+
+Stages are timed with explicit perf_counter_ns() pairs around the socket loop
+(a context manager per stage would cost more than the smallest stages).
+"""
+import asyncio
+import cProfile
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENTATION_REPORT_SECONDS = float(os.environ.get("INSTRUMENTATION_REPORT_SECONDS", "0"))
+# "cprofile" or "yappi" dumps one .prof per sampled connection into PROFILE_DIR
+PROFILER = os.environ.get("PROFILER", "").lower()
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+
+STAGES = ("decode", "validate", "serialize", "send")
+
+counters: Dict[str, int] = {}
+stage_stats: Dict[str, List[int]] = {stage: [0, 0, 0] for stage in STAGES}  # count, total_ns, max_ns
+active_profile = {"profiler": None}
+
+
+def increment(name: str, value: int = 1):
+    counters[name] = counters.get(name, 0) + value
+
+
+def record_stage(stage: str, elapsed_ns: int):
+    stats = stage_stats[stage]
+    stats[0] += 1
+    stats[1] += elapsed_ns
+    if elapsed_ns > stats[2]:
+        stats[2] = elapsed_ns
+
+
+def render_metrics() -> str:
+    """Prometheus text exposition of the counters and stage timings of this worker"""
+    pid = f'pid="{os.getpid()}"'
+    lines = []
+    for name, value in sorted(counters.items()):
+        lines.append(f"# TYPE processor_{name}_total counter")
+        lines.append(f"processor_{name}_total{{{pid}}} {value}")
+    lines.append("# TYPE processor_stage_seconds summary")
+    for stage, (count, total_ns, _) in stage_stats.items():
+        lines.append(f'processor_stage_seconds_count{{{pid},stage="{stage}"}} {count}')
+        lines.append(f'processor_stage_seconds_sum{{{pid},stage="{stage}"}} {total_ns / 1e9:.9f}')
+    lines.append("# TYPE processor_stage_max_seconds gauge")
+    for stage, (_, _, max_ns) in stage_stats.items():
+        lines.append(f'processor_stage_max_seconds{{{pid},stage="{stage}"}} {max_ns / 1e9:.9f}')
+    return "\n".join(lines) + "\n"
+
+
+async def report_periodically(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        parts = [
+            f"{stage} n={count} avg={total_ns / count / 1e3:.1f}us max={max_ns / 1e3:.1f}us"
+            for stage, (count, total_ns, max_ns) in stage_stats.items() if count
+        ]
+        if parts:
+            logger.info("Stages: %s", " | ".join(parts))
+
+
+def start_connection_profile(label: str) -> Optional[str]:
+    """Profile the event loop while a connection is open; returns the dump path for stop_connection_profile.
+
+    Profilers see the whole thread, so a single connection is sampled at a time.
+    """
+    if not PROFILER or active_profile["profiler"] is not None:
+        return None
+    if PROFILER == "yappi":
+        import yappi  # type: ignore
+        yappi.clear_stats()
+        yappi.start()
+        profiler = yappi
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    active_profile["profiler"] = profiler
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    return os.path.join(PROFILE_DIR, f"{label}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+
+
+def stop_connection_profile(path: Optional[str]):
+    if path is None:
+        return
+    profiler = active_profile["profiler"]
+    active_profile["profiler"] = None
+    if PROFILER == "yappi":
+        profiler.stop()
+        profiler.get_func_stats().save(path, type="pstat")
+    else:
+        profiler.disable()
+        profiler.dump_stats(path)
+    logger.info("Connection profile saved to %s", path)
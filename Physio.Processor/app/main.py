@@ -1,3 +1,227 @@
-from fastapi import FastAPI, WebSocket
-from app.validator import validar_pose
-from fatapi.middleware
\ No newline at end of file
+import asyncio
+import contextlib
+import dataclasses
+import json
+import logging
+import os
+import time
+import uuid
+
+import asyncpg  # type: ignore
+import numpy as np  # type: ignore
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
+from fastapi.middleware.cors import CORSMiddleware
+
+from app.batching import process_frame, prune_batchers
+from app.classifier import model_cache
+from app.instrumentation import (
+    INSTRUMENTATION_REPORT_SECONDS, increment, record_stage, render_metrics, report_periodically,
+    start_connection_profile, stop_connection_profile,
+)
+from app.models import NUM_LANDMARKS
+from app.protocol import FrameFormatError, parse_frame
+from app.recorder import RECORDINGS_DIR, RecordingWriter, SessionRecorder
+from app.rules import RulesStore
+from app.session import Session
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "postgresql://postgres@localhost/physio-db")
+RULES_REFRESH_SECONDS = float(os.environ.get("RULES_REFRESH_SECONDS", "30"))
+RULES_CACHE_PATH = os.environ.get("RULES_CACHE_PATH")
+SESSION_IDLE_SECONDS = float(os.environ.get("SESSION_IDLE_SECONDS", "300"))
+
+rules_store = RulesStore()
+sessions = {}
+session_last_seen = {}
+recording_writer = None
+
+
+def evict_idle_sessions():
+    """Drop sessions whose client has been gone longer than SESSION_IDLE_SECONDS"""
+    now = time.monotonic()
+    for session_uuid, last_seen in list(session_last_seen.items()):
+        if now - last_seen > SESSION_IDLE_SECONDS:
+            close_session(sessions.pop(session_uuid, None))
+            session_last_seen.pop(session_uuid, None)
+
+
+def close_session(session):
+    if session is not None and session.recording is not None:
+        session.recording.close()
+        session.recording = None
+
+
+async def refresh_rules_periodically(pool):
+    """Poll the rules snapshot for versions newer than the cached ones"""
+    while True:
+        await asyncio.sleep(RULES_REFRESH_SECONDS)
+        evict_idle_sessions()
+        try:
+            async with pool.acquire() as connection:
+                await rules_store.refresh(connection)
+        except Exception as e:
+            logger.warning("Rules refresh failed: %s", e)
+        model_cache.refresh()
+        prune_batchers((session.exercise.exercise_id, session.exercise.version) for session in sessions.values())
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    global recording_writer
+    if RECORDINGS_DIR:
+        recording_writer = RecordingWriter()
+    if RULES_CACHE_PATH:
+        rules_store.load_cache(RULES_CACHE_PATH)
+    pool = await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=4)
+    async with pool.acquire() as connection:
+        await rules_store.refresh(connection)
+    model_cache.refresh()
+    refresher = asyncio.create_task(refresh_rules_periodically(pool))
+    reporter = None
+    if INSTRUMENTATION_REPORT_SECONDS > 0:
+        reporter = asyncio.create_task(report_periodically(INSTRUMENTATION_REPORT_SECONDS))
+    app.state.db = pool
+    try:
+        yield
+    finally:
+        refresher.cancel()
+        if reporter is not None:
+            reporter.cancel()
+        await pool.close()
+        for session in sessions.values():
+            close_session(session)
+        if recording_writer is not None:
+            recording_writer.stop()
+
+
+app = FastAPI(title="Physio Processor", lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "pid": os.getpid(),
+        "rules_version": rules_store.version,
+        "exercises": len(rules_store.exercises),
+        "sessions": len(sessions),
+        "models": {f"{exercise_id}/{target}": f"v{model.version} ({model.backend})"
+                   for (exercise_id, target), model in model_cache.models.items()},
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return render_metrics()
+
+
+async def handle_frame(session: Session, landmarks: np.ndarray, sequence, timestamp_ms: float):
+    """Record and validate one decoded frame; returns the JSON reply, or None for a late or duplicated frame"""
+    if sequence is not None:
+        # Late or duplicated frames would move the phase tracker back in time
+        if session.last_sequence is not None and sequence <= session.last_sequence:
+            increment("frames_dropped")
+            return None
+        session.last_sequence = sequence
+
+    started = time.perf_counter_ns()
+    if session.recording is not None:
+        session.recording.record_frame(landmarks, timestamp_ms)
+    result = await process_frame(session, landmarks[:, :3], timestamp_ms)
+    if session.recording is not None and result.phase_changed:
+        session.recording.record_result(session.tracker.phase, result.phase_changed, result.repetitions,
+                                        timestamp_ms)
+    validated = time.perf_counter_ns()
+    record_stage("validate", validated - started)
+
+    response = json.dumps({"sequence": sequence, **dataclasses.asdict(result)}, separators=(",", ":"),
+                          ensure_ascii=False)
+    record_stage("serialize", time.perf_counter_ns() - validated)
+    return response
+
+
+@app.websocket("/ws/{session_uuid}")
+async def session_socket(websocket: WebSocket, session_uuid: str, exercise_id: int):
+    try:
+        expected_uuid = uuid.UUID(session_uuid)
+    except ValueError:
+        await websocket.close(code=4400, reason="Invalid session uuid")
+        return
+
+    exercise = rules_store.get_compiled(exercise_id)
+    if exercise is None:
+        await websocket.close(code=4404, reason=f"Exercise {exercise_id} not found or inactive")
+        return
+
+    await websocket.accept()
+
+    # A reconnecting client lands on the same worker and resumes its state
+    session = sessions.get(session_uuid)
+    if session is None or session.exercise.exercise_id != exercise_id:
+        close_session(session)
+        session = sessions[session_uuid] = Session(session_uuid, exercise)
+        if recording_writer is not None:
+            session.recording = SessionRecorder(recording_writer, RECORDINGS_DIR, session_uuid, exercise_id,
+                                                exercise.version)
+    session_last_seen.pop(session_uuid, None)
+    increment("connections")
+    profile = start_connection_profile(session_uuid)
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            increment("frames")
+            started = time.perf_counter_ns()
+            try:
+                if message.get("bytes") is not None:
+                    header, landmarks = parse_frame(message["bytes"])
+                    if header.session_uuid != expected_uuid:
+                        raise FrameFormatError("Frame belongs to another session")
+                    sequence, timestamp_ms = header.sequence, header.timestamp_ms
+                else:
+                    data = json.loads(message["text"])
+                    landmarks = np.asarray(data["landmarks"], dtype=np.float32)
+                    if landmarks.ndim != 2 or landmarks.shape[0] != NUM_LANDMARKS or landmarks.shape[1] < 3:
+                        raise ValueError(f"Expected {NUM_LANDMARKS} landmarks with x, y, z")
+                    sequence, timestamp_ms = data.get("sequence"), float(data["timestamp"])
+                    if sequence is not None and (not isinstance(sequence, int) or isinstance(sequence, bool)):
+                        raise ValueError("sequence must be an integer")
+            except (FrameFormatError, ValueError, KeyError, TypeError) as e:
+                increment("frame_errors")
+                await websocket.send_json({"status": "error", "message": str(e)})
+                continue
+
+            record_stage("decode", time.perf_counter_ns() - started)
+            try:
+                response = await handle_frame(session, landmarks, sequence, timestamp_ms)
+            except Exception:
+                # A batch that fails validation fails for every session in it: answer each
+                # of them with a frame error instead of closing all their sockets
+                logger.exception("Validation of a frame of session %s failed", session_uuid)
+                increment("frame_errors")
+                await websocket.send_json({"status": "error", "message": "Frame validation failed"})
+                continue
+            if response is None:
+                continue
+
+            sending = time.perf_counter_ns()
+            await websocket.send_text(response)
+            record_stage("send", time.perf_counter_ns() - sending)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        stop_connection_profile(profile)
+        if session.recording is not None:
+            session.recording.flush()
+        session_last_seen[session_uuid] = time.monotonic()
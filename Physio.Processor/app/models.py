@@ -0,0 +1,59 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np  # type: ignore
+
+NUM_LANDMARKS = 33
+
+
+@dataclass
+class CompiledExercise:
+    """Rules of one exercise flattened into arrays for per-frame evaluation"""
+
+    exercise_id: int
+    version: int
+    phase_names: List[str]
+    parameter_names: List[str]
+    parameter_index: Dict[str, int]
+    # Features: angle at the middle landmark of each triplet, then |dy| of each pair
+    angle_triplets: np.ndarray
+    symmetry_pairs: np.ndarray
+    # Phase transitions encoded as closed intervals [low, high] on a parameter column
+    transition_phase: np.ndarray
+    transition_column: np.ndarray
+    transition_low: np.ndarray
+    transition_high: np.ndarray
+    # Position rules (angle_check / symmetry_check), violated outside [low, high]
+    rule_codes: List[str]
+    rule_column: np.ndarray
+    rule_low: np.ndarray
+    rule_high: np.ndarray
+    rule_phase_mask: np.ndarray
+    # Time rules, checked against the time spent in a phase
+    time_rule_codes: List[str]
+    time_rule_phase: np.ndarray
+    time_rule_min_ms: np.ndarray
+    time_rule_max_ms: np.ndarray
+    # Motion rules (motion_check), violated when a landmark moves faster than max_speed over the last window frames
+    motion_rule_codes: List[str]
+    motion_rule_window: np.ndarray
+    motion_rule_max_speed: np.ndarray
+    motion_rule_phase_mask: np.ndarray
+    # Column of the primary joint angle, used for range of motion
+    primary_column: int = 0
+
+    @property
+    def num_parameters(self) -> int:
+        return len(self.parameter_names)
+
+
+@dataclass
+class FrameResult:
+    """Outcome of validating one landmark frame"""
+
+    phase: str
+    phase_changed: bool
+    repetitions: int
+    errors: List[str] = field(default_factory=list)
+    # {"is_correct" | "error_type": {"label", "confidence"}} when the exercise has classifier models
+    predictions: Optional[Dict[str, Dict]] = None
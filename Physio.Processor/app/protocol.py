@@ -0,0 +1,72 @@
+"""Binary landmark frame format of the /ws/{session_uuid} endpoint.
+
+Every WebSocket binary message is one frame, little-endian:
+
+    offset  size  field
+    0       4     magic b"PHLM"
+    4       1     format version (1)
+    5       1     value type: 0 = float32, 1 = float16
+    6       2     landmark count (33)
+    8       4     sequence number
+    12      4     reserved
+    16      8     capture timestamp, milliseconds (float64)
+    24      16    session uuid (raw bytes)
+    40      ...   landmark count x (x, y, z, visibility)
+
+Text messages are still accepted as JSON ({"timestamp", "landmarks"}) as a fallback.
+"""
+import struct
+import uuid
+from dataclasses import dataclass
+
+import numpy as np  # type: ignore
+
+from app.models import NUM_LANDMARKS
+
+MAGIC = b"PHLM"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHI4xd16s")
+VALUES_PER_LANDMARK = 4
+DTYPES = {0: np.dtype("<f4"), 1: np.dtype("<f2")}
+DTYPE_CODES = {dtype: code for code, dtype in DTYPES.items()}
+
+
+class FrameFormatError(ValueError):
+    pass
+
+
+@dataclass
+class FrameHeader:
+    session_uuid: uuid.UUID
+    sequence: int
+    timestamp_ms: float
+
+
+def parse_frame(message: bytes):
+    """Decode a binary frame into its header and a (count, 4) view over the message bytes"""
+    if len(message) < HEADER.size:
+        raise FrameFormatError(f"Frame too short: {len(message)} bytes")
+    magic, version, dtype_code, count, sequence, timestamp_ms, session_bytes = HEADER.unpack_from(message)
+    if magic != MAGIC or version != VERSION:
+        raise FrameFormatError("Not a landmark frame")
+    dtype = DTYPES.get(dtype_code)
+    if dtype is None:
+        raise FrameFormatError(f"Unknown value type {dtype_code}")
+    expected = HEADER.size + count * VALUES_PER_LANDMARK * dtype.itemsize
+    if count != NUM_LANDMARKS or len(message) != expected:
+        raise FrameFormatError(f"Expected {NUM_LANDMARKS} landmarks in {expected} bytes, got {len(message)} bytes")
+
+    landmarks = np.frombuffer(message, dtype=dtype, count=count * VALUES_PER_LANDMARK, offset=HEADER.size)
+    header = FrameHeader(uuid.UUID(bytes=session_bytes), sequence, timestamp_ms)
+    return header, landmarks.reshape(count, VALUES_PER_LANDMARK)
+
+
+def encode_frame(session_uuid: uuid.UUID, sequence: int, timestamp_ms: float, landmarks: np.ndarray,
+                 dtype=np.float32) -> bytes:
+    """Encode (33, 3) or (33, 4) landmarks; missing visibility is sent as 1.0"""
+    dtype = np.dtype(dtype).newbyteorder("<")
+    values = np.ones((len(landmarks), VALUES_PER_LANDMARK), dtype=dtype)
+    values[:, :landmarks.shape[1]] = landmarks
+    header = HEADER.pack(MAGIC, VERSION, DTYPE_CODES[dtype], len(landmarks), sequence, timestamp_ms,
+                         session_uuid.bytes)
+    return header + values.tobytes()
@@ -0,0 +1,172 @@
+import functools
+import logging
+import os
+import queue
+import threading
+import uuid
+
+import numpy as np  # type: ignore
+
+from app.recording import (
+    EVENT_PHASE_CHANGE, EVENT_REPETITION, INDEX_DTYPE, INDEX_SUFFIX, RECORD_DTYPE, pack_header, recorded_frames,
+)
+
+logger = logging.getLogger(__name__)
+
+RECORDINGS_DIR = os.environ.get("RECORDINGS_DIR")
+RECORD_CHUNK_FRAMES = int(os.environ.get("RECORD_CHUNK_FRAMES", "512"))
+LANDMARKS_FIELD = RECORD_DTYPE["landmarks"]
+
+
+def encode_records(frames, timestamps_ms, packed: bool = False) -> bytes:
+    """Pack buffered frames and their timestamps into RECORD_DTYPE bytes; frames without visibility get 1.0.
+
+    packed says every frame is a contiguous array of the record's own float16 (33, 4) layout.
+    """
+    records = np.empty(len(timestamps_ms), dtype=RECORD_DTYPE)
+    records["timestamp_ms"] = timestamps_ms
+    if packed:
+        # Binary frames: one join and one strided copy instead of stacking hundreds of small arrays
+        joined = b"".join(frames)
+        records["landmarks"] = np.frombuffer(joined, dtype=LANDMARKS_FIELD.base).reshape(-1, *LANDMARKS_FIELD.shape)
+    else:
+        landmarks = records["landmarks"]
+        landmarks[...] = 1.0
+        for i, frame in enumerate(frames):
+            landmarks[i, :, :frame.shape[-1]] = frame[:, :4]
+    return records.tobytes()
+
+
+class RecordingWriter:
+    """Single background thread doing the encoding and file I/O of all session recordings of a process"""
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.files = {}
+        # Frames per recording counted when they are queued: the file size lags behind by
+        # everything still queued or buffered. Entries go when a closed file has nothing queued.
+        self.lock = threading.Lock()
+        self.frame_counts = {}
+        self.queued = {}
+        self.thread = threading.Thread(target=self._run, name="recording-writer", daemon=True)
+        self.thread.start()
+
+    def frames_recorded(self, path: str) -> int:
+        """Frames of a recording, including those not written yet"""
+        with self.lock:
+            count = self.frame_counts.get(path)
+            if count is None:
+                count = self.frame_counts[path] = recorded_frames(path)
+            return count
+
+    def _enqueue(self, path: str, payload, header: bytes, frames: int = 0):
+        with self.lock:
+            self.queued[path] = self.queued.get(path, 0) + 1
+            if frames:
+                count = self.frame_counts.get(path)
+                self.frame_counts[path] = (recorded_frames(path) if count is None else count) + frames
+        self.queue.put((path, payload, header))
+
+    def _done(self, path: str, closed: bool):
+        with self.lock:
+            left = self.queued.pop(path) - 1
+            if left:
+                self.queued[path] = left
+            elif closed:
+                self.frame_counts.pop(path, None)
+
+    def write(self, path: str, payload, header: bytes = b"", frames: int = 0):
+        """Append bytes, or the result of a callable run on the writer thread, to a file holding frames records"""
+        self._enqueue(path, payload, header, frames)
+
+    def close_file(self, path: str):
+        self._enqueue(path, None, b"")
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while (item := self.queue.get()) is not None:
+            path, payload, header = item
+            try:
+                if payload is None:
+                    f = self.files.pop(path, None)
+                    if f is not None:
+                        f.close()
+                    continue
+                if callable(payload):
+                    payload = payload()
+                f = self.files.get(path)
+                if f is None:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    f = self.files[path] = open(path, "ab")
+                    if f.tell() == 0 and header:
+                        f.write(header)
+                f.write(payload)
+            except (OSError, ValueError) as e:
+                logger.warning("Recording write to %s failed: %s", path, e)
+            finally:
+                self._done(path, payload is None)
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+
+
+class SessionRecorder:
+    """Collects the frames of one session and ships them to the writer thread in large chunks.
+
+    Frames are only referenced here (a binary frame is a read-only view over its
+    message); packing them into records happens on the writer thread.
+    """
+
+    def __init__(self, writer: RecordingWriter, directory: str, session_uuid: str, exercise_id: int,
+                 rules_version: int = 0, chunk_frames: int = RECORD_CHUNK_FRAMES):
+        self.writer = writer
+        self.path = os.path.join(directory, str(exercise_id), f"{session_uuid}.plog")
+        self.index_path = f"{self.path}{INDEX_SUFFIX}"
+        self.header = pack_header(uuid.UUID(str(session_uuid)), exercise_id, rules_version)
+        self.chunk_frames = chunk_frames
+        self.pending_frames = []
+        self.pending_timestamps = []
+        self.pending_packed = True
+        self.frames = writer.frames_recorded(self.path)
+        self.events = []
+        self.repetitions = 0
+
+    def record_frame(self, landmarks: np.ndarray, timestamp_ms: float):
+        """Queue a (33, 3) or (33, 4) frame"""
+        if self.pending_packed and (landmarks.dtype != LANDMARKS_FIELD.base or landmarks.shape != LANDMARKS_FIELD.shape
+                                    or not landmarks.flags.c_contiguous):
+            self.pending_packed = False
+        self.pending_frames.append(landmarks)
+        self.pending_timestamps.append(timestamp_ms)
+        self.frames += 1
+        if len(self.pending_frames) >= self.chunk_frames:
+            self.flush()
+
+    def record_result(self, phase: int, phase_changed: bool, repetitions: int, timestamp_ms: float):
+        """Index phase changes and completed repetitions at the last recorded frame.
+
+        Repetitions are only completed on a phase change, so callers may skip the other frames.
+        """
+        if phase_changed:
+            self.events.append((self.frames - 1, timestamp_ms, EVENT_PHASE_CHANGE, phase, repetitions))
+        if repetitions > self.repetitions:
+            self.repetitions = repetitions
+            self.events.append((self.frames - 1, timestamp_ms, EVENT_REPETITION, phase, repetitions))
+
+    def flush(self):
+        if self.pending_frames:
+            payload = functools.partial(encode_records, self.pending_frames, self.pending_timestamps,
+                                        self.pending_packed)
+            self.writer.write(self.path, payload, self.header, frames=len(self.pending_frames))
+            self.pending_frames, self.pending_timestamps, self.pending_packed = [], [], True
+        if self.events:
+            self.writer.write(self.index_path, np.array(self.events, dtype=INDEX_DTYPE).tobytes())
+            self.events = []
+
+    def close(self):
+        self.flush()
+        self.writer.close_file(self.path)
+        self.writer.close_file(self.index_path)
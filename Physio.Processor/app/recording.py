@@ -0,0 +1,104 @@
+"""On-disk format of recorded sessions: a fixed header followed by fixed-size frame records.
+
+    offset  size  field
+    0       8     magic b"PHYSREC1"
+    8       2     format version (1)
+    10      2     reserved
+    12      4     exercise id
+    16      16    session uuid (raw bytes)
+    32      8     rules version the session was validated with
+    40      24    reserved
+    64      ...   records: timestamp_ms float64 + 33 x (x, y, z, visibility) float16
+
+Records never change once written, so a file can be read with np.memmap while
+it is still being appended to; a trailing partial record is ignored.
+
+Phase changes and repetitions go to a sidecar index (<recording>.idx) of
+INDEX_DTYPE records pointing at the frame where they happened.
+"""
+import os
+import struct
+import uuid
+from dataclasses import dataclass
+
+import numpy as np  # type: ignore
+
+from app.models import NUM_LANDMARKS
+
+MAGIC = b"PHYSREC1"
+VERSION = 1
+HEADER = struct.Struct("<8sHxxi16sq24x")
+RECORD_DTYPE = np.dtype([
+    ("timestamp_ms", "<f8"),
+    ("landmarks", "<f2", (NUM_LANDMARKS, 4)),
+])
+
+INDEX_SUFFIX = ".idx"
+INDEX_DTYPE = np.dtype([
+    ("frame", "<u8"),
+    ("timestamp_ms", "<f8"),
+    ("event", "u1"),
+    ("phase", "u1"),
+    ("repetition", "<u2"),
+])
+EVENT_PHASE_CHANGE = 1
+EVENT_REPETITION = 2
+
+
+@dataclass
+class RecordingInfo:
+    session_uuid: uuid.UUID
+    exercise_id: int
+    rules_version: int
+
+
+def pack_header(session_uuid: uuid.UUID, exercise_id: int, rules_version: int = 0) -> bytes:
+    return HEADER.pack(MAGIC, VERSION, exercise_id, session_uuid.bytes, rules_version)
+
+
+def read_header(path) -> RecordingInfo:
+    with open(path, "rb") as f:
+        data = f.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path}: not a session recording")
+    magic, version, exercise_id, session_bytes, rules_version = HEADER.unpack(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: not a session recording")
+    return RecordingInfo(uuid.UUID(bytes=session_bytes), exercise_id, rules_version)
+
+
+def open_recording(path):
+    """Header and a read-only memory map over the complete frame records"""
+    info = read_header(path)
+    count = (os.path.getsize(path) - HEADER.size) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return info, np.zeros(0, dtype=RECORD_DTYPE)
+    return info, np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER.size, shape=(count,))
+
+
+def open_index(path):
+    """Read-only memory map over the phase-change / repetition index of a recording"""
+    index_path = f"{path}{INDEX_SUFFIX}"
+    count = os.path.getsize(index_path) // INDEX_DTYPE.itemsize if os.path.exists(index_path) else 0
+    if count == 0:
+        return np.zeros(0, dtype=INDEX_DTYPE)
+    return np.memmap(index_path, dtype=INDEX_DTYPE, mode="r", shape=(count,))
+
+
+def recorded_frames(path) -> int:
+    """Number of complete records already in a recording file (0 when it does not exist)"""
+    if not os.path.exists(path):
+        return 0
+    return max(os.path.getsize(path) - HEADER.size, 0) // RECORD_DTYPE.itemsize
+
+
+def write_recording(path, session_uuid: uuid.UUID, exercise_id: int, timestamps_ms: np.ndarray,
+                    landmarks: np.ndarray, rules_version: int = 0):
+    """Write a whole session at once; landmarks are (T, 33, 3) or (T, 33, 4)"""
+    records = np.zeros(len(timestamps_ms), dtype=RECORD_DTYPE)
+    records["timestamp_ms"] = timestamps_ms
+    records["landmarks"][..., 3] = 1.0
+    records["landmarks"][..., :landmarks.shape[-1]] = landmarks
+    with open(path, "wb") as f:
+        f.write(pack_header(session_uuid, exercise_id, rules_version))
+        f.write(records.tobytes())
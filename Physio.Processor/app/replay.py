@@ -0,0 +1,209 @@
+"""Offline rescoring of recorded sessions with the current rules.
+
+    python -m app.replay recordings/*.plog --rules-cache /tmp/physio_rules.cache --output reps.csv
+    python -m app.replay recordings/ --rules exercise_1_rules.json --workers 8
+
+Each recording is validated with the same pipeline as the live socket (filter,
+joint angles, phase tracker, position, time and motion rules), but the angle and
+position-rule kernels run over whole chunks of the session at once. Sessions
+are spread across worker processes. The output has one row per repetition,
+with the columns of exercise_repetitions.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np  # type: ignore
+
+from app.filters import make_filter
+from app.history import LandmarkHistory
+from app.models import CompiledExercise
+from app.recording import open_recording
+from app.rules import RulesStore
+from app.validator import PhaseTracker, compile_exercise, compute_parameters, motion_errors, position_errors
+
+CHUNK_FRAMES = 4096
+TIME_ERROR_PENALTY = 10.0
+
+REPETITION_COLUMNS = [
+    "session_uuid", "rep_number", "effective_time_ms", "range_of_motion_degrees", "error_count",
+    "max_angle_reached", "min_angle_reached", "rep_start_ms", "rep_end_ms", "quality_score", "errors",
+]
+
+
+class RepetitionAccumulator:
+    """Collects the frames of the repetition in progress and closes it into a row"""
+
+    def __init__(self, session_uuid: str):
+        self.session_uuid = session_uuid
+        self.rows = []
+        self.reset(None)
+
+    def reset(self, start_ms):
+        self.start_ms = start_ms
+        self.frames = 0
+        self.error_frames = 0
+        self.max_angle = -np.inf
+        self.min_angle = np.inf
+        self.errors = set()
+        self.time_errors = 0
+
+    def add(self, timestamp_ms: float, angle: float, errors: List[str], time_errors: int, frame_error: bool):
+        if self.start_ms is None:
+            return
+        self.frames += 1
+        self.error_frames += frame_error
+        self.max_angle = max(self.max_angle, angle)
+        self.min_angle = min(self.min_angle, angle)
+        self.errors.update(errors)
+        self.time_errors += time_errors
+
+    def close(self, end_ms: float):
+        """Quality: share of frames without position or motion errors, minus a penalty per time-rule error"""
+        if self.start_ms is None or self.frames == 0:
+            return
+        quality = 100.0 * (1.0 - self.error_frames / self.frames) - TIME_ERROR_PENALTY * self.time_errors
+        self.rows.append({
+            "session_uuid": self.session_uuid,
+            "rep_number": len(self.rows) + 1,
+            "effective_time_ms": int(round(end_ms - self.start_ms)),
+            "range_of_motion_degrees": round(self.max_angle - self.min_angle, 2),
+            "error_count": len(self.errors),
+            "max_angle_reached": round(self.max_angle, 2),
+            "min_angle_reached": round(self.min_angle, 2),
+            "rep_start_ms": self.start_ms,
+            "rep_end_ms": end_ms,
+            "quality_score": round(max(quality, 0.0), 2),
+            "errors": ";".join(sorted(self.errors)),
+        })
+
+
+def replay_session(exercise: CompiledExercise, timestamps_ms: np.ndarray, landmarks: np.ndarray,
+                   session_uuid: str = "", landmark_filter: str = "none") -> List[dict]:
+    """Validate a whole recorded session and return one row per completed repetition"""
+    tracker = PhaseTracker(exercise)
+    smoother = make_filter(landmark_filter)
+    repetition = RepetitionAccumulator(session_uuid)
+    last_phase = len(exercise.phase_names) - 1
+    # Motion rules need the recent frames, as on the live socket; skipped when the exercise has none
+    history = LandmarkHistory(int(exercise.motion_rule_window.max()) + 1) if exercise.motion_rule_codes else None
+
+    for first in range(0, len(timestamps_ms), CHUNK_FRAMES):
+        frames = landmarks[first:first + CHUNK_FRAMES, :, :3].astype(np.float32)
+        times = np.asarray(timestamps_ms[first:first + CHUNK_FRAMES], dtype=np.float64)
+        if smoother is not None:
+            for i in range(len(frames)):
+                frames[i] = smoother(frames[i], times[i])
+
+        parameters = compute_parameters(frames, exercise)
+        phases = np.empty(len(frames), dtype=np.intp)
+        started = np.zeros(len(frames), dtype=bool)
+        completed = np.zeros(len(frames), dtype=bool)
+        time_errors = []
+        for i in range(len(frames)):
+            previous_phase = tracker.phase
+            phase_changed, errors = tracker.update(parameters[i], times[i])
+            phases[i] = tracker.phase
+            started[i] = phase_changed and previous_phase == 0
+            completed[i] = phase_changed and tracker.phase == last_phase
+            time_errors.append(errors)
+
+        violated = position_errors(parameters, phases, exercise)
+        angles = parameters[:, exercise.primary_column]
+        for i in range(len(frames)):
+            if started[i]:
+                repetition.reset(times[i])
+            codes = [exercise.rule_codes[r] for r in np.flatnonzero(violated[i])]
+            if history is not None:
+                history.append(frames[i], times[i])
+                codes += motion_errors(history, phases[i], exercise)
+            frame_error = bool(codes)
+            codes += time_errors[i]
+            repetition.add(times[i], angles[i], codes, len(time_errors[i]), frame_error)
+            if completed[i]:
+                repetition.close(times[i])
+                repetition.reset(None)
+
+    return repetition.rows
+
+
+def load_rules(rules_cache: str = None, rules_files: List[str] = ()) -> Dict[int, CompiledExercise]:
+    exercises = {}
+    if rules_cache:
+        store = RulesStore()
+        if store.load_cache(rules_cache):
+            exercises.update(store.compiled)
+    for path in rules_files:
+        with open(path, encoding="utf-8") as f:
+            rules = json.load(f)
+        exercises[rules["exercise_id"]] = compile_exercise(rules)
+    return exercises
+
+
+_exercises: Dict[int, CompiledExercise] = {}
+_landmark_filter = "none"
+
+
+def _init_worker(rules_cache, rules_files, landmark_filter):
+    global _exercises, _landmark_filter
+    _exercises = load_rules(rules_cache, rules_files)
+    _landmark_filter = landmark_filter
+
+
+def replay_file(path: str) -> List[dict]:
+    info, records = open_recording(path)
+    exercise = _exercises.get(info.exercise_id)
+    if exercise is None:
+        raise ValueError(f"{path}: no rules for exercise {info.exercise_id}")
+    return replay_session(exercise, records["timestamp_ms"], records["landmarks"],
+                          str(info.session_uuid), _landmark_filter)
+
+
+def find_recordings(paths: List[str]) -> List[str]:
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(str(p) for p in Path(path).rglob("*.plog")))
+        else:
+            found.append(path)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rescore recorded sessions with the current rules")
+    parser.add_argument("paths", nargs="+", help="Recording files or directories containing *.plog files")
+    parser.add_argument("--rules-cache", help="Compiled rules cache written by app.cluster")
+    parser.add_argument("--rules", nargs="*", default=[], help="get_exercise_rules JSON files")
+    parser.add_argument("--filter", default="none", help="Landmark filter applied before validation")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--output", help="CSV output file (default: stdout)")
+    args = parser.parse_args()
+
+    recordings = find_recordings(args.paths)
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    writer = csv.DictWriter(output, fieldnames=REPETITION_COLUMNS)
+    writer.writeheader()
+
+    failed = 0
+    with ProcessPoolExecutor(args.workers, initializer=_init_worker,
+                             initargs=(args.rules_cache, args.rules, args.filter)) as pool:
+        futures = [(path, pool.submit(replay_file, path)) for path in recordings]
+        for path, future in futures:
+            try:
+                writer.writerows(future.result())
+            except Exception as e:
+                failed += 1
+                print(f"Error replaying {path}: {e}", file=sys.stderr)
+
+    if output is not sys.stdout:
+        output.close()
+    print(f"Replayed {len(recordings) - failed} of {len(recordings)} sessions", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+import pickle
+from typing import Dict, List, Optional
+
+from app.models import CompiledExercise
+from app.validator import compile_exercise
+
+logger = logging.getLogger(__name__)
+
+RULES_SINCE_QUERY = (
+    "SELECT exercise_id, version, is_active, rules "
+    "FROM get_exercise_rules_since($1)"
+)
+
+
+class RulesStore:
+    """In-memory copy of exercise_rules_snapshot, kept in sync by version"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.version = 0
+        self.exercises: Dict[int, dict] = {}
+        self.versions: Dict[int, int] = {}
+        self.compiled: Dict[int, CompiledExercise] = {}
+
+    def get(self, exercise_id: int) -> Optional[dict]:
+        return self.exercises.get(exercise_id)
+
+    def get_compiled(self, exercise_id: int) -> Optional[CompiledExercise]:
+        return self.compiled.get(exercise_id)
+
+    def apply(self, rows) -> List[int]:
+        """Apply snapshot rows (exercise_id, version, is_active, rules) and return the changed ids"""
+        changed = []
+        for row in rows:
+            exercise_id = row["exercise_id"]
+            version = row["version"]
+            if row["is_active"] and row["rules"] is not None:
+                rules = row["rules"]
+                self.exercises[exercise_id] = json.loads(rules) if isinstance(rules, str) else rules
+                self.versions[exercise_id] = version
+                self.compiled[exercise_id] = compile_exercise(self.exercises[exercise_id], version)
+            else:
+                self.exercises.pop(exercise_id, None)
+                self.versions.pop(exercise_id, None)
+                self.compiled.pop(exercise_id, None)
+            self.version = max(self.version, version)
+            changed.append(exercise_id)
+        return changed
+
+    async def refresh(self, connection) -> List[int]:
+        """Fetch every snapshot row newer than the last seen version in one round trip"""
+        rows = await connection.fetch(RULES_SINCE_QUERY, self.version)
+        if rows and rows[0]["version"] <= self.version:
+            # The version counter went backwards (database recreated): reload everything
+            logger.warning("Rules version went back from %s to %s, reloading", self.version, rows[-1]["version"])
+            self.clear()
+        changed = self.apply(rows)
+        if changed:
+            logger.info("Rules updated for exercises %s (version %s)", changed, self.version)
+        return changed
+
+    def save_cache(self, path: str):
+        """Write the compiled rules to a file that worker processes load at startup"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((self.version, self.exercises, self.versions, self.compiled), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def load_cache(self, path: str) -> bool:
+        """Load rules compiled by another process; False when there is no usable cache"""
+        try:
+            with open(path, "rb") as f:
+                self.version, self.exercises, self.versions, self.compiled = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, ValueError, EOFError) as e:
+            logger.warning("Rules cache %s not loaded: %s", path, e)
+            return False
+        return True
@@ -0,0 +1,60 @@
+import os
+from typing import Dict, List, Optional
+
+import numpy as np  # type: ignore
+
+from app.classifier import model_cache
+from app.filters import make_filter
+from app.history import LandmarkHistory
+from app.models import CompiledExercise, FrameResult
+from app.validator import PhaseTracker, compute_parameters, motion_errors, position_errors
+
+HISTORY_CAPACITY = int(os.environ.get("HISTORY_CAPACITY", "256"))
+LANDMARK_FILTER = os.environ.get("LANDMARK_FILTER", "none")
+
+
+class Session:
+    """Per-connection validation state: smoothing filter, landmark history and phase tracking"""
+
+    def __init__(self, session_uuid: str, exercise: CompiledExercise, history_capacity: int = HISTORY_CAPACITY,
+                 landmark_filter: str = LANDMARK_FILTER):
+        self.session_uuid = session_uuid
+        self.exercise = exercise
+        self.history = LandmarkHistory(history_capacity)
+        self.tracker = PhaseTracker(exercise)
+        self.filter = make_filter(landmark_filter)
+        self.last_sequence = None
+        self.recording = None
+
+    def process(self, landmarks: np.ndarray, timestamp_ms: float) -> FrameResult:
+        """Smooth, record and validate a (33, 3) frame; float16 views are converted on copy"""
+        self.record(landmarks, timestamp_ms)
+        parameters = compute_parameters(self.history.latest(), self.exercise)
+        phase_changed, errors = self.tracker.update(parameters, timestamp_ms)
+        violated = position_errors(parameters, self.tracker.phase, self.exercise)
+        predictions = model_cache.predict(self.exercise.exercise_id, self.history.latest()[None],
+                                          [self.exercise.phase_names[self.tracker.phase]])
+        return self.result(phase_changed, errors, violated, predictions[0] if predictions is not None else None)
+
+    def record(self, landmarks: np.ndarray, timestamp_ms: float):
+        """Smooth a frame and append it to the history"""
+        if self.filter is not None:
+            landmarks = self.filter(landmarks, timestamp_ms)
+        self.history.append(landmarks, timestamp_ms)
+
+    def result(self, phase_changed: bool, errors: List[str], violated: np.ndarray,
+               predictions: Optional[Dict[str, Dict]] = None) -> FrameResult:
+        """Frame result from the time-rule errors, the violated position rules and the classifier predictions.
+
+        Motion rules are checked here against the session's history, so direct and batched validation share them.
+        """
+        exercise = self.exercise
+        errors.extend(exercise.rule_codes[i] for i in np.flatnonzero(violated))
+        errors.extend(motion_errors(self.history, self.tracker.phase, exercise))
+        return FrameResult(
+            phase=exercise.phase_names[self.tracker.phase],
+            phase_changed=phase_changed,
+            repetitions=self.tracker.repetitions,
+            errors=errors,
+            predictions=predictions,
+        )
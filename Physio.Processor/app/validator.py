@@ -0,0 +1,238 @@
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np  # type: ignore
+
+from app.history import LandmarkHistory
+from app.models import CompiledExercise
+
+logger = logging.getLogger(__name__)
+
+INF = np.inf
+# Frames over which a motion_check rule takes the peak landmark speed when it does not set window_frames
+MOTION_WINDOW_FRAMES = 5
+
+
+def _interval(operator: str, value: float, value2: float, hysteresis: float) -> Tuple[float, float]:
+    """Translate a transition condition into a closed interval, widened by its hysteresis"""
+    if operator == "<":
+        return -INF, np.nextafter(value - hysteresis, -INF)
+    if operator == "<=":
+        return -INF, value - hysteresis
+    if operator == ">":
+        return np.nextafter(value + hysteresis, INF), INF
+    if operator == ">=":
+        return value + hysteresis, INF
+    if operator == "==":
+        return value, value
+    if operator == "between":
+        return value + hysteresis, value2 - hysteresis
+    raise ValueError(f"Unknown transition operator: {operator}")
+
+
+def _number(value, default: float = 0.0) -> float:
+    return default if value is None else float(value)
+
+
+def compile_exercise(rules: dict, version: int = 0) -> CompiledExercise:
+    """Compile the get_exercise_rules JSON of one exercise into flat arrays"""
+    phases = sorted(rules.get("phases", []), key=lambda p: p["phase_order"])
+    phase_names = [p["phase_name"] for p in phases]
+    phase_lookup = {name: i for i, name in enumerate(phase_names)}
+
+    # Landmark mappings become feature columns: triplets are angles, pairs are asymmetries
+    triplets, pairs, triplet_names, pair_names = [], [], [], []
+    primary_column = 0
+    for mapping in rules.get("landmark_mappings", {}).values():
+        indices = mapping.get("indices", [])
+        if len(indices) == 3:
+            if mapping.get("mapping_type") == "primary_joint":
+                primary_column = len(triplets)
+            triplets.append(indices)
+            triplet_names.append(mapping["joint_name"])
+        elif len(indices) == 2:
+            pairs.append(indices)
+            pair_names.append(mapping["joint_name"])
+
+    parameter_names = [f"{name}_angle" for name in triplet_names] + [f"{name}_symmetry" for name in pair_names]
+    parameter_index: Dict[str, int] = {}
+    for column, name in enumerate(triplet_names + pair_names):
+        parameter_index[name] = column
+        parameter_index[parameter_names[column]] = column
+
+    transition_rows = []
+    for phase_id, phase in enumerate(phases):
+        for transition in phase.get("transitions", []):
+            column = parameter_index.get(transition["parameter_name"])
+            if column is None:
+                logger.warning("Exercise %s: unknown transition parameter %s",
+                               rules.get("exercise_id"), transition["parameter_name"])
+                continue
+            low, high = _interval(
+                transition["operator"],
+                _number(transition["value"]),
+                _number(transition.get("value2"), INF),
+                _number(transition.get("hysteresis")),
+            )
+            transition_rows.append((phase_id, column, low, high))
+
+    rule_codes, rule_rows = [], []
+    time_codes, time_rows = [], []
+    motion_codes, motion_rows = [], []
+    for rule in rules.get("validation_rules", []):
+        if not rule.get("is_active", True):
+            continue
+        params = rule.get("parameters", {})
+        applicable = [phase_lookup[p] for p in rule.get("applicable_phases", []) if p in phase_lookup]
+        mask = np.zeros(len(phase_names), dtype=bool)
+        mask[applicable] = True
+
+        if rule["rule_type"] == "time_check":
+            phase_id = phase_lookup.get(params.get("phase"), applicable[0] if applicable else None)
+            if phase_id is None:
+                continue
+            time_codes.append(rule["error_code"])
+            time_rows.append((phase_id, _number(params.get("min_time_ms"), -INF), _number(params.get("max_time_ms"), INF)))
+            continue
+
+        if rule["rule_type"] == "motion_check":
+            if params.get("max_speed") is None:
+                logger.warning("Exercise %s: motion rule %s without max_speed", rules.get("exercise_id"), rule["error_code"])
+                continue
+            window = max(2, int(_number(params.get("window_frames"), MOTION_WINDOW_FRAMES)))
+            motion_codes.append(rule["error_code"])
+            motion_rows.append((window, _number(params["max_speed"]), mask))
+            continue
+
+        column = parameter_index.get(params.get("parameter"))
+        if column is None:
+            logger.warning("Exercise %s: unknown rule parameter %s", rules.get("exercise_id"), params.get("parameter"))
+            continue
+        low = _number(params.get("min_value"), -INF)
+        high = _number(params.get("max_value", params.get("max_asymmetry")), INF)
+        rule_codes.append(rule["error_code"])
+        rule_rows.append((column, low, high, mask))
+
+    transitions = np.array(transition_rows, dtype=np.float64).reshape(-1, 4)
+    times = np.array(time_rows, dtype=np.float64).reshape(-1, 3)
+
+    return CompiledExercise(
+        exercise_id=rules["exercise_id"],
+        version=version,
+        phase_names=phase_names,
+        parameter_names=parameter_names,
+        parameter_index=parameter_index,
+        angle_triplets=np.array(triplets, dtype=np.intp).reshape(-1, 3),
+        symmetry_pairs=np.array(pairs, dtype=np.intp).reshape(-1, 2),
+        transition_phase=transitions[:, 0].astype(np.intp),
+        transition_column=transitions[:, 1].astype(np.intp),
+        transition_low=transitions[:, 2].copy(),
+        transition_high=transitions[:, 3].copy(),
+        rule_codes=rule_codes,
+        rule_column=np.array([r[0] for r in rule_rows], dtype=np.intp),
+        rule_low=np.array([r[1] for r in rule_rows], dtype=np.float64),
+        rule_high=np.array([r[2] for r in rule_rows], dtype=np.float64),
+        rule_phase_mask=np.array([r[3] for r in rule_rows], dtype=bool).reshape(-1, len(phase_names)),
+        time_rule_codes=time_codes,
+        time_rule_phase=times[:, 0].astype(np.intp),
+        time_rule_min_ms=times[:, 1].copy(),
+        time_rule_max_ms=times[:, 2].copy(),
+        motion_rule_codes=motion_codes,
+        motion_rule_window=np.array([r[0] for r in motion_rows], dtype=np.intp),
+        motion_rule_max_speed=np.array([r[1] for r in motion_rows], dtype=np.float64),
+        motion_rule_phase_mask=np.array([r[2] for r in motion_rows], dtype=bool).reshape(-1, len(phase_names)),
+        primary_column=primary_column,
+    )
+
+
+def joint_angles(landmarks: np.ndarray, triplets: np.ndarray) -> np.ndarray:
+    """Angle in degrees at the middle landmark of each triplet, for (..., 33, D) landmarks"""
+    a = landmarks[..., triplets[:, 0], :2]
+    b = landmarks[..., triplets[:, 1], :2]
+    c = landmarks[..., triplets[:, 2], :2]
+    ba = a - b
+    bc = c - b
+    cross = ba[..., 0] * bc[..., 1] - ba[..., 1] * bc[..., 0]
+    dot = (ba * bc).sum(axis=-1)
+    return np.degrees(np.abs(np.arctan2(cross, dot)))
+
+
+def pair_asymmetry(landmarks: np.ndarray, pairs: np.ndarray) -> np.ndarray:
+    """Vertical offset between the two landmarks of each pair, for (..., 33, D) landmarks"""
+    return np.abs(landmarks[..., pairs[:, 0], 1] - landmarks[..., pairs[:, 1], 1])
+
+
+def compute_parameters(landmarks: np.ndarray, exercise: CompiledExercise) -> np.ndarray:
+    """Feature vector of an exercise (..., num_parameters) for one frame or a stack of frames"""
+    return np.concatenate(
+        (joint_angles(landmarks, exercise.angle_triplets), pair_asymmetry(landmarks, exercise.symmetry_pairs)),
+        axis=-1,
+    )
+
+
+def position_errors(parameters: np.ndarray, phase: np.ndarray, exercise: CompiledExercise) -> np.ndarray:
+    """Violated position rules (..., num_rules) given parameters (..., P) and the phase of each frame"""
+    values = parameters[..., exercise.rule_column]
+    outside = (values < exercise.rule_low) | (values > exercise.rule_high)
+    return outside & exercise.rule_phase_mask.T[phase]
+
+
+def motion_errors(history: LandmarkHistory, phase: int, exercise: CompiledExercise) -> List[str]:
+    """Motion rules of the phase violated by the peak landmark speed over their window of the history"""
+    return [
+        exercise.motion_rule_codes[i]
+        for i in np.flatnonzero(exercise.motion_rule_phase_mask[:, phase])
+        if history.peak_speed(int(exercise.motion_rule_window[i])) > exercise.motion_rule_max_speed[i]
+    ]
+
+
+class PhaseTracker:
+    """Walks the phases of one exercise and times how long each one lasts"""
+
+    def __init__(self, exercise: CompiledExercise):
+        self.exercise = exercise
+        self.phase = 0
+        self.phase_start_ms = None
+        self.repetitions = 0
+        self.time_errors_reported = set()
+        # Plain-Python copies of the per-phase conditions: called once per frame, on a handful of values
+        num_phases = len(exercise.phase_names)
+        self.phase_transitions = [
+            [(int(exercise.transition_column[i]), float(exercise.transition_low[i]), float(exercise.transition_high[i]))
+             for i in np.flatnonzero(exercise.transition_phase == phase)]
+            for phase in range(num_phases)
+        ]
+        self.phase_time_rules = [
+            [(int(i), float(exercise.time_rule_min_ms[i]), float(exercise.time_rule_max_ms[i]))
+             for i in np.flatnonzero(exercise.time_rule_phase == phase)]
+            for phase in range(num_phases)
+        ]
+
+    def _time_errors(self, elapsed_ms: float, leaving: bool) -> List[str]:
+        errors = []
+        for i, min_ms, max_ms in self.phase_time_rules[self.phase]:
+            if i in self.time_errors_reported:
+                continue
+            if elapsed_ms > max_ms or (leaving and elapsed_ms < min_ms):
+                self.time_errors_reported.add(i)
+                errors.append(self.exercise.time_rule_codes[i])
+        return errors
+
+    def update(self, parameters: np.ndarray, timestamp_ms: float) -> Tuple[bool, List[str]]:
+        """Advance on the current frame; returns (phase_changed, time-rule errors)"""
+        if self.phase_start_ms is None:
+            self.phase_start_ms = timestamp_ms
+
+        elapsed_ms = timestamp_ms - self.phase_start_ms
+        for column, low, high in self.phase_transitions[self.phase]:
+            if not low <= parameters[column] <= high:
+                return False, self._time_errors(elapsed_ms, leaving=False)
+
+        errors = self._time_errors(elapsed_ms, leaving=True)
+        last_phase = len(self.exercise.phase_names) - 1
+        self.phase = 0 if self.phase >= last_phase else self.phase + 1
+        if self.phase == last_phase:
+            self.repetitions += 1
+        self.phase_start_ms = timestamp_ms
+        self.time_errors_reported.clear()
+        return True, errors
@@ -0,0 +1,67 @@
+"""Per-frame versus micro-batched validation across many concurrent sessions.
+
+    python -m benchmarks.batch_benchmark --sessions 256 --frames 300
+"""
+import argparse
+import time
+
+import numpy as np  # type: ignore
+
+from app.batching import validate_batch
+from app.session import Session
+from app.validator import compile_exercise
+from benchmarks.synthetic import load_generator, load_rules_fixture, synthetic_sequence
+
+
+def make_sessions(exercise, count):
+    return [Session(f"session-{i}", exercise, landmark_filter="none") for i in range(count)]
+
+
+def run_direct(exercise, streams, timestamps_ms):
+    sessions = make_sessions(exercise, len(streams))
+    start = time.perf_counter()
+    for t, timestamp_ms in enumerate(timestamps_ms):
+        for session, stream in zip(sessions, streams):
+            session.process(stream[t], timestamp_ms)
+    return time.perf_counter() - start
+
+
+def run_batched(exercise, streams, timestamps_ms, batch_size):
+    sessions = make_sessions(exercise, len(streams))
+    frames = np.empty((batch_size, 33, 3), dtype=np.float32)
+    start = time.perf_counter()
+    for t, timestamp_ms in enumerate(timestamps_ms):
+        for first in range(0, len(sessions), batch_size):
+            group = sessions[first:first + batch_size]
+            for i, session in enumerate(group):
+                session.record(streams[first + i][t], timestamp_ms)
+                frames[i] = session.history.latest()
+            validate_batch(exercise, frames[:len(group)], group, [timestamp_ms] * len(group))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batched validation benchmark")
+    parser.add_argument("--sessions", type=int, default=128, help="Concurrent sessions")
+    parser.add_argument("--frames", type=int, default=300, help="Frames per session")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32, 64, 128], help="Frames per batch")
+    args = parser.parse_args()
+
+    exercise = compile_exercise(load_rules_fixture(1))
+    timestamps_ms, _, noisy = synthetic_sequence(load_generator(), "TRUNK_FLEXION", repetitions=4)
+    timestamps_ms = timestamps_ms[:args.frames]
+    # Every session replays the same recording from a different starting point
+    streams = [np.roll(noisy, -i * 7, axis=0)[:args.frames] for i in range(args.sessions)]
+    total_frames = args.sessions * len(timestamps_ms)
+
+    elapsed = run_direct(exercise, streams, timestamps_ms)
+    print(f"{'Mode':<12} {'frames/s':>12} {'us/frame':>10}")
+    print("-" * 36)
+    print(f"{'per-frame':<12} {total_frames / elapsed:>12.0f} {elapsed / total_frames * 1e6:>10.2f}")
+    for batch_size in args.batch_sizes:
+        elapsed = run_batched(exercise, streams, timestamps_ms, batch_size)
+        print(f"{f'batch={batch_size}':<12} {total_frames / elapsed:>12.0f} {elapsed / total_frames * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
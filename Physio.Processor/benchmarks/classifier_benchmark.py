@@ -0,0 +1,135 @@
+"""Throughput of the is_correct / error_type classifiers on HybridPhysioDatasetGenerator data.
+
+    python -m benchmarks.classifier_benchmark --samples 400 --batch-sizes 1 16 64 256
+
+Trains a logistic regression on the raw coordinates and a random forest on the
+feature columns (scikit-learn, plus skl2onnx for the ONNX rows when installed),
+saves them as MODELS_DIR bundles in a temporary directory, loads them through
+ModelCache and times the served predict path against the estimator's own
+predict_proba at each batch size.
+"""
+import argparse
+import json
+import os
+import pickle
+import tempfile
+import time
+
+import numpy as np  # type: ignore
+
+from app.classifier import ClassifierModel, ModelCache, model_inputs
+from app.validator import compile_exercise
+from benchmarks.synthetic import FIXTURE_EXERCISES, feature_spec, load_generator, load_rules_fixture
+from benchmarks.validator_benchmark import generate_samples
+
+
+def labelled_frames(generator, exercise_name, samples_per_phase, error_rate, seed, phase_names):
+    """(frames (N, 33, 3), rule phase name per frame, is_correct, error_type) of one fixture exercise"""
+    groups = generate_samples(generator, samples_per_phase, error_rate, seed, [exercise_name])
+    frames = np.concatenate([group[2] for group in groups])
+    phases = [phase_names[min(group[1], len(phase_names) - 1)] for group in groups for _ in range(len(group[2]))]
+    is_correct = np.concatenate([group[3] for group in groups]).astype(bool)
+    error_types = [error_type for group in groups for error_type in group[4]]
+    return frames, phases, is_correct, np.array(error_types)
+
+
+def save_bundle(directory, target, estimator, inputs, phases, onnx=False):
+    bundle = {"classes": estimator.classes_.tolist(), "inputs": inputs, "phases": phases, "features": feature_spec()}
+    os.makedirs(directory, exist_ok=True)
+    if onnx:
+        from skl2onnx import to_onnx  # type: ignore
+
+        width = estimator.n_features_in_
+        model = to_onnx(estimator, np.zeros((1, width), dtype=np.float32), options={"zipmap": False})
+        with open(os.path.join(directory, f"{target}.onnx"), "wb") as f:
+            f.write(model.SerializeToString())
+        with open(os.path.join(directory, f"{target}.json"), "w") as f:
+            json.dump(bundle, f)
+        return
+    with open(os.path.join(directory, f"{target}.pkl"), "wb") as f:
+        pickle.dump({**bundle, "estimator": estimator}, f)
+
+
+def throughput(predict, frames, phases, batch_size, repeat):
+    """Best-of-repeat frames per second over all frames, batch_size frames per predict(frames, phases) call"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for first in range(0, len(frames), batch_size):
+            predict(frames[first:first + batch_size], phases[first:first + batch_size])
+        best = min(best, time.perf_counter() - start)
+    return len(frames) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classifier inference benchmark")
+    parser.add_argument("--samples", type=int, default=400, help="Samples per phase, half used for training")
+    parser.add_argument("--error-rate", type=float, default=0.35, help="Fraction of incorrect samples")
+    parser.add_argument("--seed", type=int, default=7, help="Dataset seed")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 64, 256], help="Frames per call")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes per measurement (best is kept)")
+    args = parser.parse_args()
+
+    from sklearn.ensemble import RandomForestClassifier  # type: ignore
+    from sklearn.linear_model import LogisticRegression  # type: ignore
+    from sklearn.pipeline import make_pipeline  # type: ignore
+    from sklearn.preprocessing import StandardScaler  # type: ignore
+
+    exercise_name, exercise_id = next(iter(FIXTURE_EXERCISES.items()))
+    phase_names = compile_exercise(load_rules_fixture(exercise_id)).phase_names
+    frames, phases, is_correct, error_types = labelled_frames(load_generator(), exercise_name, args.samples,
+                                                              args.error_rate, args.seed, phase_names)
+    order = np.random.default_rng(args.seed).permutation(len(frames))
+    train, test = order[:len(order) // 2], order[len(order) // 2:]
+
+    candidates = [
+        ("logistic", "is_correct", ["phase", "landmarks"],
+         make_pipeline(StandardScaler(), LogisticRegression(max_iter=2000)), False),
+        ("forest", "error_type", ["phase", "features"],
+         RandomForestClassifier(n_estimators=50, max_depth=10, random_state=0), False),
+    ]
+    try:
+        import skl2onnx  # type: ignore  # noqa: F401
+        import onnxruntime  # type: ignore  # noqa: F401
+        candidates.append(("logistic-onnx", "is_correct", ["phase", "landmarks"],
+                           make_pipeline(StandardScaler(), LogisticRegression(max_iter=2000)), True))
+    except ImportError:
+        print("skl2onnx/onnxruntime not installed: skipping ONNX")
+
+    print(f"{exercise_name} (exercise {exercise_id}): {len(train)} training / {len(test)} test frames\n")
+    header = f"{'Model':<15} {'Backend':<10} {'Accuracy':>9} " + " ".join(f"{f'b={b} rows/s':>14}" for b in args.batch_sizes)
+    print(header)
+    print("-" * len(header))
+
+    features = feature_spec()
+    test_frames = frames[test]
+    test_phases = [phases[i] for i in test]
+    for version, (name, target, inputs, estimator, onnx) in enumerate(candidates, 1):
+        labels = is_correct if target == "is_correct" else error_types
+        # The served code builds the training matrix too, so training and serving inputs can't drift apart
+        unfitted = ClassifierModel(exercise_id, version, target, "none", [], inputs, None, phase_names,
+                                   np.array(features["angle_triplets"], dtype=np.intp),
+                                   np.array(features["symmetry_pairs"], dtype=np.intp),
+                                   np.array(features["distance_pairs"], dtype=np.intp))
+        estimator.fit(model_inputs(unfitted, frames[train], [phases[i] for i in train]), labels[train])
+
+        with tempfile.TemporaryDirectory() as models_dir:
+            save_bundle(os.path.join(models_dir, str(exercise_id), str(version)), target, estimator, inputs,
+                        phase_names, onnx=onnx)
+            cache = ModelCache(models_dir)
+            cache.refresh()
+            model = cache.get(exercise_id, target)
+
+            predicted, _ = model.predict(test_frames, test_phases)
+            accuracy = np.mean(np.asarray(model.classes)[predicted] == labels[test])
+            paths = [(model.backend, model.predict)]
+            if not onnx:
+                paths.append(("sklearn", lambda batch, phase_names: estimator.predict_proba(
+                    model_inputs(model, batch, phase_names))))
+            for backend, predict in paths:
+                rates = [throughput(predict, test_frames, test_phases, b, args.repeat) for b in args.batch_sizes]
+                print(f"{name:<15} {backend:<10} {accuracy:>9.3f} " + " ".join(f"{rate:>14,.0f}" for rate in rates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Cost and effect of the landmark smoothing filters on synthetic sessions.
+
+    python -m benchmarks.filter_benchmark --repetitions 20
+"""
+import argparse
+import time
+
+import numpy as np  # type: ignore
+
+from app.filters import FILTERS
+from benchmarks.synthetic import load_generator, synthetic_sequence
+
+
+def rms(values: np.ndarray) -> float:
+    return float(np.sqrt(np.mean(np.square(values[..., :2]))))
+
+
+def run_filter(name: str, timestamps_ms, noisy):
+    landmark_filter = FILTERS[name]()
+    output = np.empty_like(noisy)
+    durations = np.empty(len(noisy))
+    for i, (frame, timestamp_ms) in enumerate(zip(noisy, timestamps_ms)):
+        start = time.perf_counter_ns()
+        output[i] = landmark_filter(frame, timestamp_ms)
+        durations[i] = time.perf_counter_ns() - start
+    return output, durations / 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Landmark smoothing filter benchmark")
+    parser.add_argument("--repetitions", type=int, default=10, help="Repetitions per exercise")
+    parser.add_argument("--fps", type=float, default=30.0, help="Frames per second of the synthetic stream")
+    parser.add_argument("--seed", type=int, default=42, help="Noise seed")
+    args = parser.parse_args()
+
+    generator = load_generator()
+
+    print(f"{'Exercise':<20} {'Filter':<10} {'us/frame':>9} {'p99 us':>8} {'error':>8} {'jitter':>8}")
+    print("-" * 68)
+    for exercise_id in generator.exercise_definitions:
+        timestamps_ms, clean, noisy = synthetic_sequence(
+            generator, exercise_id, fps=args.fps, repetitions=args.repetitions, seed=args.seed
+        )
+        # Jitter: RMS of the second difference, which is ~0 for the clean interpolated motion
+        print(f"{exercise_id:<20} {'none':<10} {0:>9.2f} {0:>8.2f} "
+              f"{rms(noisy - clean):>8.5f} {rms(np.diff(noisy, n=2, axis=0)):>8.5f}")
+        for name in FILTERS:
+            filtered, durations = run_filter(name, timestamps_ms, noisy)
+            print(f"{'':<20} {name:<10} {durations.mean():>9.2f} {np.percentile(durations, 99):>8.2f} "
+                  f"{rms(filtered - clean):>8.5f} {rms(np.diff(filtered, n=2, axis=0)):>8.5f}")
+
+
+if __name__ == "__main__":
+    main()
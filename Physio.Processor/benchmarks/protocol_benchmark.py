@@ -0,0 +1,58 @@
+"""Parse cost of binary landmark frames versus the JSON fallback.
+
+    python -m benchmarks.protocol_benchmark --frames 20000
+"""
+import argparse
+import json
+import time
+import uuid
+
+import numpy as np  # type: ignore
+
+from app.history import LandmarkHistory
+from app.protocol import encode_frame, parse_frame
+
+
+def measure(decode, messages, history):
+    start = time.perf_counter_ns()
+    for message in messages:
+        timestamp_ms, landmarks = decode(message)
+        history.append(landmarks[:, :3], timestamp_ms)
+    return (time.perf_counter_ns() - start) / len(messages) / 1000.0
+
+
+def decode_binary(message):
+    header, landmarks = parse_frame(message)
+    return header.timestamp_ms, landmarks
+
+
+def decode_json(message):
+    data = json.loads(message)
+    return float(data["timestamp"]), np.asarray(data["landmarks"], dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Landmark frame parsing benchmark")
+    parser.add_argument("--frames", type=int, default=10000, help="Number of frames to decode")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    session_uuid = uuid.uuid4()
+    frames = rng.random((args.frames, 33, 4), dtype=np.float32)
+    history = LandmarkHistory()
+
+    encodings = {
+        "json": [json.dumps({"timestamp": i * 33.3, "landmarks": frame.round(4).tolist()}) for i, frame in enumerate(frames)],
+        "float32": [encode_frame(session_uuid, i, i * 33.3, frame) for i, frame in enumerate(frames)],
+        "float16": [encode_frame(session_uuid, i, i * 33.3, frame, np.float16) for i, frame in enumerate(frames)],
+    }
+
+    print(f"{'Format':<10} {'bytes/frame':>12} {'us/frame':>10}")
+    print("-" * 34)
+    for name, messages in encodings.items():
+        decode = decode_json if name == "json" else decode_binary
+        print(f"{name:<10} {len(messages[0]):>12} {measure(decode, messages, history):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""CPU cost of session recording against the full frame-handling path of the socket.
+
+    python -m benchmarks.recording_benchmark --sessions 16 --frames 3600 --repeats 7
+
+Every frame goes through what the /ws endpoint does after receiving it: binary
+decoding (parse_frame) and main.handle_frame (sequence check, recording,
+micro-batched validation, index events, JSON reply). Runs with and without
+recording alternate, in reversed order every other repeat. CPU is process time, so the writer thread's encoding and
+file I/O are included, and the writer is drained inside each recorded run.
+
+The recording share is the CPU of the recording calls alone (record_frame,
+record_result, flush and the writer thread) divided by the CPU of a full
+recorded run. The on/off difference is printed as a cross-check; it is the
+same quantity but within run-to-run noise.
+
+Each recording opens a frames file and an index file once, which is paid per
+session, not per frame; sessions default to two minutes at 30 fps so that cost
+is spread the way it is in a real exercise session.
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+import uuid
+
+import numpy as np  # type: ignore
+
+from app.main import handle_frame
+from app.protocol import encode_frame, parse_frame
+from app.recorder import RecordingWriter, SessionRecorder
+from app.session import Session
+from app.validator import compile_exercise
+from benchmarks.synthetic import load_generator, load_rules_fixture, synthetic_sequence
+
+RECORDING_BUDGET = 0.01
+
+
+def make_messages(streams, timestamps_ms):
+    """Binary float16 frames, as sent by the client, per session"""
+    messages = []
+    for stream in streams:
+        session_uuid = uuid.uuid4()
+        frames = np.ones((len(stream), 33, 4), dtype=np.float16)
+        frames[:, :, :3] = stream
+        messages.append((session_uuid, [
+            encode_frame(session_uuid, sequence, timestamp_ms, frames[sequence], np.float16)
+            for sequence, timestamp_ms in enumerate(timestamps_ms)
+        ]))
+    return messages
+
+
+async def run_session(session, messages):
+    for message in messages:
+        header, landmarks = parse_frame(message)
+        await handle_frame(session, landmarks, header.sequence, header.timestamp_ms)
+
+
+async def run_all(exercise, messages, directory):
+    """One coroutine per session, as concurrent sockets; returns process CPU seconds"""
+    writer = RecordingWriter() if directory else None
+    sessions = []
+    for session_uuid, _ in messages:
+        session = Session(str(session_uuid), exercise, landmark_filter="none")
+        if writer is not None:
+            session.recording = SessionRecorder(writer, directory, str(session_uuid), exercise.exercise_id)
+        sessions.append(session)
+
+    start = time.process_time()
+    await asyncio.gather(*(run_session(session, frames) for session, (_, frames) in zip(sessions, messages)))
+    if writer is not None:
+        for session in sessions:
+            session.recording.close()
+        writer.stop()
+    return time.process_time() - start
+
+
+def recording_only(exercise_id, messages, directory):
+    """CPU of the recording calls alone on the same frames (event loop side plus writer thread).
+
+    Calls are made as in handle_frame, with a phase change every 30 frames.
+    """
+    calls = [
+        [(landmarks, header.timestamp_ms, i % 30 == 0, i // 150)
+         for i, (header, landmarks) in enumerate(map(parse_frame, frames))]
+        for _, frames in messages
+    ]
+    writer = RecordingWriter()
+    recorders = [SessionRecorder(writer, directory, str(session_uuid), exercise_id) for session_uuid, _ in messages]
+    start = time.process_time()
+    for recorder, frames in zip(recorders, calls):
+        for landmarks, timestamp_ms, phase_changed, repetitions in frames:
+            recorder.record_frame(landmarks, timestamp_ms)
+            if phase_changed:
+                recorder.record_result(0, phase_changed, repetitions, timestamp_ms)
+    for recorder in recorders:
+        recorder.close()
+    writer.stop()
+    return time.process_time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recording cost benchmark")
+    parser.add_argument("--sessions", type=int, default=16, help="Concurrent sessions")
+    parser.add_argument("--frames", type=int, default=3600, help="Frames per session")
+    parser.add_argument("--repeats", type=int, default=7, help="Alternating runs per mode (medians are reported)")
+    args = parser.parse_args()
+
+    exercise = compile_exercise(load_rules_fixture(1))
+    timestamps_ms, _, noisy = synthetic_sequence(load_generator(), "TRUNK_FLEXION", repetitions=4)
+    # Longer sessions repeat the synthetic repetitions
+    cycle = np.arange(args.frames) % len(noisy)
+    timestamps_ms = np.arange(args.frames) * (timestamps_ms[1] - timestamps_ms[0])
+    streams = [np.roll(noisy, -i * 7, axis=0)[cycle] for i in range(args.sessions)]
+    messages = make_messages(streams, timestamps_ms)
+    total_frames = args.sessions * len(timestamps_ms)
+
+    off, on, alone = [], [], []
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run_all(exercise, messages, None))  # warm-up
+        runs = [
+            (off, lambda repeat: asyncio.run(run_all(exercise, messages, None))),
+            (on, lambda repeat: asyncio.run(run_all(exercise, messages, f"{directory}/on-{repeat}"))),
+            (alone, lambda repeat: recording_only(exercise.exercise_id, messages, f"{directory}/alone-{repeat}")),
+        ]
+        for repeat in range(args.repeats):
+            # Later runs in the process are slower; reversing the order keeps that out of the difference
+            for results, run in (runs if repeat % 2 == 0 else runs[::-1]):
+                results.append(run(repeat))
+
+    per_frame = {name: statistics.median(runs) / total_frames * 1e6 for name, runs in
+                 (("off", off), ("on", on), ("alone", alone))}
+    share = per_frame["alone"] / per_frame["on"]
+    print(f"{args.sessions} sessions x {len(timestamps_ms)} frames, median of {args.repeats} runs (CPU us/frame)")
+    print(f"{'frame handling, recording off':<36} {per_frame['off']:>8.2f}")
+    print(f"{'frame handling, recording on':<36} {per_frame['on']:>8.2f}")
+    print(f"{'recording calls + writer thread':<36} {per_frame['alone']:>8.2f}")
+    print(f"Recording share: {share:.2%} (budget {RECORDING_BUDGET:.0%}: "
+          f"{'within' if share <= RECORDING_BUDGET else 'OVER'}); "
+          f"on/off difference {per_frame['on'] / per_frame['off'] - 1:+.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Synthetic landmark data from Physio.Dataset's HybridPhysioDatasetGenerator"""
+import importlib.util
+import json
+import random
+import sys
+from pathlib import Path
+
+import numpy as np  # type: ignore
+
+from app.models import NUM_LANDMARKS
+
+DATASET_APP = Path(__file__).resolve().parents[2] / "Physio.Dataset" / "app.py"
+
+
+def load_generator_module():
+    """Import Physio.Dataset/app.py under its own name (it would clash with the app package)"""
+    # Its sibling modules (dataset_stats, features) are imported by plain name
+    if str(DATASET_APP.parent) not in sys.path:
+        sys.path.append(str(DATASET_APP.parent))
+    spec = importlib.util.spec_from_file_location("physio_dataset", DATASET_APP)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_generator():
+    return load_generator_module().HybridPhysioDatasetGenerator()
+
+
+def feature_spec() -> dict:
+    """Landmark index triplets/pairs of Physio.Dataset's feature columns, in a classifier bundle's "features" form"""
+    load_generator_module()
+    import features  # type: ignore
+
+    return {
+        "angle_triplets": [list(triplet) for triplet in features.ANGLE_TRIPLETS.values()],
+        "symmetry_pairs": [list(pair) for pair in features.SYMMETRY_PAIRS.values()],
+        "distance_pairs": [list(pair) for pair in features.DISTANCE_PAIRS.values()],
+    }
+
+
+def to_frame(flat_landmarks) -> np.ndarray:
+    """66 generator coordinates -> (33, 3) float32 frame with z = 0"""
+    frame = np.zeros((NUM_LANDMARKS, 3), dtype=np.float32)
+    frame[:, :2] = np.asarray(flat_landmarks, dtype=np.float32).reshape(NUM_LANDMARKS, 2)
+    return frame
+
+
+def synthetic_sequence(generator, exercise_id: str, fps: float = 30.0, seconds_per_phase: float = 1.0,
+                       repetitions: int = 1, seed: int = 0):
+    """Interpolated walk through the phases of an exercise.
+
+    Returns (timestamps_ms, clean, noisy) where clean/noisy are (T, 33, 3) and
+    the noise comes from the generator's add_realistic_noise.
+    """
+    random.seed(seed)
+    base = generator.generate_base_landmarks()
+    phases = generator.exercise_definitions[exercise_id]["phases"]
+    poses = [np.asarray(generator.modify_landmarks_for_exercise_phase(base, exercise_id, phase)) for phase in phases]
+    poses = poses * repetitions
+
+    steps = max(int(fps * seconds_per_phase), 1)
+    clean_flat = []
+    for start, end in zip(poses, poses[1:] + poses[-1:]):
+        for step in range(steps):
+            clean_flat.append(start + (end - start) * (step / steps))
+
+    noisy_flat = [generator.add_realistic_noise(list(frame)) for frame in clean_flat]
+    clean = np.stack([to_frame(frame) for frame in clean_flat])
+    noisy = np.stack([to_frame(frame) for frame in noisy_flat])
+    timestamps_ms = np.arange(len(clean), dtype=np.float64) * (1000.0 / fps)
+    return timestamps_ms, clean, noisy
+
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+# Rules fixture of each dataset exercise. Exercise 1 is seeded (Physio.Scripts/database/seeder.sql) and
+# describes a seated trunk flexion rather than the generator's standing pose, so the two do not fully
+# agree; 101-104 exist only here, per-phase angle bands fitted to the generator's reference poses.
+FIXTURE_EXERCISES = {
+    "TRUNK_FLEXION": 1,
+    "SHOULDER_ABDUCTION": 101,
+    "LEG_RAISE": 102,
+    "HIP_FLEXION": 103,
+    "KNEE_EXTENSION": 104,
+}
+
+
+def load_rules_fixture(exercise_id: int) -> dict:
+    """get_exercise_rules output of an exercise, as exported to benchmarks/fixtures"""
+    with open(FIXTURES / f"exercise_{exercise_id}_rules.json", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,400 @@
+"""Accuracy and throughput of the frame validator on a seeded HybridPhysioDatasetGenerator dataset.
+
+    python -m benchmarks.validator_benchmark --samples 200 --output results.json
+    python -m benchmarks.validator_benchmark --baseline-ref HEAD~1
+    python -m benchmarks.validator_benchmark --baseline results.json
+
+Frames go through the path of the socket: Session.process (process_frame with
+batching off) one frame at a time, or process_frame and a MicroBatcher with as
+many concurrent sessions as frames per batch. Each labelled sample is validated
+in its expected phase (dataset phases map to rule phases by order); samples are
+independent poses rather than a movement, so the phase trackers are pinned. A
+sample is predicted incorrect when any position rule fires, which gives a
+confusion matrix per (exercise_id, expected_phase).
+
+Rules and generator do not agree everywhere, and the report says where: cells
+whose noiseless correct pose already breaks a rule, cells without position
+rules, and incorrect samples whose error type leaves the pose unchanged (the
+label alone says incorrect, so no landmark rule can see it).
+
+Throughput is the median over repeated passes of frames per CPU second, leaving
+out session creation and the batcher's flush timer. --baseline-ref imports the
+app package of a git revision next to this one and the two take turns group by
+group in the same process, so load on a shared machine hits them alike; a mode
+regresses when the median ratio of paired passes drops by more than the
+tolerance (on identical code it stays within a few percent). A
+--baseline JSON file comes from another process: its throughput is shown, but
+only accuracy is checked against it. Any regression exits with status 1.
+"""
+import argparse
+import asyncio
+import importlib
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from types import ModuleType
+from typing import Dict, Optional
+
+import numpy as np  # type: ignore
+
+from benchmarks.synthetic import FIXTURE_EXERCISES, load_generator, load_rules_fixture, to_frame
+
+FRAME_MS = 1000.0 / 30
+PROCESSOR_ROOT = Path(__file__).resolve().parents[1]
+
+
+@dataclass
+class Target:
+    """One version of the app package and the fixture exercises compiled by it"""
+    name: str
+    batching: ModuleType
+    session: ModuleType
+    validator: ModuleType
+    exercises: Dict[str, object]
+
+
+def import_app_modules(root: Optional[str] = None):
+    """batching, session and validator of this tree, or separate copies imported from the app package under root"""
+    names = ("app.batching", "app.session", "app.validator")
+    if root is None:
+        return [importlib.import_module(name) for name in names]
+    current = {name: sys.modules.pop(name) for name in list(sys.modules) if name == "app" or name.startswith("app.")}
+    # app is a namespace package: pinned to the copy, its modules import each other from there
+    package = sys.modules["app"] = ModuleType("app")
+    package.__path__ = [str(Path(root) / "app")]
+    try:
+        return [importlib.import_module(name) for name in names]
+    finally:
+        for name in [name for name in sys.modules if name == "app" or name.startswith("app.")]:
+            del sys.modules[name]
+        sys.modules.update(current)
+
+
+def load_target(name: str, root: Optional[str] = None) -> Target:
+    batching, session, validator = import_app_modules(root)
+    exercises = {exercise_id: validator.compile_exercise(load_rules_fixture(fixture_id))
+                 for exercise_id, fixture_id in FIXTURE_EXERCISES.items()}
+    return Target(name, batching, session, validator, exercises)
+
+
+def export_app(ref: str, directory: str):
+    """Extract the app package of Physio.Processor at a git revision into directory"""
+    toplevel, prefix = subprocess.run(["git", "rev-parse", "--show-toplevel", "--show-prefix"], cwd=PROCESSOR_ROOT,
+                                      check=True, capture_output=True, text=True).stdout.split("\n")[:2]
+    # git archive only takes a subtree from the top of the work tree
+    archive = subprocess.run(["git", "archive", f"{ref}:{prefix}", "app"], cwd=toplevel, check=True,
+                             capture_output=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+
+
+def generate_samples(generator, samples_per_phase: int, error_rate: float, seed: int, exercise_ids=FIXTURE_EXERCISES):
+    """Seeded labelled frames of the given dataset exercises, by default every fixture exercise.
+
+    Returns a list of (exercise_id, phase_index, frames (N, 33, 3), is_correct (N,), error_types)
+    """
+    random.seed(seed)
+    groups = []
+    for exercise_id in exercise_ids:
+        phases = generator.exercise_definitions[exercise_id]["phases"]
+        for phase_index, phase in enumerate(phases):
+            frames, labels, error_types = [], [], []
+            for _ in range(samples_per_phase):
+                sample = generator.generate_sample(exercise_id, phase, random.random() >= error_rate)
+                frames.append(to_frame([sample[f"landmark_{i // 2}_{'xy'[i % 2]}"] for i in range(66)]))
+                labels.append(sample["is_correct"])
+                error_types.append(sample["error_type"])
+            groups.append((exercise_id, phase_index, np.stack(frames), np.array(labels), error_types))
+    return groups
+
+
+def reference_notes(generator, target: Target, groups):
+    """Per group: its position rules, the rules its noiseless correct pose breaks and its label-only error types"""
+    notes = []
+    for exercise_id, phase_index, _, _, _ in groups:
+        exercise = target.exercises[exercise_id]
+        phase = generator.exercise_definitions[exercise_id]["phases"][phase_index]
+        correct, _ = generator.generate_landmarks(exercise_id, phase, True)
+        parameters = target.validator.compute_parameters(to_frame(correct), exercise)
+        violated = target.validator.position_errors(parameters, phase_index, exercise)
+        notes.append({
+            "position_rules": int(exercise.rule_phase_mask[:, phase_index].sum()),
+            "reference_violations": sorted({exercise.rule_codes[i] for i in np.flatnonzero(violated)}),
+            "label_only_error_types": [
+                error_type for error_type in generator.error_types
+                if generator.generate_landmarks(exercise_id, phase, False, error_type)[0] == correct
+            ],
+        })
+    return notes
+
+
+def make_session(target: Target, exercise, phase_index, name):
+    """Session kept in the expected phase of its samples"""
+    session = target.session.Session(name, exercise, landmark_filter="none")
+    session.tracker.phase = phase_index
+    session.tracker.update = lambda parameters, timestamp_ms: (False, [])
+    return session
+
+
+def run_single(target: Target, exercise, frames, phase_index):
+    """One Session.process call per frame, as a session without batching does.
+
+    Returns (flags, latencies_ns, CPU seconds of the frames).
+    """
+    session = make_session(target, exercise, phase_index, "single")
+    position_codes = set(exercise.rule_codes)
+    flags = np.empty(len(frames), dtype=bool)
+    latencies = np.empty(len(frames), dtype=np.int64)
+    cpu_start = time.process_time()
+    for i, frame in enumerate(frames):
+        start = time.perf_counter_ns()
+        result = session.process(frame, i * FRAME_MS)
+        latencies[i] = time.perf_counter_ns() - start
+        flags[i] = not position_codes.isdisjoint(result.errors)
+    return flags, latencies, time.process_time() - cpu_start
+
+
+async def submit_frames(process_frame, session, frames, indices, position_codes, flags, latencies):
+    for i in indices:
+        start = time.perf_counter_ns()
+        result = await process_frame(session, frames[i], i * FRAME_MS)
+        latencies[i] = time.perf_counter_ns() - start
+        flags[i] = not position_codes.isdisjoint(result.errors)
+
+
+def run_batched(target: Target, exercise, frames, phase_index, batch_size):
+    """batch_size concurrent sessions sharing the frames through process_frame.
+
+    Latencies include waiting for the batch, and for the flush timer when the
+    last round of frames does not fill it.
+    """
+    sessions = [make_session(target, exercise, phase_index, f"batch-{i}") for i in range(min(batch_size, len(frames)))]
+    batching = target.batching
+    batching.batchers[(exercise.exercise_id, exercise.version)] = batching.MicroBatcher(exercise, max_frames=len(sessions))
+    position_codes = set(exercise.rule_codes)
+    flags = np.empty(len(frames), dtype=bool)
+    latencies = np.empty(len(frames), dtype=np.int64)
+
+    async def run():
+        await asyncio.gather(*(
+            submit_frames(batching.process_frame, session, frames, range(i, len(frames), len(sessions)),
+                          position_codes, flags, latencies)
+            for i, session in enumerate(sessions)
+        ))
+
+    cpu_start = time.process_time()
+    asyncio.run(run())
+    return flags, latencies, time.process_time() - cpu_start
+
+
+def peak_memory(run, *args):
+    """Peak bytes allocated by one untimed pass (tracemalloc distorts timings)"""
+    tracemalloc.start()
+    run(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def measure(mode, run, targets, groups, repeat, *args):
+    """Median throughput of `repeat` passes over every group per target; latency percentiles span all passes.
+
+    Targets take turns group by group, in alternating order, so bursts of load
+    on the machine fall on all of them alike.
+    Returns {target name: (result, flags per group)}.
+    """
+    throughputs = {target.name: [] for target in targets}
+    latencies = {target.name: [] for target in targets}
+    flags = {target.name: [] for target in targets}
+    frames_run = sum(len(frames) for _, _, frames, _, _ in groups)
+    for repetition in range(repeat):
+        elapsed = dict.fromkeys(throughputs, 0.0)
+        for index, (exercise_id, phase_index, frames, _, _) in enumerate(groups):
+            for target in (targets if (repetition + index) % 2 == 0 else targets[::-1]):
+                group_flags, group_latencies, group_elapsed = run(target, target.exercises[exercise_id], frames,
+                                                                  phase_index, *args)
+                if repetition == 0:
+                    flags[target.name].append(group_flags)
+                latencies[target.name].append(group_latencies)
+                elapsed[target.name] += group_elapsed
+        for name, seconds in elapsed.items():
+            throughputs[name].append(frames_run / seconds)
+
+    exercise_id, phase_index, frames = groups[0][:3]
+    measured = {}
+    for target in targets:
+        latencies_us = np.concatenate(latencies[target.name]) / 1000.0
+        result = {
+            "mode": mode,
+            "frames": frames_run,
+            "frames_per_second": statistics.median(throughputs[target.name]),
+            "frames_per_second_runs": throughputs[target.name],
+            "latency_us": {f"p{q}": float(np.percentile(latencies_us, q)) for q in (50, 90, 95, 99)},
+            "peak_memory_bytes": peak_memory(run, target, target.exercises[exercise_id], frames, phase_index, *args),
+        }
+        measured[target.name] = (result, flags[target.name])
+    return measured
+
+
+def confusion(exercises, groups, flags_by_group, notes):
+    """Predicted incorrect (any position rule fired) versus the is_correct label"""
+    matrices = {}
+    for (exercise_id, phase_index, _, labels, error_types), flags, note in zip(groups, flags_by_group, notes):
+        wrong = ~labels
+        label_only = np.isin(error_types, note["label_only_error_types"]) & wrong
+        key = f"{exercise_id}/{exercises[exercise_id].phase_names[phase_index]}"
+        matrices[key] = {
+            "true_positive": int((flags & wrong).sum()),
+            "false_positive": int((flags & ~wrong).sum()),
+            "true_negative": int((~flags & ~wrong).sum()),
+            "false_negative": int((~flags & wrong).sum()),
+            "label_only": int(label_only.sum()),
+            "label_only_flagged": int((label_only & flags).sum()),
+            "detected_by_error_type": {
+                error_type: int(sum(f for f, e in zip(flags, error_types) if e == error_type))
+                for error_type in sorted(set(error_types) - {"NONE"})
+            },
+            **note,
+        }
+    return matrices
+
+
+def accuracy(matrices, detectable_only: bool = False) -> float:
+    """Share of samples classified right; detectable_only leaves out the label-only samples"""
+    correct = sum(m["true_positive"] + m["true_negative"] for m in matrices.values())
+    total = sum(m["true_positive"] + m["true_negative"] + m["false_positive"] + m["false_negative"]
+                for m in matrices.values())
+    if detectable_only:
+        correct -= sum(m["label_only_flagged"] for m in matrices.values())
+        total -= sum(m["label_only"] for m in matrices.values())
+    return correct / total if total else 0.0
+
+
+def compare(results, baseline, tolerance: Optional[float] = None):
+    """Print throughput, latency and accuracy against a baseline; returns the regressions.
+
+    Throughput is only checked given a tolerance, for a baseline measured in the same
+    passes; the change is then the median ratio of paired passes.
+    """
+    regressions = []
+    baseline_modes = {m["mode"]: m for m in baseline["modes"]}
+    print(f"\n{'Mode':<12} {'frames/s':>12} {'baseline':>12} {'change':>8} {'p95 us':>9} {'baseline':>9}")
+    print("-" * 68)
+    for mode in results["modes"]:
+        reference = baseline_modes.get(mode["mode"])
+        if reference is None:
+            continue
+        if tolerance is None:
+            change = mode["frames_per_second"] / reference["frames_per_second"] - 1.0
+        else:
+            # Passes of the same repetition ran side by side: their ratio cancels the load they shared
+            change = statistics.median(
+                run / reference_run
+                for run, reference_run in zip(mode["frames_per_second_runs"], reference["frames_per_second_runs"])
+            ) - 1.0
+        print(f"{mode['mode']:<12} {mode['frames_per_second']:>12.0f} {reference['frames_per_second']:>12.0f} "
+              f"{change:>+8.1%} {mode['latency_us']['p95']:>9.2f} {reference['latency_us']['p95']:>9.2f}")
+        if tolerance is not None and change < -tolerance:
+            regressions.append(f"{mode['mode']} throughput {change:+.1%}")
+    if tolerance is None:
+        print("Measured in another process: throughput changes include drift of the machine and are not checked")
+    change = results["accuracy"] - baseline["accuracy"]
+    print(f"\nAccuracy {results['accuracy']:.4f} (baseline {baseline['accuracy']:.4f}, {change:+.4f})")
+    if baseline.get("config", results["config"]) != results["config"]:
+        print("Note: the baseline was generated with a different configuration")
+    elif change < 0:
+        regressions.append(f"accuracy {change:+.4f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validator accuracy and throughput benchmark")
+    parser.add_argument("--samples", type=int, default=200, help="Samples per (exercise, phase)")
+    parser.add_argument("--error-rate", type=float, default=0.35, help="Share of incorrect samples")
+    parser.add_argument("--seed", type=int, default=42, help="Dataset seed")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 64, 256], help="Frames per batch")
+    parser.add_argument("--repeat", type=int, default=7, help="Timed passes per mode, the median is kept")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="Compare against a previous JSON result (accuracy only)")
+    parser.add_argument("--baseline-ref", help="Git revision whose app package runs interleaved with this one")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Throughput drop allowed against --baseline-ref")
+    args = parser.parse_args()
+
+    generator = load_generator()
+    groups = generate_samples(generator, args.samples, args.error_rate, args.seed)
+    targets = [load_target("candidate")]
+    if args.baseline_ref:
+        with tempfile.TemporaryDirectory() as directory:
+            export_app(args.baseline_ref, directory)
+            targets.append(load_target("baseline", directory))
+
+    modes = {target.name: [] for target in targets}
+    flags_by_target = {}
+    runs = [("single", run_single, ())] + [(f"batch={size}", run_batched, (size,)) for size in args.batch_sizes]
+    for mode, run, run_args in runs:
+        for name, (result, flags) in measure(mode, run, targets, groups, args.repeat, *run_args).items():
+            modes[name].append(result)
+            # Both paths must agree frame for frame
+            reference = flags_by_target.setdefault(name, flags)
+            assert all(np.array_equal(a, b) for a, b in zip(reference, flags)), f"{name} {mode}"
+
+    notes = reference_notes(generator, targets[0], groups)
+    matrices = confusion(targets[0].exercises, groups, flags_by_target["candidate"], notes)
+    results = {
+        "config": {"samples": args.samples, "error_rate": args.error_rate, "seed": args.seed,
+                   "exercises": dict(FIXTURE_EXERCISES)},
+        "environment": {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine()},
+        "modes": modes["candidate"],
+        "accuracy": accuracy(matrices),
+        "detectable_accuracy": accuracy(matrices, detectable_only=True),
+        "confusion": matrices,
+    }
+    if args.baseline_ref:
+        baseline_matrices = confusion(targets[1].exercises, groups, flags_by_target["baseline"], notes)
+        results["baseline_ref"] = {"ref": args.baseline_ref, "modes": modes["baseline"],
+                                   "accuracy": accuracy(baseline_matrices)}
+
+    print(f"{'Mode':<12} {'frames/s':>12} {'p50 us':>9} {'p95 us':>9} {'p99 us':>9} {'peak KiB':>10}")
+    print("-" * 66)
+    for mode in results["modes"]:
+        latency = mode["latency_us"]
+        print(f"{mode['mode']:<12} {mode['frames_per_second']:>12.0f} {latency['p50']:>9.2f} {latency['p95']:>9.2f} "
+              f"{latency['p99']:>9.2f} {mode['peak_memory_bytes'] / 1024:>10.1f}")
+    print(f"\n{'Exercise/phase':<34} {'TP':>5} {'FP':>5} {'TN':>5} {'FN':>5} {'label':>6} {'rules':>6}  "
+          f"reference pose breaks")
+    print("-" * 96)
+    for key, m in matrices.items():
+        print(f"{key:<34} {m['true_positive']:>5} {m['false_positive']:>5} {m['true_negative']:>5} "
+              f"{m['false_negative']:>5} {m['label_only']:>6} {m['position_rules']:>6}  "
+              f"{', '.join(m['reference_violations']) or '-'}")
+    print("label: incorrect samples whose error type leaves the pose unchanged; rules: position rules of the phase")
+    print(f"\nAccuracy {results['accuracy']:.4f} ({results['detectable_accuracy']:.4f} without label-only samples)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    regressions = []
+    if args.baseline_ref:
+        print(f"\nAgainst {args.baseline_ref}, interleaved in this process:")
+        regressions += compare(results, results["baseline_ref"], args.tolerance)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions += compare(results, json.load(f))
+    if regressions:
+        print("Regressions: " + ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,10 @@ DELETE FROM exercise_phases;
 DELETE FROM exercises;
 DELETE FROM patient;
 
+-- exercise_rules_snapshot and exercise_rules_version are kept: the
+-- deletes above mark the exercises inactive under a new version, which
+-- running Processors pick up, and versions must never go backwards.
+
 -- Reset sequences
 ALTER SEQUENCE exercises_id_seq RESTART WITH 1;
 ALTER SEQUENCE exercise_phases_id_seq RESTART WITH 1;
@@ -91,7 +91,7 @@ CREATE TABLE error_types (
 CREATE TABLE validation_rules (
     id SERIAL PRIMARY KEY,
     exercise_id INTEGER NOT NULL REFERENCES exercises(id) ON DELETE CASCADE,
-    rule_type VARCHAR(50) NOT NULL CHECK (rule_type IN ('angle_check', 'time_check', 'position_check', 'symmetry_check')),
+    rule_type VARCHAR(50) NOT NULL CHECK (rule_type IN ('angle_check', 'time_check', 'position_check', 'symmetry_check', 'motion_check')),
     error_code VARCHAR(50) NOT NULL,
     priority INTEGER NOT NULL DEFAULT 1,
     is_active BOOLEAN DEFAULT true,
@@ -185,6 +185,41 @@ CREATE TABLE repetition_errors (
     UNIQUE(repetition_id, error_code)
 );
 
+-- =========================================================
+-- EXERCISE RULES SNAPSHOT TABLE
+-- =========================================================
+
+-- Precomputed get_exercise_rules JSON, one row per exercise.
+-- version comes from a global counter so readers can ask for
+-- "everything newer than the last version I saw".
+CREATE TABLE exercise_rules_snapshot (
+    exercise_id INTEGER PRIMARY KEY,
+    rules JSONB,
+    is_active BOOLEAN NOT NULL DEFAULT false,
+    version BIGINT NOT NULL,
+    refreshed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Single-row version counter. It is bumped while the snapshot is
+-- refreshed at the end of a transaction and its row lock is held
+-- until commit, so versions become visible in increasing order
+-- (a sequence value, taken before commit, does not).
+CREATE TABLE exercise_rules_version (
+    id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO exercise_rules_version DEFAULT VALUES;
+
+-- Exercises whose rules changed in a still open transaction. Rows
+-- never outlive their transaction: the snapshot refresh at commit
+-- consumes them.
+CREATE UNLOGGED TABLE exercise_rules_dirty (
+    txid BIGINT NOT NULL,
+    exercise_id INTEGER NOT NULL,
+    PRIMARY KEY (txid, exercise_id)
+);
+
 -- =========================================================
 -- ASSIGNMENTS TABLE
 -- =========================================================
@@ -238,4 +273,7 @@ CREATE INDEX idx_validation_rules_exercise_active ON validation_rules(exercise_i
 CREATE INDEX idx_rule_applicable_phases_rule ON rule_applicable_phases(rule_id);
 CREATE INDEX idx_rule_parameters_rule ON rule_parameters(rule_id);
 CREATE INDEX idx_landmark_indices_mapping ON landmark_indices(mapping_id);
-CREATE INDEX idx_landmark_indices_mapping_order ON landmark_indices(mapping_id, index_order);
\ No newline at end of file
+CREATE INDEX idx_landmark_indices_mapping_order ON landmark_indices(mapping_id, index_order);
+
+-- Exercise rules snapshot indexes
+CREATE INDEX idx_exercise_rules_snapshot_version ON exercise_rules_snapshot(version);
\ No newline at end of file
@@ -1,4 +1,10 @@
-CREATE OR REPLACE FUNCTION get_exercise_rules(p_exercise_id INTEGER)
+-- =========================================================
+-- EXERCISE RULES ASSEMBLY
+-- Builds the nested rules JSON from the normalized tables.
+-- Only called when the snapshot is refreshed.
+-- =========================================================
+
+CREATE OR REPLACE FUNCTION build_exercise_rules(p_exercise_id INTEGER)
 RETURNS JSON AS $$
 DECLARE
     result JSON;
@@ -147,4 +153,184 @@ BEGIN
 
     RETURN result;
 END;
-$$ LANGUAGE plpgsql;
\ No newline at end of file
+$$ LANGUAGE plpgsql;
+
+-- =========================================================
+-- EXERCISE RULES SNAPSHOT
+-- =========================================================
+
+-- Next snapshot version. The counter row stays locked until the
+-- calling transaction ends, so a transaction that commits later
+-- always gets a higher version.
+CREATE OR REPLACE FUNCTION next_exercise_rules_version()
+RETURNS BIGINT AS $$
+    UPDATE exercise_rules_version SET version = version + 1 RETURNING version;
+$$ LANGUAGE sql;
+
+-- Rebuilds the snapshot row of one exercise. The row only takes
+-- p_version when the assembled JSON actually changed.
+CREATE OR REPLACE FUNCTION refresh_exercise_rules(p_exercise_id INTEGER, p_version BIGINT)
+RETURNS VOID AS $$
+DECLARE
+    new_rules JSONB;
+BEGIN
+    IF p_exercise_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    new_rules := build_exercise_rules(p_exercise_id)::jsonb;
+
+    INSERT INTO exercise_rules_snapshot AS s (exercise_id, rules, is_active, version)
+    VALUES (p_exercise_id, new_rules, new_rules IS NOT NULL, p_version)
+    ON CONFLICT (exercise_id) DO UPDATE
+        SET rules = EXCLUDED.rules,
+            is_active = EXCLUDED.is_active,
+            version = EXCLUDED.version,
+            refreshed_at = CURRENT_TIMESTAMP
+        WHERE s.rules IS DISTINCT FROM EXCLUDED.rules;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION refresh_all_exercise_rules()
+RETURNS VOID AS $$
+DECLARE
+    exercise_row RECORD;
+    new_version BIGINT;
+BEGIN
+    new_version := next_exercise_rules_version();
+    FOR exercise_row IN SELECT id FROM exercises LOOP
+        PERFORM refresh_exercise_rules(exercise_row.id, new_version);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Reads the precomputed rules of one exercise (NULL when inactive)
+CREATE OR REPLACE FUNCTION get_exercise_rules(p_exercise_id INTEGER)
+RETURNS JSON AS $$
+    SELECT rules::json
+    FROM exercise_rules_snapshot
+    WHERE exercise_id = p_exercise_id AND is_active = true;
+$$ LANGUAGE sql STABLE;
+
+-- Every snapshot row newer than p_version. Deactivated or deleted
+-- exercises are returned with is_active = false so caches can drop them.
+-- A caller ahead of the counter (the database was recreated) gets every
+-- row back so it can reload from scratch.
+CREATE OR REPLACE FUNCTION get_exercise_rules_since(p_version BIGINT DEFAULT 0)
+RETURNS TABLE (exercise_id INTEGER, version BIGINT, is_active BOOLEAN, rules JSON) AS $$
+    SELECT s.exercise_id, s.version, s.is_active, s.rules::json
+    FROM exercise_rules_snapshot s
+    WHERE s.version > p_version
+       OR p_version > (SELECT v.version FROM exercise_rules_version v)
+    ORDER BY s.version;
+$$ LANGUAGE sql STABLE;
+
+-- =========================================================
+-- SNAPSHOT REFRESH TRIGGERS
+-- =========================================================
+
+-- Maps a changed row of any rules table to the exercise it belongs to
+CREATE OR REPLACE FUNCTION resolve_rules_exercise_id(p_table TEXT, p_row JSONB)
+RETURNS INTEGER AS $$
+BEGIN
+    CASE p_table
+        WHEN 'exercises' THEN
+            RETURN (p_row->>'id')::INTEGER;
+        WHEN 'phase_transitions' THEN
+            RETURN (SELECT exercise_id FROM exercise_phases WHERE id = (p_row->>'phase_id')::INTEGER);
+        WHEN 'rule_applicable_phases', 'rule_parameters' THEN
+            RETURN (SELECT exercise_id FROM validation_rules WHERE id = (p_row->>'rule_id')::INTEGER);
+        WHEN 'landmark_indices' THEN
+            RETURN (SELECT exercise_id FROM landmark_mappings WHERE id = (p_row->>'mapping_id')::INTEGER);
+        ELSE
+            RETURN (p_row->>'exercise_id')::INTEGER;
+    END CASE;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Marks an exercise for a snapshot refresh when the current transaction commits
+CREATE OR REPLACE FUNCTION mark_exercise_rules_dirty(p_exercise_id INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    IF p_exercise_id IS NOT NULL THEN
+        INSERT INTO exercise_rules_dirty (txid, exercise_id)
+        VALUES (txid_current(), p_exercise_id)
+        ON CONFLICT DO NOTHING;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Row triggers only record which exercises changed; the JSON is
+-- rebuilt once per exercise and transaction, however many rows a
+-- seed or an edit touches.
+CREATE OR REPLACE FUNCTION exercise_rules_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM mark_exercise_rules_dirty(resolve_rules_exercise_id(TG_TABLE_NAME, to_jsonb(OLD)));
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM mark_exercise_rules_dirty(resolve_rules_exercise_id(TG_TABLE_NAME, to_jsonb(NEW)));
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Deferred to commit: refreshes every exercise the transaction marked,
+-- under a single version. Fires once per marked exercise; the first
+-- call consumes all of them and the others find nothing left.
+CREATE OR REPLACE FUNCTION flush_exercise_rules()
+RETURNS TRIGGER AS $$
+DECLARE
+    dirty_ids INTEGER[];
+    new_version BIGINT;
+    dirty_id INTEGER;
+BEGIN
+    WITH consumed AS (
+        DELETE FROM exercise_rules_dirty
+        WHERE txid = txid_current()
+        RETURNING exercise_id
+    )
+    SELECT array_agg(exercise_id ORDER BY exercise_id) INTO dirty_ids FROM consumed;
+
+    IF dirty_ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    new_version := next_exercise_rules_version();
+    FOREACH dirty_id IN ARRAY dirty_ids LOOP
+        PERFORM refresh_exercise_rules(dirty_id, new_version);
+    END LOOP;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    rules_table TEXT;
+BEGIN
+    FOREACH rules_table IN ARRAY ARRAY[
+        'exercises', 'exercise_phases', 'phase_transitions', 'validation_parameters',
+        'error_types', 'validation_rules', 'rule_applicable_phases', 'rule_parameters',
+        'landmark_mappings', 'landmark_indices'
+    ] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_rules_snapshot ON %I', rules_table, rules_table);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%s_rules_snapshot AFTER INSERT OR UPDATE OR DELETE ON %I '
+            'FOR EACH ROW EXECUTE FUNCTION exercise_rules_changed()',
+            rules_table, rules_table
+        );
+    END LOOP;
+END $$;
+
+DROP TRIGGER IF EXISTS trg_exercise_rules_flush ON exercise_rules_dirty;
+CREATE CONSTRAINT TRIGGER trg_exercise_rules_flush
+AFTER INSERT ON exercise_rules_dirty
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE FUNCTION flush_exercise_rules();
+
+-- Initial fill for databases seeded before the triggers existed
+SELECT refresh_all_exercise_rules();
\ No newline at end of file
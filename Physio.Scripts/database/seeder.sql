@@ -55,7 +55,10 @@ INSERT INTO error_types (exercise_id, error_code, error_name, error_category, se
 (1, 'NOT_HOLDING_ENOUGH', 'No mantiene posición', 'time', 3, 'Mantén la posición más tiempo', 'Sostén la flexión al menos 2 segundos'),
 (1, 'HOLDING_TOO_LONG', 'Mantiene posición demasiado', 'time', 1, 'Ya puedes continuar subiendo', 'No mantengas más de 5 segundos'),
 (1, 'ASCENDING_TOO_FAST', 'Ascenso muy rápido', 'time', 2, 'Sube más lentamente', 'El ascenso debe ser controlado'),
-(1, 'ASCENDING_TOO_SLOW', 'Ascenso muy lento', 'time', 1, 'Puedes subir un poco más rápido', 'No excedas 3 segundos');
+(1, 'ASCENDING_TOO_SLOW', 'Ascenso muy lento', 'time', 1, 'Puedes subir un poco más rápido', 'No excedas 3 segundos'),
+
+-- Motion errors
+(1, 'TOO_FAST_MOVEMENT', 'Movimiento brusco', 'safety', 3, 'Muévete de forma más controlada', 'Evita tirones durante el movimiento');
 
 -- Validation rules
 INSERT INTO validation_rules (exercise_id, rule_type, error_code, priority) VALUES
@@ -70,7 +73,10 @@ INSERT INTO validation_rules (exercise_id, rule_type, error_code, priority) VALU
 (1, 'time_check', 'NOT_HOLDING_ENOUGH', 6),
 (1, 'time_check', 'HOLDING_TOO_LONG', 7),
 (1, 'time_check', 'ASCENDING_TOO_FAST', 8),
-(1, 'time_check', 'ASCENDING_TOO_SLOW', 9);
+(1, 'time_check', 'ASCENDING_TOO_SLOW', 9),
+
+-- Motion validation rules
+(1, 'motion_check', 'TOO_FAST_MOVEMENT', 10);
 
 -- Rule applicable phases
 INSERT INTO rule_applicable_phases (rule_id, phase_name) VALUES
@@ -88,7 +94,10 @@ INSERT INTO rule_applicable_phases (rule_id, phase_name) VALUES
 ((SELECT id FROM validation_rules WHERE exercise_id = 1 AND error_code = 'NOT_HOLDING_ENOUGH'), 'BOTTOM_POSITION'),
 ((SELECT id FROM validation_rules WHERE exercise_id = 1 AND error_code = 'HOLDING_TOO_LONG'), 'BOTTOM_POSITION'),
 ((SELECT id FROM validation_rules WHERE exercise_id = 1 AND error_code = 'ASCENDING_TOO_FAST'), 'ASCENDING'),
-((SELECT id FROM validation_rules WHERE exercise_id = 1 AND error_code = 'ASCENDING_TOO_SLOW'), 'ASCENDING');
+((SELECT id FROM validation_rules WHERE exercise_id = 1 AND error_code = 'ASCENDING_TOO_SLOW'), 'ASCENDING'),
+-- Motion validation rules while moving
+((SELECT id FROM validation_rules WHERE exercise_id = 1 AND error_code = 'TOO_FAST_MOVEMENT'), 'DESCENDING'),
+((SELECT id FROM validation_rules WHERE exercise_id = 1 AND error_code = 'TOO_FAST_MOVEMENT'), 'ASCENDING');
 
 -- Rule parameters
 INSERT INTO rule_parameters (rule_id, parameter_key, parameter_value) VALUES
@@ -121,7 +130,11 @@ INSERT INTO rule_parameters (rule_id, parameter_key, parameter_value) VALUES
 ((SELECT id FROM validation_rules WHERE exercise_id = 1 AND error_code = 'ASCENDING_TOO_FAST'), 'phase', 'ASCENDING'),
 
 ((SELECT id FROM validation_rules WHERE exercise_id = 1 AND error_code = 'ASCENDING_TOO_SLOW'), 'max_time_ms', '3000'),
-((SELECT id FROM validation_rules WHERE exercise_id = 1 AND error_code = 'ASCENDING_TOO_SLOW'), 'phase', 'ASCENDING');
+((SELECT id FROM validation_rules WHERE exercise_id = 1 AND error_code = 'ASCENDING_TOO_SLOW'), 'phase', 'ASCENDING'),
+
+-- Motion validation rules: peak landmark speed (normalized units per second) over the last frames
+((SELECT id FROM validation_rules WHERE exercise_id = 1 AND error_code = 'TOO_FAST_MOVEMENT'), 'max_speed', '1.5'),
+((SELECT id FROM validation_rules WHERE exercise_id = 1 AND error_code = 'TOO_FAST_MOVEMENT'), 'window_frames', '5');
 
 -- Landmark mappings
 INSERT INTO landmark_mappings (exercise_id, mapping_type, joint_name, description) VALUES
@@ -1,6 +1,10 @@
 import os
 import argparse
 import asyncio
+import contextlib
+import importlib
+import itertools
+import socket
 import subprocess
 import time
 import json
@@ -8,6 +12,10 @@ import matplotlib.pyplot as plt # type: ignore
 import numpy as np # type: ignore
 from pathlib import Path
 import shutil
+from envelope import pack_batch
+from impairment_proxy import PROFILES, PROXY_PORT_OFFSET
+from timing import percentile
+from transport import client_options, server_environment
 
 SERVERS = {
     "base64": {"port": 8765, "script": "server_base64.py"},
@@ -16,14 +24,37 @@ SERVERS = {
     "stream": {"port": 8768, "script": "server_stream.py"}
 }
 
+# Clients run in-process as libraries, so interpreter and import start-up stay out of the numbers
 CLIENTS = {
-    "base64": {"script": "client_base64.py"},
-    "binary": {"script": "client_binary.py"},
-    "matrix": {"script": "client_matrix.py"},
-    "stream": {"script": "client_stream.py"}
+    "base64": {"module": "client_base64"},
+    "binary": {"module": "client_binary"},
+    "matrix": {"module": "client_matrix"},
+    "stream": {"module": "client_stream"}
 }
 
+# Codecs whose clients accept a batch size / a fragment size
+BATCH_METHODS = {"binary", "stream"}
+FRAGMENT_METHODS = {"stream"}
+
+# Grid explored by --sweep for every knob not given explicitly on the command line
+SWEEP_GRID = {
+    "batch_size": [1, 4, 8],
+    "fragment_size": [4096, 16384, 65536],
+    "clients": [1, 4],
+    "max_size": [1024 * 1024, 16 * 1024 * 1024],
+    "compression": ["deflate", "none"],
+}
+SWEEP_AXES = (*SWEEP_GRID, "network")
+# A server listens once its pose workers have loaded their model
+SERVER_START_SECONDS = 60
+PROXY_START_SECONDS = 10
+
 results = {}
+# Sweep combinations skipped because a message would exceed max_size, with the reason
+infeasible = {}
+image_caches = {}
+# SPIKE_POSE_* settings passed to every server started by this run
+pose_environment = {}
 
 def get_python_command():
     python_commands = ['python3', 'python']
@@ -32,95 +63,173 @@ def get_python_command():
             return cmd
     raise RuntimeError("Python command not found. Ensure Python is installed and in the PATH.")
 
-def start_server(method):
-    print(f"Starting server {method}...")
+def start_server(method, max_size=None, compression=None):
+    details = [f"max_size {max_size}" if max_size else "", f"compression {compression}" if compression else ""]
+    print(f"Starting server {method}..." + "".join(f" ({detail})" for detail in details if detail))
     python_cmd = get_python_command()
-    server_process = subprocess.Popen([python_cmd, SERVERS[method]["script"]])
-    time.sleep(2)
+    environment = {**os.environ, **server_environment(max_size, compression), **pose_environment}
+    server_process = subprocess.Popen([python_cmd, SERVERS[method]["script"]], env=environment)
+    wait_until_listening(server_process, SERVERS[method]["port"], SERVER_START_SECONDS, f"Server {method}")
     return server_process
 
+def wait_until_listening(process, port, timeout, name):
+    """Poll until the process accepts connections on port, reporting a process that exits before it does"""
+    deadline = time.monotonic() + timeout
+    while process.poll() is None and time.monotonic() < deadline:
+        try:
+            socket.create_connection(("localhost", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    if process.poll() is not None:
+        print(f"{name} exited with code {process.returncode}")
+    else:
+        print(f"{name} is not listening on port {port} after {timeout} s")
+
+def start_proxy(method, network):
+    """Impairment proxy in front of a server; clients connect to the WebSocket port + PROXY_PORT_OFFSET"""
+    print(f"Starting {network} network proxy for {method}...")
+    python_cmd = get_python_command()
+    proxy_process = subprocess.Popen([python_cmd, "impairment_proxy.py", "--target", str(SERVERS[method]["port"]),
+                                      "--profile", network])
+    wait_until_listening(proxy_process, SERVERS[method]["port"] + PROXY_PORT_OFFSET, PROXY_START_SECONDS,
+                         f"{network} network proxy for {method}")
+    return proxy_process
+
+def server_uri(method, network=None):
+    port = SERVERS[method]["port"] + (PROXY_PORT_OFFSET if network else 0)
+    return f"ws://localhost:{port}"
+
 def stop_server(server_process):
     server_process.terminate()
     server_process.wait()
 
-async def run_client(method, image_dir, iterations):
-    print(f"Running client {method}...")
+def load_client(method):
+    """Import a client codec as a library, with an encoded-image cache shared by all its runs"""
+    client = importlib.import_module(CLIENTS[method]["module"])
+    client.image_cache = image_caches.setdefault(method, {})
+    return client
+
+def load_images(client, image_dir):
+    """Encode every image of the directory once, in the order the clients send them"""
+    return [client.load_image(img_path) for ext in ['*.jpg', '*.jpeg', '*.png'] for img_path in Path(image_dir).glob(ext)]
+
+def largest_message(method, image_dir, batch_size=None, fragment_size=None):
+    """Bytes of the largest WebSocket message a client sends, or None when the client shrinks oversized images itself"""
+    if method == "matrix":
+        return None
+    if method == "stream":
+        return fragment_size or load_client(method).FRAGMENT_SIZE
+    images = load_images(load_client(method), image_dir)
+    if not images:
+        return None
+    if method == "base64":
+        # Base64 text plus the JSON envelope (sequence, file name)
+        return max(4 * -(-len(image) // 3) for image in images) + 256
+    step = batch_size or 1
+    if step == 1:
+        return max(len(image) for image in images)
+    return max(len(pack_batch(images[first:first + step])) for first in range(0, len(images), step))
+
+def aggregate(summaries, metrics, duration):
+    """Combine the summaries of concurrent clients over the wall time of the whole run"""
+    images = sum(s["Total images sent"] for s in summaries)
+    data_mb = sum(s["Total data sent"] for s in summaries)
+    return {
+        "Total images sent": images,
+        "Total data sent": data_mb,
+        "Average transmission time": sum(s["Average transmission time"] * s["Total images sent"]
+                                         for s in summaries) / images,
+        "P99 transmission time": percentile([t for m in metrics for t in m["transmission_times"]], 0.99) * 1000,
+        "Total time": duration,
+        "Throughput": images / duration,
+        "Bandwidth": data_mb / duration,
+    }
+
+async def run_client(method, image_dir, iterations, batch_size=None, fragment_size=None, clients=1,
+                     max_size=None, compression=None, network=None):
+    """Run `clients` concurrent copies of a client codec in this process"""
+    details = [f"batch size {batch_size}" if batch_size else "", f"fragment size {fragment_size}" if fragment_size else "",
+               f"{clients} clients" if clients > 1 else "", f"{network} network" if network else ""]
+    print(f"Running client {method}..." + "".join(f" ({detail})" for detail in details if detail))
     
-    python_cmd = get_python_command()
-    cmd = [python_cmd, CLIENTS[method]["script"], image_dir, "--iterations", str(iterations)]
+    client = load_client(method)
+    client.connect_options = client_options(max_size, compression)
+    client.server_uri = server_uri(method, network)
+    options = {}
+    if batch_size:
+        options["batch_size"] = batch_size
+    if fragment_size:
+        options["fragment_size"] = fragment_size
     
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
+    # Encode every image once up front, outside the measurement
+    load_images(client, image_dir)
     
-    stdout, stderr = await process.communicate()
+    # Per-image client output is discarded rather than buffered
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        metrics = [client.new_metrics() for _ in range(clients)]
+        start = time.perf_counter()
+        summaries = await asyncio.gather(*(
+            client.benchmark(image_dir, iterations, metrics=client_metrics, **options) for client_metrics in metrics
+        ))
+        duration = time.perf_counter() - start
     
-    if process.returncode != 0:
-        print(f"Error executing client {method}:")
-        print(stderr.decode())
+    if any(summary is None for summary in summaries):
+        print(f"Error executing client {method}: a client processed no image")
         return None
     
-    output = stdout.decode()
-    
-    metrics = {}
-    try:
-        lines = output.split("\n")
-        summary_section = False
-        for line in lines:
-            
-            if any(line.startswith(header) for header in [
-                "Benchmark Base64 Summary:",
-                "Benchmark Binary Summary:",
-                "Benchmark Matrix Summary:",
-                "Benchmark Stream Summary:"
-            ]):
-                summary_section = True
-                continue
-            
-            if summary_section and line.strip():
-                if ":" in line:
-                    key, value = line.split(":", 1)
-                    key = key.strip()
-                    value = value.strip()
-                    
-                    try:
-                        if "MB" in value:
-                            value = float(value.split()[0])
-                        elif "ms" in value:
-                            value = float(value.split()[0])
-                        elif "img/s" in value:
-                            value = float(value.split()[0])
-                        else:
-                            try:
-                                value = float(value)
-                            except:
-                                pass
-                    except:
-                        pass
-                    
-                    metrics[key] = value
-    except Exception as e:
-        print(f"Error extracting metrics: {e}")
-    
     return {
-        "output": output,
-        "metrics": metrics
+        "config": {"method": method, "iterations": iterations, "batch_size": batch_size,
+                   "fragment_size": fragment_size, "clients": clients, "max_size": max_size, "compression": compression,
+                   "network": network},
+        "metrics": summaries[0] if clients == 1 else aggregate(summaries, metrics, duration)
     }
 
-async def run_benchmark(method, image_dir, iterations):
-    server_process = start_server(method)
-    
-    try:
-        result = await run_client(method, image_dir, iterations)
-        if result:
-            results[method] = result
-            print(f"Benchmark {method} completed successfully!")
-        else:
-            print(f"Benchmark {method} failed.")
-    finally:
-        stop_server(server_process)
+async def run_benchmark(method, image_dir, iterations, batch_sizes=None, fragment_sizes=None, client_counts=None,
+                        max_sizes=None, compressions=None, networks=None):
+    # Transport knobs are fixed when the server starts, so it restarts once per combination
+    for max_size, compression in itertools.product(max_sizes or [None], compressions or [None]):
+        server_process = start_server(method, max_size, compression)
+        
+        try:
+            for network in networks or [None]:
+                proxy_process = start_proxy(method, network) if network else None
+                try:
+                    for batch_size, fragment_size, clients in itertools.product(
+                        batch_sizes if batch_sizes and method in BATCH_METHODS else [None],
+                        fragment_sizes if fragment_sizes and method in FRAGMENT_METHODS else [None],
+                        client_counts or [1],
+                    ):
+                        name = method
+                        if batch_size:
+                            name += f" K={batch_size}"
+                        if fragment_size:
+                            name += f" frag={fragment_size}"
+                        if client_counts:
+                            name += f" c={clients}"
+                        if max_size:
+                            name += f" max={max_size}"
+                        if compression:
+                            name += f" {compression}"
+                        if network:
+                            name += f" net={network}"
+                        message_bytes = max_size and largest_message(method, image_dir, batch_size, fragment_size)
+                        if message_bytes and message_bytes > max_size:
+                            infeasible[name] = f"{message_bytes} byte messages exceed max_size {max_size}"
+                            print(f"Benchmark {name} infeasible: {infeasible[name]}")
+                            continue
+                        result = await run_client(method, image_dir, iterations, batch_size, fragment_size, clients,
+                                                  max_size, compression, network)
+                        if result:
+                            results[name] = result
+                            print(f"Benchmark {name} completed successfully!")
+                        else:
+                            print(f"Benchmark {name} failed.")
+                finally:
+                    if proxy_process:
+                        stop_server(proxy_process)
+        finally:
+            stop_server(server_process)
 
 def parse_metric_value(value):
     if isinstance(value, (int, float)):
@@ -133,45 +242,108 @@ def parse_metric_value(value):
             return 0
     return 0
 
+def axis_sort_key(value):
+    """Numeric knob values in numeric order, unset (server default) first"""
+    if value is None:
+        return (0, 0, "")
+    if isinstance(value, (int, float)):
+        return (1, value, "")
+    return (2, 0, str(value))
+
+def heatmap_axes(configs):
+    """The two knobs with the most distinct values in a method's runs become the heatmap rows and columns"""
+    spread = {axis: len({config[axis] for config in configs}) for axis in SWEEP_AXES}
+    rows, columns = sorted(SWEEP_AXES, key=lambda axis: -spread[axis])[:2]
+    return rows, columns
+
 def generate_charts():
-    methods = list(results.keys())
+    methods = sorted({result["config"]["method"] for result in results.values()})
     
-    throughputs = []
-    latencies = []
-    bandwidths = []
-    total_times = []
+    fig, axs = plt.subplots(len(methods), 2, figsize=(15, 5 * len(methods)), squeeze=False)
     
-    for method in methods:
-        metrics = results[method]["metrics"]
-        throughputs.append(parse_metric_value(metrics.get("Throughput", 0)))
-        latencies.append(parse_metric_value(metrics.get("Average transmission time", 0)))
-        bandwidths.append(parse_metric_value(metrics.get("Bandwidth", 0)))
-        total_times.append(parse_metric_value(metrics.get("Total time", 0)))
-    
-    fig, axs = plt.subplots(2, 2, figsize=(15, 10))
-    
-    axs[0,0].bar(methods, throughputs, color='skyblue')
-    axs[0,0].set_title('Throughput (img/s)')
-    axs[0,0].set_ylabel('Images per second')
-    
-    axs[0,1].bar(methods, latencies, color='salmon')
-    axs[0,1].set_title('Latency (ms)')
-    axs[0,1].set_ylabel('Milliseconds')
-    
-    axs[1,0].bar(methods, bandwidths, color='lightgreen')
-    axs[1,0].set_title('Bandwidth (MB/s)')
-    axs[1,0].set_ylabel('MB/s')
-    
-    axs[1,1].bar(methods, total_times, color='orange')
-    axs[1,1].set_title('Total time (s)')
-    axs[1,1].set_ylabel('Seconds')
+    for row, method in enumerate(methods):
+        runs = [result for result in results.values() if result["config"]["method"] == method]
+        y_axis, x_axis = heatmap_axes([run["config"] for run in runs])
+        y_values = sorted({run["config"][y_axis] for run in runs}, key=axis_sort_key)
+        x_values = sorted({run["config"][x_axis] for run in runs}, key=axis_sort_key)
+        
+        # Every cell shows the best run over the knobs that are not on the axes
+        throughput = np.full((len(y_values), len(x_values)), np.nan)
+        p99 = np.full((len(y_values), len(x_values)), np.nan)
+        for run in runs:
+            i, j = y_values.index(run["config"][y_axis]), x_values.index(run["config"][x_axis])
+            throughput[i, j] = np.fmax(throughput[i, j], parse_metric_value(run["metrics"].get("Throughput", 0)))
+            p99[i, j] = np.fmin(p99[i, j], parse_metric_value(run["metrics"].get("P99 transmission time", 0)))
+        
+        for column, (values, title, cmap) in enumerate((
+            (throughput, "Throughput (img/s)", "viridis"),
+            (p99, "P99 latency (ms)", "viridis_r"),
+        )):
+            ax = axs[row, column]
+            image = ax.imshow(values, cmap=cmap, aspect="auto")
+            ax.set_xticks(range(len(x_values)), labels=[str(value) for value in x_values])
+            ax.set_yticks(range(len(y_values)), labels=[str(value) for value in y_values])
+            ax.set_xlabel(x_axis)
+            ax.set_ylabel(y_axis)
+            ax.set_title(f"{method}: {title}")
+            for i, j in itertools.product(range(len(y_values)), range(len(x_values))):
+                if not np.isnan(values[i, j]):
+                    ax.text(j, i, f"{values[i, j]:.1f}", ha="center", va="center", color="white")
+            fig.colorbar(image, ax=ax)
     
     plt.tight_layout()
     
     plt.savefig('benchmark_comparison.png')
     print("Graph saved as benchmark_comparison.png")
 
-def generate_report():
+def pareto_front(names):
+    """Runs no other run beats on both throughput (higher) and p99 latency (lower), fastest first"""
+    points = sorted(
+        ((parse_metric_value(results[name]["metrics"].get("Throughput", 0)),
+          parse_metric_value(results[name]["metrics"].get("P99 transmission time", 0)), name) for name in names),
+        key=lambda point: (-point[0], point[1])
+    )
+    front = []
+    for throughput, p99, name in points:
+        if not front or p99 < front[-1][1]:
+            front.append((throughput, p99, name))
+    return [name for _, _, name in front]
+
+def generate_tuning(p99_budget=None):
+    """Pareto-optimal configurations per method and the one recommended for the latency budget"""
+    tuning = {}
+    for method in sorted({result["config"]["method"] for result in results.values()}):
+        front = pareto_front([name for name, result in results.items() if result["config"]["method"] == method])
+        # Highest throughput within the budget; without one that fits, the lowest p99 on the front
+        within_budget = [name for name in front if p99_budget is None
+                         or parse_metric_value(results[name]["metrics"].get("P99 transmission time", 0)) <= p99_budget]
+        recommended = within_budget[0] if within_budget else front[-1]
+        tuning[method] = {
+            "pareto": [{"name": name, **results[name]} for name in front],
+            "recommended": {"name": recommended, **results[recommended]},
+        }
+    
+    print("PARETO-OPTIMAL CONFIGURATIONS (throughput vs p99 latency)")
+    if p99_budget is not None:
+        print(f"P99 budget: {p99_budget:.2f} ms")
+    print("-"*85)
+    for method, entry in tuning.items():
+        for point in entry["pareto"]:
+            marker = "*" if point["name"] == entry["recommended"]["name"] else " "
+            print(f"{marker} {point['name']:<45} {point['metrics']['Throughput']:>10.2f} img/s "
+                  f"{point['metrics']['P99 transmission time']:>10.2f} ms")
+    print("="*85 + "\n")
+    
+    with open("benchmark_tuning.json", "w") as f:
+        json.dump({"p99_budget": p99_budget, "methods": tuning}, f, indent=2)
+    
+    print("Tuning saved in benchmark_tuning.json")
+
+def generate_report(p99_budget=None):
+    if infeasible:
+        print("\nINFEASIBLE CONFIGURATIONS (not run)")
+        for name, reason in infeasible.items():
+            print(f"  {name}: {reason}")
     if not results:
         print("No results to generate the report.")
         return
@@ -180,26 +352,28 @@ def generate_report():
     print("COMPARATIVE REPORT OF TRANSMISSION METHODS")
     print("="*80)
     
-    headers = ["Method", "Throughput (img/s)", "Latency (ms)", "Bandwidth (MB/s)", "Total time (s)"]
-    print(f"{headers[0]:<10} {headers[1]:<20} {headers[2]:<15} {headers[3]:<20} {headers[4]:<15}")
-    print("-"*85)
+    headers = ["Method", "Throughput (img/s)", "Latency (ms)", "P99 (ms)", "Bandwidth (MB/s)", "Total time (s)"]
+    width = max(14, *(len(name) for name in results))
+    print(f"{headers[0]:<{width}} {headers[1]:<20} {headers[2]:<15} {headers[3]:<15} {headers[4]:<20} {headers[5]:<15}")
+    print("-"*(width + 86))
     
     for method, result in results.items():
         metrics = result["metrics"]
-        throughput = metrics.get("Throughput", "N/A")
-        latency = metrics.get("Average transmission time", "N/A")
-        bandwidth = metrics.get("Bandwidth", "N/A")
-        total_time = metrics.get("Total time", "N/A")
+        throughput, latency, p99, bandwidth, total_time = (
+            f"{metrics[key]:.2f}" if isinstance(metrics.get(key), float) else metrics.get(key, "N/A")
+            for key in ("Throughput", "Average transmission time", "P99 transmission time", "Bandwidth", "Total time")
+        )
         
-        print(f"{method:<10} {throughput:<20} {latency:<15} {bandwidth:<20} {total_time:<15}")
+        print(f"{method:<{width}} {throughput:<20} {latency:<15} {p99:<15} {bandwidth:<20} {total_time:<15}")
     
     print("="*85 + "\n")
     
     with open("benchmark_results.json", "w") as f:
         json.dump(results, f, indent=2)
     
-    print("Results saved in benchmark_results.json")
+    print("Results saved in benchmark_results.json\n")
     
+    generate_tuning(p99_budget)
     generate_charts()
 
 async def main():
@@ -208,19 +382,65 @@ async def main():
     parser.add_argument("--iterations", type=int, default=3, help="Number of times each image is sent")
     parser.add_argument("--methods", nargs="+", choices=["base64", "binary", "matrix", "stream", "all"], 
                         default=["all"], help="Methods to test")
+    parser.add_argument("--batch-size", type=int, nargs="+", default=None,
+                        help="Images per message for the binary and stream codecs; several values run one pass each")
+    parser.add_argument("--fragment-size", type=int, nargs="+", default=None,
+                        help="Fragment sizes in bytes for the stream codec; several values run one pass each")
+    parser.add_argument("--clients", type=int, nargs="+", default=None,
+                        help="Concurrent clients per run; several values run one pass each")
+    parser.add_argument("--max-size", type=int, nargs="+", default=None,
+                        help="Server and client max message sizes in bytes; each value restarts the server")
+    parser.add_argument("--compression", nargs="+", choices=["deflate", "none"], default=None,
+                        help="permessage-deflate on or off; each value restarts the server")
+    parser.add_argument("--network", nargs="+", choices=list(PROFILES), default=None,
+                        help="Route the clients through impairment_proxy.py with these network profiles")
+    parser.add_argument("--pose-model", choices=["synthetic", "mediapipe", "none"], default=None,
+                        help="Pose estimation stage of the servers (SPIKE_POSE_MODEL)")
+    parser.add_argument("--pose-workers", type=int, default=None,
+                        help="Pose worker processes per server (SPIKE_POSE_WORKERS)")
+    parser.add_argument("--pose-cost-ms", type=float, default=None,
+                        help="Base CPU cost of the synthetic pose model per frame (SPIKE_POSE_COST_MS)")
+    parser.add_argument("--sweep", action="store_true",
+                        help="Explore the default grid for every knob not set explicitly")
+    parser.add_argument("--p99-budget", type=float, default=None,
+                        help="P99 latency budget in ms for the recommended configuration")
     
     args = parser.parse_args()
     
+    if args.sweep:
+        for knob, values in SWEEP_GRID.items():
+            if getattr(args, knob) is None:
+                setattr(args, knob, values)
+    
     methods_to_run = list(SERVERS.keys()) if "all" in args.methods else args.methods
+    for variable, value in (("SPIKE_POSE_MODEL", args.pose_model), ("SPIKE_POSE_WORKERS", args.pose_workers),
+                            ("SPIKE_POSE_COST_MS", args.pose_cost_ms)):
+        if value is not None:
+            pose_environment[variable] = str(value)
     
     print(f"Running benchmarks for methods: {', '.join(methods_to_run)}")
     print(f"Image directory: {args.image_dir}")
     print(f"Iterations per image: {args.iterations}")
+    if args.batch_size:
+        print(f"Batch sizes: {', '.join(map(str, args.batch_size))}")
+    if args.fragment_size:
+        print(f"Fragment sizes: {', '.join(map(str, args.fragment_size))}")
+    if args.clients:
+        print(f"Concurrent clients: {', '.join(map(str, args.clients))}")
+    if args.max_size:
+        print(f"Max message sizes: {', '.join(map(str, args.max_size))}")
+    if args.compression:
+        print(f"Compression: {', '.join(args.compression)}")
+    if args.network:
+        print(f"Network profiles: {', '.join(args.network)}")
+    if pose_environment:
+        print(f"Pose stage: {', '.join(f'{variable}={value}' for variable, value in pose_environment.items())}")
     
     for method in methods_to_run:
-        await run_benchmark(method, args.image_dir, args.iterations)
+        await run_benchmark(method, args.image_dir, args.iterations, args.batch_size, args.fragment_size, args.clients,
+                            args.max_size, args.compression, args.network)
     
-    generate_report()
+    generate_report(args.p99_budget)
 
 if __name__ == "__main__":
     try:
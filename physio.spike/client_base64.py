@@ -3,18 +3,34 @@ import websockets # type: ignore
 import base64
 import json
 import os
-import time
 import argparse
 from pathlib import Path
 from PIL import Image # type: ignore
+from timing import (
+    client_summary, estimate_clock_offset, latency_breakdown, now_ns, percentile, print_latency_summary, sequence_ids,
+    wall_ns
+)
 import io
 
-client_metrics = {
-    "total_images": 0,
-    "total_bytes": 0,
-    "start_time": 0,
-    "transmission_times": []
-}
+def new_metrics():
+    return {
+        "total_images": 0,
+        "total_bytes": 0,
+        "start_time": 0,
+        "transmission_times": [],
+        "clock_offset_ns": None,
+        "latency_breakdowns": []
+    }
+
+client_metrics = new_metrics()
+# Encoded images shared across runs by benchmark_runner; None re-encodes on every send (CLI behaviour)
+image_cache = None
+# websockets.connect keyword arguments (max_size, compression) set by benchmark_runner
+connect_options = {}
+# benchmark_runner points this at the impairment proxy
+server_uri = "ws://localhost:8765"
+
+frame_ids = sequence_ids()
 
 def resize_image(image_path, max_size_mb=0.5, max_dimension=1024):
     """Image was resized to 1024x1024"""
@@ -46,34 +62,56 @@ def resize_image(image_path, max_size_mb=0.5, max_dimension=1024):
         
         return output.getvalue()
 
-async def send_image(websocket, image_path):
+def load_image(image_path, max_size_mb=0.5, max_dimension=1024):
+    """resize_image, memoized in image_cache when a runner shares one across runs"""
+    if image_cache is None:
+        return resize_image(image_path, max_size_mb, max_dimension)
+    key = (str(image_path), max_size_mb, max_dimension)
+    if key not in image_cache:
+        image_cache[key] = resize_image(image_path, max_size_mb, max_dimension)
+    return image_cache[key]
+
+def record_latency(sent_ns, received_ns, response_data, metrics):
+    """Latency components of one image, once the clock offset to the server is known"""
+    if metrics["clock_offset_ns"] is not None and "server_timing" in response_data:
+        metrics["latency_breakdowns"].append(
+            latency_breakdown(sent_ns, received_ns, response_data["server_timing"], metrics["clock_offset_ns"])
+        )
+
+async def send_image(websocket, image_path, metrics=client_metrics):
     """Send Base64 image to the server and receive the response"""
     try:
-        start_time = time.time()
+        start_time = now_ns()
+        sequence = next(frame_ids)
         
-        image_binary = resize_image(image_path)
+        image_binary = load_image(image_path)
         base64_data = base64.b64encode(image_binary).decode('utf-8')
         
         message = json.dumps({
             "image": base64_data,
-            "timestamp": time.time(),
+            "sequence": sequence,
             "filename": os.path.basename(image_path)
         })
         
         message_size = len(message)
-        client_metrics["total_bytes"] += message_size
+        metrics["total_bytes"] += message_size
         
+        sent_ns = wall_ns()
         await websocket.send(message)
         
         response = await websocket.recv()
+        received_ns = wall_ns()
         
-        transmission_time = time.time() - start_time
-        client_metrics["transmission_times"].append(transmission_time)
+        transmission_time = (now_ns() - start_time) / 1e9
+        metrics["transmission_times"].append(transmission_time)
         
         print(f"Image: {os.path.basename(image_path)}")
         print(f"Message size: {message_size / 1024:.2f} KB")
         print(f"Transmission time: {transmission_time * 1000:.2f} ms")
         response_data = json.loads(response)
+        if response_data.get("status") != "processed":
+            raise ValueError(f"Image rejected: {response_data}")
+        record_latency(sent_ns, received_ns, response_data, metrics)
         print(f"Response: {response_data}")
         print("-" * 50)
         
@@ -91,9 +129,11 @@ async def send_image(websocket, image_path):
         print(f"Unexpected error processing image {image_path}: {str(e)}")
         raise
 
-async def benchmark(image_dir, iterations=1):
-    """Execute the benchmark by sending all images in a directory"""
-    uri = "ws://localhost:8765"
+async def benchmark(image_dir, iterations=1, clock_sync=False, metrics=None):
+    """Execute the benchmark by sending all images in a directory; returns the summary metrics"""
+    if metrics is None:
+        metrics = client_metrics
+    uri = server_uri
     
     image_paths = []
     for ext in ['*.jpg', '*.jpeg', '*.png']:
@@ -106,32 +146,40 @@ async def benchmark(image_dir, iterations=1):
     print(f"Found {len(image_paths)} images for the benchmark")
     
     try:
-        async with websockets.connect(uri) as websocket:
+        async with websockets.connect(uri, **connect_options) as websocket:
             print(f"Connected to {uri}")
+
+            if clock_sync:
+                offset_ns, round_trip_ns = await estimate_clock_offset(websocket)
+                metrics["clock_offset_ns"] = offset_ns
+                print(f"Clock offset: {offset_ns / 1e6:.3f} ms (round trip {round_trip_ns / 1e6:.3f} ms)")
             
-            client_metrics["start_time"] = time.time()
+            metrics["start_time"] = now_ns()
             
             for _ in range(iterations):
                 for img_path in image_paths:
                     try:
                         print(f"Sending image: {img_path}")
-                        await send_image(websocket, str(img_path))
-                        client_metrics["total_images"] += 1
+                        await send_image(websocket, str(img_path), metrics)
+                        metrics["total_images"] += 1
                     except Exception as e:
                         print(f"Error processing image {img_path}: {str(e)}")
                         continue
             
-            if client_metrics["total_images"] > 0:
-                duration = time.time() - client_metrics["start_time"]
-                avg_time = sum(client_metrics["transmission_times"]) / len(client_metrics["transmission_times"]) * 1000
+            if metrics["total_images"] > 0:
+                duration = (now_ns() - metrics["start_time"]) / 1e9
+                avg_time = sum(metrics["transmission_times"]) / len(metrics["transmission_times"]) * 1000
                 
                 print("\nBenchmark Base64 Summary:")
-                print(f"Total images sent: {client_metrics['total_images']}")
-                print(f"Total data sent: {client_metrics['total_bytes'] / (1024*1024):.2f} MB")
+                print(f"Total images sent: {metrics['total_images']}")
+                print(f"Total data sent: {metrics['total_bytes'] / (1024*1024):.2f} MB")
                 print(f"Average transmission time: {avg_time:.2f} ms")
+                print(f"P99 transmission time: {percentile(metrics['transmission_times'], 0.99) * 1000:.2f} ms")
                 print(f"Total time: {duration:.2f} s")
-                print(f"Throughput: {client_metrics['total_images']/duration:.2f} img/s")
-                print(f"Bandwidth: {(client_metrics['total_bytes'] / duration) / (1024*1024):.2f} MB/s")
+                print(f"Throughput: {metrics['total_images']/duration:.2f} img/s")
+                print(f"Bandwidth: {(metrics['total_bytes'] / duration) / (1024*1024):.2f} MB/s")
+                print_latency_summary(metrics["latency_breakdowns"])
+                return client_summary(metrics, duration)
             else:
                 print("Could not process any image correctly")
     except websockets.exceptions.ConnectionClosed as e:
@@ -143,7 +191,12 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="WebSocket Client for Base64 Image Benchmark")
     parser.add_argument("image_dir", help="Image Directory")
     parser.add_argument("--iterations", type=int, default=1, help="Number of iterations to send each image")
+    parser.add_argument("--clock-sync", action="store_true",
+                        help="Estimate the server clock offset and split latency into its components")
+    parser.add_argument("--uri", default=server_uri,
+                        help="Server URI, e.g. an impairment_proxy.py port")
     
     args = parser.parse_args()
+    server_uri = args.uri
     
-    asyncio.run(benchmark(args.image_dir, args.iterations))
\ No newline at end of file
+    asyncio.run(benchmark(args.image_dir, args.iterations, args.clock_sync))
\ No newline at end of file
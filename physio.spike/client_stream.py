@@ -2,19 +2,36 @@ import asyncio
 import websockets # type: ignore
 import json
 import os
-import time
 import argparse
 import struct
 from pathlib import Path
 from PIL import Image # type: ignore
+from timing import (
+    client_summary, estimate_clock_offset, latency_breakdown, now_ns, percentile, print_latency_summary, sequence_ids,
+    wall_ns
+)
 import io
+from envelope import pack_batch
 
-client_metrics = {
-    "total_images": 0,
-    "total_bytes": 0,
-    "start_time": 0,
-    "transmission_times": []
-}
+def new_metrics():
+    return {
+        "total_images": 0,
+        "total_bytes": 0,
+        "start_time": 0,
+        "transmission_times": [],
+        "clock_offset_ns": None,
+        "latency_breakdowns": []
+    }
+
+client_metrics = new_metrics()
+# Encoded images shared across runs by benchmark_runner; None re-encodes on every send (CLI behaviour)
+image_cache = None
+# websockets.connect keyword arguments (max_size, compression) set by benchmark_runner
+connect_options = {}
+# benchmark_runner points this at the impairment proxy
+server_uri = "ws://localhost:8768"
+
+frame_ids = sequence_ids()
 
 FRAGMENT_SIZE = 16384  # 16KB por fragmento
 
@@ -48,44 +65,66 @@ def resize_image(image_path, max_size_mb=0.5, max_dimension=1024):
         
         return output.getvalue()
 
-async def send_image_stream(websocket, image_path):
-    """Send an image through WebSocket as a stream of fragments"""
+def load_image(image_path, max_size_mb=0.5, max_dimension=1024):
+    """resize_image, memoized in image_cache when a runner shares one across runs"""
+    if image_cache is None:
+        return resize_image(image_path, max_size_mb, max_dimension)
+    key = (str(image_path), max_size_mb, max_dimension)
+    if key not in image_cache:
+        image_cache[key] = resize_image(image_path, max_size_mb, max_dimension)
+    return image_cache[key]
+
+def record_latency(sent_ns, received_ns, response_data, metrics):
+    """Latency components of one image, once the clock offset to the server is known"""
+    if metrics["clock_offset_ns"] is not None and "server_timing" in response_data:
+        metrics["latency_breakdowns"].append(
+            latency_breakdown(sent_ns, received_ns, response_data["server_timing"], metrics["clock_offset_ns"])
+        )
+
+async def send_image_stream(websocket, image_path, image_binary=None, images=1, metrics=client_metrics,
+                            fragment_size=None):
+    """Send an image, or an already packed batch envelope of `images` images, as a stream of fragments"""
     try:
-        start_time = time.time()
-        image_id = int(time.time() * 1000)  # Unique ID for the image
+        fragment_size = fragment_size or FRAGMENT_SIZE
+        start_time = now_ns()
+        image_id = next(frame_ids)  # Monotonic, so two images never share an ID
         
         # Resize the image before sending
-        image_binary = resize_image(image_path)
+        if image_binary is None:
+            image_binary = load_image(image_path)
         
         image_size = len(image_binary)
-        client_metrics["total_bytes"] += image_size
+        metrics["total_bytes"] += image_size
         
         header = struct.pack("!QI", image_id, image_size)
         
         fragments_sent = 0
         acks_received = 0
         
-        first_fragment = header + image_binary[:FRAGMENT_SIZE - len(header)]
+        first_fragment = header + image_binary[:fragment_size - len(header)]
+        sent_ns = wall_ns()
         await websocket.send(first_fragment)
         fragments_sent += 1
         
-        try:
-            ack = await websocket.recv()
-            ack_data = json.loads(ack)
-            if ack_data.get("status") == "fragment_received":
-                acks_received += 1
-            else:
-                print(f"Warning: Unexpected ACK: {ack_data}")
-        except Exception as e:
-            print(f"Error receiving initial ACK: {str(e)}")
-            raise
+        # An image that fits in the first fragment gets the final response instead of an ACK
+        if image_size > fragment_size - len(header):
+            try:
+                ack = await websocket.recv()
+                ack_data = json.loads(ack)
+                if ack_data.get("status") == "fragment_received":
+                    acks_received += 1
+                else:
+                    print(f"Warning: Unexpected ACK: {ack_data}")
+            except Exception as e:
+                print(f"Error receiving initial ACK: {str(e)}")
+                raise
         
-        for i in range(FRAGMENT_SIZE - len(header), image_size, FRAGMENT_SIZE):
-            fragment = image_binary[i:i + FRAGMENT_SIZE]
+        for i in range(fragment_size - len(header), image_size, fragment_size):
+            fragment = image_binary[i:i + fragment_size]
             await websocket.send(fragment)
             fragments_sent += 1
             
-            if i + FRAGMENT_SIZE < image_size:
+            if i + fragment_size < image_size:
                 try:
                     ack = await websocket.recv()
                     ack_data = json.loads(ack)
@@ -99,13 +138,18 @@ async def send_image_stream(websocket, image_path):
         
         try:
             response = await websocket.recv()
+            received_ns = wall_ns()
             response_data = json.loads(response)
         except Exception as e:
             print(f"Error receiving final response: {str(e)}")
             raise
+        if response_data.get("status") != "processed":
+            raise ValueError(f"Image rejected: {response_data}")
+        record_latency(sent_ns, received_ns, response_data, metrics)
         
-        transmission_time = time.time() - start_time
-        client_metrics["transmission_times"].append(transmission_time)
+        transmission_time = (now_ns() - start_time) / 1e9
+        # Every image of a batch waits for the whole batch
+        metrics["transmission_times"].extend([transmission_time] * images)
         
         print(f"Image: {os.path.basename(image_path)}")
         print(f"Image size: {image_size / 1024:.2f} KB")
@@ -129,9 +173,11 @@ async def send_image_stream(websocket, image_path):
         print(f"Unexpected error processing image {image_path}: {str(e)}")
         raise
 
-async def benchmark(image_dir, iterations=1):
-    """Execute the benchmark by sending all images in a directory"""
-    uri = "ws://localhost:8768"
+async def benchmark(image_dir, iterations=1, clock_sync=False, batch_size=None, metrics=None, fragment_size=None):
+    """Execute the benchmark by sending all images in a directory; returns the summary metrics"""
+    if metrics is None:
+        metrics = client_metrics
+    uri = server_uri
     
     image_paths = []
     for ext in ['*.jpg', '*.jpeg', '*.png']:
@@ -144,32 +190,55 @@ async def benchmark(image_dir, iterations=1):
     print(f"Found {len(image_paths)} images for the benchmark")
     
     try:
-        async with websockets.connect(uri) as websocket:
+        async with websockets.connect(uri, **connect_options) as websocket:
             print(f"Connected to {uri}")
+
+            if clock_sync:
+                offset_ns, round_trip_ns = await estimate_clock_offset(websocket)
+                metrics["clock_offset_ns"] = offset_ns
+                print(f"Clock offset: {offset_ns / 1e6:.3f} ms (round trip {round_trip_ns / 1e6:.3f} ms)")
+            
+            if batch_size:
+                # Encoding happens before the clock starts so throughput reflects K alone
+                encoded = [(img_path.name, load_image(img_path)) for img_path in image_paths]
             
-            client_metrics["start_time"] = time.time()
+            metrics["start_time"] = now_ns()
             
             for _ in range(iterations):
+                if batch_size:
+                    for first in range(0, len(encoded), batch_size):
+                        batch = encoded[first:first + batch_size]
+                        label = f"batch of {len(batch)} ({batch[0][0]}...)"
+                        try:
+                            await send_image_stream(websocket, label, pack_batch([image for _, image in batch]),
+                                                    images=len(batch), metrics=metrics, fragment_size=fragment_size)
+                            metrics["total_images"] += len(batch)
+                        except Exception as e:
+                            print(f"Error processing {label}: {str(e)}")
+                    continue
                 for img_path in image_paths:
                     try:
                         print(f"Sending image: {img_path}")
-                        await send_image_stream(websocket, str(img_path))
-                        client_metrics["total_images"] += 1
+                        await send_image_stream(websocket, str(img_path), metrics=metrics, fragment_size=fragment_size)
+                        metrics["total_images"] += 1
                     except Exception as e:
                         print(f"Error processing image {img_path}: {str(e)}")
                         continue
             
-            if client_metrics["total_images"] > 0:
-                duration = time.time() - client_metrics["start_time"]
-                avg_time = sum(client_metrics["transmission_times"]) / len(client_metrics["transmission_times"]) * 1000
+            if metrics["total_images"] > 0:
+                duration = (now_ns() - metrics["start_time"]) / 1e9
+                avg_time = sum(metrics["transmission_times"]) / len(metrics["transmission_times"]) * 1000
                 
                 print("\nBenchmark Stream Summary:")
-                print(f"Total images sent: {client_metrics['total_images']}")
-                print(f"Total data sent: {client_metrics['total_bytes'] / (1024*1024):.2f} MB")
+                print(f"Total images sent: {metrics['total_images']}")
+                print(f"Total data sent: {metrics['total_bytes'] / (1024*1024):.2f} MB")
                 print(f"Average transmission time: {avg_time:.2f} ms")
+                print(f"P99 transmission time: {percentile(metrics['transmission_times'], 0.99) * 1000:.2f} ms")
                 print(f"Total time: {duration:.2f} s")
-                print(f"Throughput: {client_metrics['total_images']/duration:.2f} img/s")
-                print(f"Bandwidth: {(client_metrics['total_bytes'] / duration) / (1024*1024):.2f} MB/s")
+                print(f"Throughput: {metrics['total_images']/duration:.2f} img/s")
+                print(f"Bandwidth: {(metrics['total_bytes'] / duration) / (1024*1024):.2f} MB/s")
+                print_latency_summary(metrics["latency_breakdowns"])
+                return client_summary(metrics, duration)
             else:
                 print("Could not process any image correctly")
     except websockets.exceptions.ConnectionClosed as e:
@@ -181,10 +250,17 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="WebSocket Client for Image Transmission Benchmark by Stream")
     parser.add_argument("image_dir", help="Directory containing images for the benchmark")
     parser.add_argument("--iterations", type=int, default=1, help="Number of times each image is sent")
+    parser.add_argument("--clock-sync", action="store_true",
+                        help="Estimate the server clock offset and split latency into its components")
     parser.add_argument("--fragment-size", type=int, default=FRAGMENT_SIZE, help="Size of each fragment in bytes")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="Send K pre-encoded images per stream in a batch envelope")
+    parser.add_argument("--uri", default=server_uri,
+                        help="Server URI, e.g. an impairment_proxy.py port")
     
     args = parser.parse_args()
+    server_uri = args.uri
     
     FRAGMENT_SIZE = args.fragment_size
     
-    asyncio.run(benchmark(args.image_dir, args.iterations))
\ No newline at end of file
+    asyncio.run(benchmark(args.image_dir, args.iterations, args.clock_sync, args.batch_size))
\ No newline at end of file
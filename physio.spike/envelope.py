@@ -0,0 +1,44 @@
+import struct
+
+# Batch envelope: magic, version, image count, then one (offset, length) entry per
+# image and the images back to back. Offsets are from the start of the message.
+BATCH_MAGIC = b"PHBT"
+BATCH_VERSION = 1
+BATCH_HEADER = struct.Struct("!4sHH")
+BATCH_ENTRY = struct.Struct("!II")
+
+
+def pack_batch(images):
+    """Build one message carrying several encoded images"""
+    offset = BATCH_HEADER.size + BATCH_ENTRY.size * len(images)
+    table = bytearray(BATCH_HEADER.pack(BATCH_MAGIC, BATCH_VERSION, len(images)))
+    for image in images:
+        table += BATCH_ENTRY.pack(offset, len(image))
+        offset += len(image)
+    return b"".join([bytes(table), *images])
+
+
+def is_batch(message):
+    return message[:4] == BATCH_MAGIC
+
+
+def unpack_batch(message):
+    """Zero-copy memoryviews of the images of a batch message; ValueError on a malformed envelope"""
+    if len(message) < BATCH_HEADER.size:
+        raise ValueError("Truncated batch header")
+    magic, version, count = BATCH_HEADER.unpack_from(message)
+    if magic != BATCH_MAGIC or version != BATCH_VERSION:
+        raise ValueError("Not a batch envelope")
+    table_end = BATCH_HEADER.size + count * BATCH_ENTRY.size
+    if len(message) < table_end:
+        raise ValueError(f"Truncated batch table of {count} images")
+    view = memoryview(message)
+    images = []
+    for index in range(count):
+        offset, length = BATCH_ENTRY.unpack_from(message, BATCH_HEADER.size + index * BATCH_ENTRY.size)
+        if offset < table_end:
+            raise ValueError(f"Image {index} overlaps the batch table")
+        if offset + length > len(message):
+            raise ValueError(f"Image {index} exceeds the message")
+        images.append(view[offset:offset + length])
+    return images
@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import random
+
+# One-way delays in ms and link rates in kbit/s. Spikes model the occasional stall
+# of a loaded radio link (retransmissions, handovers): with probability spike_rate
+# a chunk is held spike_ms longer, and everything behind it waits too.
+PROFILES = {
+    "none": {"latency_ms": 0, "jitter_ms": 0, "uplink_kbps": 0, "downlink_kbps": 0, "spike_rate": 0, "spike_ms": 0},
+    "lan": {"latency_ms": 0.5, "jitter_ms": 0.2, "uplink_kbps": 100000, "downlink_kbps": 100000,
+            "spike_rate": 0, "spike_ms": 0},
+    "4g": {"latency_ms": 25, "jitter_ms": 8, "uplink_kbps": 5000, "downlink_kbps": 20000,
+           "spike_rate": 0.01, "spike_ms": 100},
+    "3g": {"latency_ms": 75, "jitter_ms": 20, "uplink_kbps": 750, "downlink_kbps": 2000,
+           "spike_rate": 0.02, "spike_ms": 250},
+    "clinic-wifi": {"latency_ms": 10, "jitter_ms": 25, "uplink_kbps": 3000, "downlink_kbps": 6000,
+                    "spike_rate": 0.05, "spike_ms": 150},
+}
+
+CHUNK_SIZE = 16384
+# Chunks in flight per direction before the sender is paused, like a bounded router buffer
+QUEUE_CHUNKS = 64
+# Proxies listen on the WebSocket port + PROXY_PORT_OFFSET
+PROXY_PORT_OFFSET = 2000
+
+
+def chunk_delay(profile, rng):
+    """Propagation delay of one chunk in seconds"""
+    delay = profile["latency_ms"] + rng.uniform(-profile["jitter_ms"], profile["jitter_ms"])
+    if profile["spike_rate"] and rng.random() < profile["spike_rate"]:
+        delay += profile["spike_ms"]
+    return max(0.0, delay) / 1000
+
+
+async def deliver(queue, writer):
+    loop = asyncio.get_running_loop()
+    while True:
+        due, data = await queue.get()
+        if data is None:
+            break
+        if writer.is_closing():
+            # The peer is gone; keep draining so the reading side never blocks on a full queue
+            continue
+        wait = due - loop.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        try:
+            writer.write(data)
+            await writer.drain()
+        except ConnectionError:
+            writer.close()
+    writer.close()
+
+
+async def pipe(reader, writer, profile, rate_kbps, rng):
+    """Forward one direction of a connection through a rate-limited link with delay.
+
+    Chunks leave the link one after another at rate_kbps and arrive after a
+    jittered delay, but never before the chunk ahead of them: TCP delivers in order.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(QUEUE_CHUNKS)
+    delivery = asyncio.create_task(deliver(queue, writer))
+    link_free = 0.0
+    last_due = 0.0
+    try:
+        while data := await reader.read(CHUNK_SIZE):
+            link_free = max(link_free, loop.time())
+            if rate_kbps:
+                link_free += len(data) * 8 / (rate_kbps * 1000)
+            last_due = max(link_free + chunk_delay(profile, rng), last_due)
+            await queue.put((last_due, data))
+    except ConnectionError:
+        pass
+    finally:
+        await queue.put((None, None))
+        await delivery
+
+
+async def handle_client(client_reader, client_writer, target_host, target_port, profile, rng):
+    try:
+        server_reader, server_writer = await asyncio.open_connection(target_host, target_port)
+    except OSError as e:
+        print(f"Could not reach {target_host}:{target_port}: {e}")
+        client_writer.close()
+        return
+    await asyncio.gather(
+        pipe(client_reader, server_writer, profile, profile["uplink_kbps"], rng),
+        pipe(server_reader, client_writer, profile, profile["downlink_kbps"], rng),
+    )
+
+
+async def start_proxy(listen_port, target_port, profile, host="localhost", seed=None):
+    """Serve listen_port, forwarding every connection to target_port through the impaired link"""
+    rng = random.Random(seed)
+    return await asyncio.start_server(
+        lambda reader, writer: handle_client(reader, writer, host, target_port, profile, rng), host, listen_port
+    )
+
+
+def build_profile(name, **overrides):
+    """A named profile with the non-None overrides applied"""
+    profile = dict(PROFILES[name])
+    profile.update({key: value for key, value in overrides.items() if value is not None})
+    return profile
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="TCP proxy that emulates a mobile or congested network link")
+    parser.add_argument("--target", type=int, required=True, help="Port of the server to forward to")
+    parser.add_argument("--listen", type=int, default=None, help="Port to listen on (default: target + 2000)")
+    parser.add_argument("--profile", choices=list(PROFILES), default="4g", help="Network profile")
+    parser.add_argument("--latency-ms", type=float, default=None, help="One-way delay, overrides the profile")
+    parser.add_argument("--jitter-ms", type=float, default=None, help="Delay jitter, overrides the profile")
+    parser.add_argument("--uplink-kbps", type=float, default=None, help="Client to server rate (0 = unlimited)")
+    parser.add_argument("--downlink-kbps", type=float, default=None, help="Server to client rate (0 = unlimited)")
+    parser.add_argument("--spike-rate", type=float, default=None, help="Probability of a delay spike per chunk")
+    parser.add_argument("--spike-ms", type=float, default=None, help="Extra delay of a spike")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible jitter")
+
+    args = parser.parse_args()
+
+    profile = build_profile(args.profile, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                            uplink_kbps=args.uplink_kbps, downlink_kbps=args.downlink_kbps,
+                            spike_rate=args.spike_rate, spike_ms=args.spike_ms)
+    listen_port = args.listen or args.target + PROXY_PORT_OFFSET
+    server = await start_proxy(listen_port, args.target, profile, seed=args.seed)
+    print(f"Impairment proxy ({args.profile}) on localhost:{listen_port} -> localhost:{args.target}: {profile}")
+
+    await server.serve_forever()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
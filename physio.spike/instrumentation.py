@@ -0,0 +1,302 @@
+import asyncio
+import bisect
+import contextlib
+import cProfile
+import math
+import os
+import time
+
+# Opt-in sampling of whole connections: "cprofile" or "yappi"
+PROFILER = os.environ.get("SPIKE_PROFILE", "").lower()
+PROFILE_DIR = os.environ.get("SPIKE_PROFILE_DIR", "profiles")
+REPORT_SECONDS = float(os.environ.get("SPIKE_REPORT_SECONDS", "10"))
+# The /metrics endpoint of a server listens on its WebSocket port + METRICS_PORT_OFFSET
+METRICS_PORT_OFFSET = int(os.environ.get("SPIKE_METRICS_PORT_OFFSET", "1000"))
+
+# Histogram bucket upper bounds in seconds, shared by every timing aggregate
+HISTOGRAM_BOUNDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+server_name = "spike"
+profiling = {"active": None}
+
+
+class StreamingStats:
+    """Count, mean and variance (Welford), min/max and a fixed-bucket histogram in constant memory"""
+
+    __slots__ = ("count", "mean", "m2", "minimum", "maximum", "total", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = float("inf")
+        self.maximum = 0.0
+        self.total = 0.0
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.total += value
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+        self.buckets[bisect.bisect_left(HISTOGRAM_BOUNDS, value)] += 1
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+
+class ConnectionMetrics:
+    """Traffic and processing times of one connection; every update also feeds the global scope"""
+
+    def __init__(self, registry, connection_id):
+        self.registry = registry
+        self.connection_id = connection_id
+        self.opened_at = time.perf_counter()
+        self.closed_at = None
+        self.messages = 0
+        self.bytes = 0
+        self.processing = StreamingStats()
+
+    def record_bytes(self, size):
+        self.bytes += size
+        self.registry.bytes += size
+
+    def record_message(self, size=0, images=1):
+        self.messages += images
+        self.registry.messages += images
+        if size:
+            self.record_bytes(size)
+
+    def record_processing(self, seconds):
+        self.processing.add(seconds)
+        self.registry.processing.add(seconds)
+
+    def duration(self):
+        return (self.closed_at or time.perf_counter()) - self.opened_at
+
+
+class MetricsRegistry:
+    """Per-connection and global metrics of a server.
+
+    Everything runs on the event loop thread and no update awaits, so plain
+    attribute updates need no locks. Global throughput is computed over the time
+    at least one client was connected, not since the last connection opened.
+    """
+
+    def __init__(self):
+        self.connections = {}
+        self.opened = 0
+        self.messages = 0
+        self.bytes = 0
+        self.processing = StreamingStats()
+        self.counters = {}
+        self.gauges = {}
+        self.stages = {}
+        self.busy_seconds = 0.0
+        self.busy_since = None
+
+    def open_connection(self, connection_id):
+        if not self.connections:
+            self.busy_since = time.perf_counter()
+        connection = self.connections[connection_id] = ConnectionMetrics(self, connection_id)
+        self.opened += 1
+        return connection
+
+    def close_connection(self, connection):
+        connection.closed_at = time.perf_counter()
+        self.connections.pop(connection.connection_id, None)
+        if not self.connections and self.busy_since is not None:
+            self.busy_seconds += connection.closed_at - self.busy_since
+            self.busy_since = None
+
+    def active_seconds(self):
+        if self.busy_since is None:
+            return self.busy_seconds
+        return self.busy_seconds + time.perf_counter() - self.busy_since
+
+
+registry = MetricsRegistry()
+
+
+def increment(name, value=1):
+    """Monotonic counter, exported as spike_<name>_total"""
+    registry.counters[name] = registry.counters.get(name, 0) + value
+
+
+def set_gauge(name, value):
+    """Current value of a level such as a queue depth, exported as spike_<name>"""
+    registry.gauges[name] = value
+
+
+def record_span(name, elapsed_ns):
+    stats = registry.stages.get(name)
+    if stats is None:
+        stats = registry.stages[name] = StreamingStats()
+    stats.add(elapsed_ns / 1e9)
+
+
+@contextlib.contextmanager
+def span(name):
+    """Times the enclosed block as one occurrence of a stage"""
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter_ns() - start)
+
+
+def render_histogram(lines, name, labels, stats):
+    cumulative = 0
+    for bound, count in zip(HISTOGRAM_BOUNDS, stats.buckets):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {stats.count}')
+    lines.append(f"{name}_sum{{{labels}}} {stats.total:.9f}")
+    lines.append(f"{name}_count{{{labels}}} {stats.count}")
+
+
+def render_metrics():
+    """Global counters, gauges and timing histograms in the Prometheus text exposition format"""
+    label = f'server="{server_name}"'
+    counters = {"connections": registry.opened, "messages": registry.messages, "bytes_received": registry.bytes,
+                **registry.counters}
+    lines = []
+    for name, value in sorted(counters.items()):
+        lines.append(f"# TYPE spike_{name}_total counter")
+        lines.append(f"spike_{name}_total{{{label}}} {value}")
+    lines.append("# TYPE spike_active_connections gauge")
+    lines.append(f"spike_active_connections{{{label}}} {len(registry.connections)}")
+    for name, value in sorted(registry.gauges.items()):
+        lines.append(f"# TYPE spike_{name} gauge")
+        lines.append(f"spike_{name}{{{label}}} {value}")
+    lines.append("# TYPE spike_active_seconds_total counter")
+    lines.append(f"spike_active_seconds_total{{{label}}} {registry.active_seconds():.6f}")
+    lines.append("# TYPE spike_processing_seconds histogram")
+    render_histogram(lines, "spike_processing_seconds", label, registry.processing)
+    lines.append("# TYPE spike_stage_seconds histogram")
+    for stage, stats in registry.stages.items():
+        render_histogram(lines, "spike_stage_seconds", f'{label},stage="{stage}"', stats)
+    return "\n".join(lines) + "\n"
+
+
+def print_summary(messages, size, duration, processing):
+    print(f"Total images processed: {messages}")
+    print(f"Total bytes received: {size / (1024*1024):.2f} MB")
+    print(f"Average processing time: {processing.mean * 1000:.2f} ms "
+          f"(stddev {processing.stddev * 1000:.2f} ms, max {processing.maximum * 1000:.2f} ms)")
+    print(f"Total time: {duration:.2f} s")
+    print(f"Throughput: {messages / duration:.2f} img/s")
+    print(f"Bandwidth: {(size / duration) / (1024*1024):.2f} MB/s")
+
+
+def report_connection(title, connection):
+    """Summary of a closed connection followed by the server-wide totals"""
+    if connection.messages == 0:
+        return
+    print(f"\n{title} performance metrics (connection {connection.connection_id}):")
+    print_summary(connection.messages, connection.bytes, connection.duration(), connection.processing)
+    if registry.opened > 1:
+        print(f"\n{title} server totals ({registry.opened} connections, {len(registry.connections)} active):")
+        print_summary(registry.messages, registry.bytes, registry.active_seconds(), registry.processing)
+
+
+def format_report():
+    parts = []
+    for stage, stats in registry.stages.items():
+        parts.append(f"{stage} n={stats.count} avg={stats.mean * 1000:.3f}ms max={stats.maximum * 1000:.3f}ms")
+    parts.extend(f"{name}={value}" for name, value in sorted(registry.gauges.items()))
+    return f"[{server_name}] " + " | ".join(parts)
+
+
+async def report_periodically(interval):
+    while True:
+        await asyncio.sleep(interval)
+        if registry.stages:
+            print(format_report())
+
+
+async def handle_metrics_request(reader, writer):
+    """Minimal HTTP/1.1 responder, enough for Prometheus and curl"""
+    try:
+        request_line = await reader.readline()
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[1].split(b"?")[0] == b"/metrics":
+            status, body = b"200 OK", render_metrics().encode()
+        else:
+            status, body = b"404 Not Found", b"Not found\n"
+        writer.write(b"HTTP/1.1 " + status + b"\r\n"
+                     b"Content-Type: text/plain; version=0.0.4\r\n"
+                     b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                     b"Connection: close\r\n\r\n" + body)
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_instrumentation(name, websocket_port, host="localhost"):
+    """Serve /metrics next to the WebSocket server and start the periodic reporter"""
+    global server_name
+    server_name = name
+    metrics_port = websocket_port + METRICS_PORT_OFFSET
+    server = await asyncio.start_server(handle_metrics_request, host, metrics_port)
+    print(f"Metrics available on: http://{host}:{metrics_port}/metrics")
+    if REPORT_SECONDS > 0:
+        asyncio.create_task(report_periodically(REPORT_SECONDS))
+    return server
+
+
+def start_profiler():
+    if PROFILER == "yappi":
+        import yappi  # type: ignore
+        yappi.clear_stats()
+        yappi.start()
+        return yappi
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stop_profiler(profiler, path):
+    if PROFILER == "yappi":
+        profiler.stop()
+        profiler.get_func_stats().save(path, type="pstat")
+    else:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+def start_connection_profile(label):
+    """Profile the event loop while a connection is open; returns a handle for stop_connection_profile.
+
+    The profilers see the whole thread, so only one connection is sampled at a
+    time; connections opened meanwhile run unprofiled.
+    """
+    if not PROFILER or profiling["active"] is not None:
+        return None
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{server_name}-{label}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+    profiling["active"] = start_profiler()
+    return path
+
+
+def stop_connection_profile(path):
+    """Dump the profile of a connection started with start_connection_profile"""
+    if path is None:
+        return
+    stop_profiler(profiling["active"], path)
+    profiling["active"] = None
+    print(f"Profile saved as {path}")
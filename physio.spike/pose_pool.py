@@ -0,0 +1,375 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import zlib
+from multiprocessing import shared_memory
+
+import numpy as np  # type: ignore
+from PIL import Image  # type: ignore
+
+from instrumentation import record_span, set_gauge
+from timing import now_ns
+
+# Pose-estimation stage behind the servers. "synthetic" decodes the frame and burns
+# a configurable amount of CPU, "mediapipe" runs MediaPipe Pose on the CPU, "none"
+# only reads the image header, or a raw frame's shape, in the event loop (the old stand-in).
+POSE_MODEL = os.environ.get("SPIKE_POSE_MODEL", "synthetic").lower()
+POSE_WORKERS = int(os.environ.get("SPIKE_POSE_WORKERS", str(os.cpu_count() or 1)))
+# Synthetic cost: base milliseconds plus milliseconds per megapixel, +/- jitter (fraction)
+POSE_COST_MS = float(os.environ.get("SPIKE_POSE_COST_MS", "20"))
+POSE_COST_PER_MPIX_MS = float(os.environ.get("SPIKE_POSE_COST_PER_MPIX_MS", "10"))
+POSE_JITTER = float(os.environ.get("SPIKE_POSE_JITTER", "0.2"))
+# Frames are copied into one of SLOTS_PER_WORKER * workers shared-memory slots
+SLOT_BYTES = int(os.environ.get("SPIKE_POSE_SLOT_BYTES", str(8 * 1024 * 1024)))
+SLOTS_PER_WORKER = 2
+# Time allowed for every worker to load its model before start() gives up
+POSE_STARTUP_SECONDS = float(os.environ.get("SPIKE_POSE_STARTUP_SECONDS", "60"))
+
+MODELS = ("synthetic", "mediapipe", "none")
+NUM_LANDMARKS = 33
+LANDMARK_FIELDS = 4  # x, y, z, visibility (MediaPipe's layout)
+
+# Neutral standing pose (normalized x, y), the synthetic model's starting point
+STANDING_POSE = np.array([
+    0.50, 0.10, 0.48, 0.08, 0.47, 0.08, 0.46, 0.08, 0.52, 0.08, 0.53, 0.08, 0.54, 0.08, 0.47, 0.06,
+    0.53, 0.06, 0.485, 0.12, 0.515, 0.12, 0.45, 0.25, 0.55, 0.25, 0.42, 0.35, 0.58, 0.35, 0.40, 0.45,
+    0.60, 0.45, 0.39, 0.47, 0.38, 0.46, 0.37, 0.47, 0.61, 0.47, 0.62, 0.46, 0.63, 0.47, 0.47, 0.55,
+    0.53, 0.55, 0.47, 0.75, 0.53, 0.75, 0.47, 0.90, 0.53, 0.90, 0.46, 0.95, 0.54, 0.95, 0.48, 0.98,
+    0.52, 0.98,
+], dtype=np.float32).reshape(NUM_LANDMARKS, 2)
+
+
+def image_info(image):
+    return {"width": image.width, "height": image.height, "format": image.format, "mode": image.mode}
+
+
+def raw_info(shape):
+    return {"width": shape[1], "height": shape[0], "channels": shape[2]}
+
+
+def inspect_image(image_bytes):
+    """The "none" model: header only, no landmarks"""
+    start = now_ns()
+    info = image_info(Image.open(io.BytesIO(image_bytes)))
+    info["process_time_ms"] = (now_ns() - start) / 1e6
+    return info
+
+
+class SyntheticPoseModel:
+    """Stand-in with a realistic cost: busy CPU time that grows with the pixel count of the decoded frame"""
+
+    def __init__(self):
+        self.rng = np.random.default_rng(os.getpid())
+
+    def __call__(self, pixels, landmarks):
+        megapixels = pixels.shape[0] * pixels.shape[1] / 1e6
+        cost = (POSE_COST_MS + POSE_COST_PER_MPIX_MS * megapixels) / 1000
+        cost *= 1 + self.rng.uniform(-POSE_JITTER, POSE_JITTER)
+        deadline = time.perf_counter() + cost
+        while time.perf_counter() < deadline:
+            pass
+        # Same frame, same pose: the noise is seeded from the pixels
+        noise = np.random.default_rng(zlib.crc32(pixels[::16, ::16].tobytes())).normal(0, 0.01, STANDING_POSE.shape)
+        landmarks[:, :2] = STANDING_POSE + noise
+        landmarks[:, 2] = 0.0
+        landmarks[:, 3] = 1.0
+
+
+class MediaPipePoseModel:
+    """MediaPipe Pose on the CPU (pip install mediapipe)"""
+
+    def __init__(self):
+        import mediapipe  # type: ignore
+
+        self.pose = mediapipe.solutions.pose.Pose(static_image_mode=True, model_complexity=1)
+
+    def __call__(self, pixels, landmarks):
+        result = self.pose.process(pixels)
+        if result.pose_landmarks is None:
+            landmarks[:] = 0.0
+            return
+        for i, landmark in enumerate(result.pose_landmarks.landmark):
+            landmarks[i] = (landmark.x, landmark.y, landmark.z, landmark.visibility)
+
+
+def worker_main(model_name, frames_name, results_name, slot_count, tasks, results):
+    """Pose worker: frames arrive as (slot, kind, size, shape) and landmarks go back through shared memory.
+
+    The first result has no slot: it tells the parent whether the model could be loaded.
+    """
+    # Spawned workers share the parent's resource tracker, which unlinks the blocks if the parent dies
+    frames_block = shared_memory.SharedMemory(name=frames_name)
+    results_block = shared_memory.SharedMemory(name=results_name)
+    frames = np.ndarray((slot_count, SLOT_BYTES), dtype=np.uint8, buffer=frames_block.buf)
+    landmarks = np.ndarray((slot_count, NUM_LANDMARKS, LANDMARK_FIELDS), dtype=np.float32, buffer=results_block.buf)
+    parent = os.getppid()
+    try:
+        try:
+            model = MediaPipePoseModel() if model_name == "mediapipe" else SyntheticPoseModel()
+        except Exception as e:
+            results.put((None, 0, 0, None, f"{type(e).__name__}: {e}"))
+            return
+        results.put((None, 0, 0, None, None))
+        while True:
+            try:
+                task = tasks.get(timeout=1)
+            except queue.Empty:
+                # A server killed without close() must not leave its workers behind
+                if os.getppid() != parent:
+                    break
+                continue
+            if task is None:
+                break
+            slot, kind, size, shape = task
+            started_ns = now_ns()
+            try:
+                if kind == "encoded":
+                    image = Image.open(io.BytesIO(frames[slot, :size]))
+                    info = image_info(image)
+                    pixels = np.asarray(image.convert("RGB"))
+                else:
+                    pixels = frames[slot, :size].reshape(shape)
+                    info = raw_info(shape)
+                    if shape[2] != 3:
+                        pixels = np.ascontiguousarray(pixels[:, :, :3]) if shape[2] > 3 else np.repeat(pixels, 3, 2)
+                model(pixels, landmarks[slot])
+                results.put((slot, started_ns, now_ns(), info, None))
+            except Exception as e:
+                results.put((slot, started_ns, now_ns(), None, f"{type(e).__name__}: {e}"))
+    finally:
+        del frames, landmarks
+        frames_block.close()
+        results_block.close()
+
+
+class PoseWorkerPool:
+    """Worker processes running the pose model, fed through shared-memory frame slots.
+
+    A frame waits for a free slot (backpressure when every worker is busy), is
+    copied into it and its slot number is queued to the workers; the 33 landmarks
+    come back in the slot's row of a shared result array. Queue depths are
+    exported as gauges (frames waiting for a slot, frames handed to the workers)
+    and the time a frame spends queued and in the model as stages.
+
+    A worker that dies fails the frames in flight and every later one: the pool
+    does not replace workers.
+    """
+
+    def __init__(self, model=POSE_MODEL, workers=POSE_WORKERS):
+        if model not in MODELS:
+            raise ValueError(f"SPIKE_POSE_MODEL must be one of {', '.join(MODELS)}")
+        self.model = model
+        self.workers = max(1, workers)
+        self.slot_count = self.workers * SLOTS_PER_WORKER
+        self.processes = []
+        self.collector = None
+        self.loop = None
+        self.pending = {}
+        self.free_slots = None
+        self.waiting = 0
+        self.in_flight = 0
+        self.error = None
+        self.closing = False
+
+    def start(self):
+        if self.model == "none" or self.processes:
+            return
+        self.closing = False
+        self.loop = asyncio.get_running_loop()
+        self.free_slots = asyncio.Queue()
+        for slot in range(self.slot_count):
+            self.free_slots.put_nowait(slot)
+        self.frames_block = shared_memory.SharedMemory(create=True, size=self.slot_count * SLOT_BYTES)
+        self.results_block = shared_memory.SharedMemory(
+            create=True, size=self.slot_count * NUM_LANDMARKS * LANDMARK_FIELDS * 4
+        )
+        self.frames = np.ndarray((self.slot_count, SLOT_BYTES), dtype=np.uint8, buffer=self.frames_block.buf)
+        self.landmarks = np.ndarray((self.slot_count, NUM_LANDMARKS, LANDMARK_FIELDS), dtype=np.float32,
+                                    buffer=self.results_block.buf)
+        # Spawned, not forked: the parent already runs an event loop and threads
+        context = multiprocessing.get_context("spawn")
+        self.tasks = context.Queue()
+        self.results = context.Queue()
+        for _ in range(self.workers):
+            process = context.Process(
+                target=worker_main,
+                args=(self.model, self.frames_block.name, self.results_block.name, self.slot_count, self.tasks,
+                      self.results),
+                daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+        try:
+            self.wait_ready()
+        except Exception:
+            self.close()
+            raise
+        self.collector = threading.Thread(target=self.collect, name="pose-results", daemon=True)
+        self.collector.start()
+        set_gauge("pose_workers", self.workers)
+        print(f"Pose estimation: {self.workers} '{self.model}' workers, {self.slot_count} shared-memory slots")
+
+    def wait_ready(self):
+        """Blocks until every worker has loaded the model; raises RuntimeError when one could not"""
+        deadline = time.monotonic() + POSE_STARTUP_SECONDS
+        ready = 0
+        while ready < self.workers:
+            try:
+                _, _, _, _, error = self.results.get(timeout=0.5)
+            except queue.Empty:
+                dead = [process for process in self.processes if not process.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Pose worker exited with code {dead[0].exitcode} while loading "
+                                       f"the '{self.model}' model")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Pose workers did not load the '{self.model}' model "
+                                       f"within {POSE_STARTUP_SECONDS:g} s")
+                continue
+            if error is not None:
+                raise RuntimeError(f"Pose model '{self.model}' could not be loaded: {error}")
+            ready += 1
+
+    def close(self):
+        self.closing = True
+        # The results thread notices within one poll and stops touching the loop
+        if self.collector is not None:
+            self.collector.join()
+            self.collector = None
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+        self.processes = []
+        if self.free_slots is not None:
+            del self.frames, self.landmarks
+            for block in (self.frames_block, self.results_block):
+                block.close()
+                block.unlink()
+            self.free_slots = None
+
+    def collect(self):
+        """Results thread: hands each finished slot back to the event loop and watches the workers"""
+        while not self.closing:
+            try:
+                result = self.results.get(timeout=0.5)
+            except queue.Empty:
+                # Results already queued are delivered first; only then is a dead worker reported
+                dead = [process for process in self.processes if not process.is_alive()]
+                if dead and not self.closing:
+                    self.deliver(self.fail, f"Pose worker exited with code {dead[0].exitcode}")
+                    return
+                continue
+            except (EOFError, OSError):
+                return
+            if not self.deliver(self.finish, *result):
+                return
+
+    def deliver(self, callback, *args):
+        """Schedules callback on the event loop from the results thread; False once the loop is closed"""
+        if self.loop.is_closed():
+            return False
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # Closed between the check and the call
+            return False
+        return True
+
+    def fail(self, error):
+        """Fails the frames in flight and makes every later estimate() raise"""
+        if self.closing:
+            return
+        self.error = error
+        print(f"Pose estimation failed: {error}")
+        pending, self.pending = self.pending, {}
+        for slot, (future, _) in pending.items():
+            if not future.done():
+                future.set_exception(RuntimeError(error))
+            # Wakes frames waiting for a slot, which then see the error
+            self.free_slots.put_nowait(slot)
+        self.in_flight = 0
+        self.update_gauges()
+
+    def finish(self, slot, started_ns, finished_ns, info, error):
+        entry = self.pending.pop(slot, None)
+        if entry is None:
+            return
+        future, submitted_ns = entry
+        self.in_flight -= 1
+        self.update_gauges()
+        # perf_counter_ns is CLOCK_MONOTONIC, so worker and server stamps compare
+        record_span("pose_queue", started_ns - submitted_ns)
+        record_span("pose_inference", finished_ns - started_ns)
+        if error is not None:
+            self.free_slots.put_nowait(slot)
+            if not future.done():
+                future.set_exception(RuntimeError(error))
+            return
+        landmarks = self.landmarks[slot].tolist()
+        self.free_slots.put_nowait(slot)
+        if not future.done():
+            future.set_result({**info, "landmarks": landmarks, "inference_ms": (finished_ns - started_ns) / 1e6})
+
+    def update_gauges(self):
+        set_gauge("pose_waiting_for_slot", self.waiting)
+        set_gauge("pose_in_flight", self.in_flight)
+
+    async def estimate(self, data, kind="encoded", shape=None):
+        """Landmarks of one frame: encoded image bytes, or raw uint8 pixels of the given (height, width, channels).
+
+        process_time_ms covers the whole stage (slot wait, queue and model);
+        inference_ms only the worker's share.
+        """
+        if self.model == "none":
+            if kind == "encoded":
+                return inspect_image(data)
+            return {**raw_info(shape), "process_time_ms": 0.0}
+        if self.error is not None:
+            raise RuntimeError(self.error)
+        start = now_ns()
+        size = len(data) if kind == "encoded" else int(np.prod(shape))
+        if size > SLOT_BYTES:
+            raise ValueError(f"Frame of {size} bytes exceeds SPIKE_POSE_SLOT_BYTES ({SLOT_BYTES})")
+        if self.free_slots is None:
+            # Starting here would block the event loop while the workers load the model
+            raise RuntimeError("Pose pool not started: the server calls start() before serving")
+
+        self.waiting += 1
+        self.update_gauges()
+        try:
+            slot = await self.free_slots.get()
+        finally:
+            self.waiting -= 1
+        if self.error is not None:
+            self.free_slots.put_nowait(slot)
+            raise RuntimeError(self.error)
+        if kind == "encoded":
+            self.frames[slot, :size] = np.frombuffer(data, dtype=np.uint8)
+        else:
+            self.frames[slot, :size] = np.asarray(data, dtype=np.uint8).reshape(-1)
+
+        future = self.loop.create_future()
+        self.pending[slot] = (future, now_ns())
+        self.in_flight += 1
+        self.update_gauges()
+        self.tasks.put((slot, kind, size, shape))
+        result = await future
+        result["process_time_ms"] = (now_ns() - start) / 1e6
+        return result
+
+
+pose_pool = PoseWorkerPool()
+
+
+async def estimate_pose(image_bytes):
+    """Pose of one encoded image through the shared worker pool"""
+    return await pose_pool.estimate(image_bytes)
+
+
+async def estimate_pose_pixels(pixels):
+    """Pose of one (height, width, channels) uint8 matrix through the shared worker pool"""
+    return await pose_pool.estimate(pixels, kind="raw", shape=pixels.shape)
@@ -1,40 +1,24 @@
 import asyncio
+import signal
 import websockets # type: ignore
 import base64
-import time
 import json
-from PIL import Image # type: ignore
-import io
-
-metrics = {
-    "total_messages": 0,
-    "total_bytes": 0,
-    "start_time": 0,
-    "processing_times": []
-}
+from instrumentation import (
+    increment, registry, report_connection, span, start_connection_profile, start_instrumentation,
+    stop_connection_profile,
+)
+from pose_pool import estimate_pose, pose_pool
+from transport import serve_options
+from timing import clock_sync_reply, server_timing, wall_ns
 
 async def process_image(image_data):
-    """Emulates image processing (pose estimation)"""
+    """Pose estimation of a base64 image on the pose worker pool"""
     try:
-        start = time.time()
-        
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes))
+        with span("decode"):
+            image_bytes = base64.b64decode(image_data)
         
-        width, height = image.size
-        format = image.format
-        mode = image.mode
-
-        process_time = time.time() - start
-        metrics["processing_times"].append(process_time)
-        
-        return {
-            "width": width,
-            "height": height,
-            "format": format,
-            "mode": mode,
-            "process_time_ms": process_time * 1000
-        }
+        with span("pose"):
+            return await estimate_pose(image_bytes)
     except base64.binascii.Error:
         raise ValueError("Invalid base64 image data")
     except Exception as e:
@@ -43,15 +27,21 @@ async def process_image(image_data):
 async def handle_connection(websocket):
     """Handles the WebSocket connection with the client"""
     print(f"Client connected from {websocket.remote_address}")
-    metrics["start_time"] = time.time()
+    connection = registry.open_connection(websocket.id.hex[:8])
+    profile = start_connection_profile(connection.connection_id)
     
     try:
         async for message in websocket:
+            received_ns = wall_ns()
             try:
-                metrics["total_messages"] += 1
-                metrics["total_bytes"] += len(message)
+                with span("decode"):
+                    data = json.loads(message)
+                reply = clock_sync_reply(data, received_ns)
+                if reply is not None:
+                    await websocket.send(reply)
+                    continue
+                connection.record_message(len(message))
                 
-                data = json.loads(message)
                 if "image" not in data:
                     await websocket.send(json.dumps({
                         "status": "error",
@@ -60,12 +50,20 @@ async def handle_connection(websocket):
                     continue
                 
                 image_data = data["image"]
+                started_ns = wall_ns()
                 result = await process_image(image_data)
+                finished_ns = wall_ns()
+                connection.record_processing(result["process_time_ms"] / 1000)
                 
-                await websocket.send(json.dumps({
-                    "status": "processed",
-                    "image_info": result
-                }))
+                with span("serialize"):
+                    response = json.dumps({
+                        "status": "processed",
+                        "image_info": result,
+                        "sequence": data.get("sequence"),
+                        "server_timing": server_timing(received_ns, started_ns, finished_ns)
+                    })
+                with span("send"):
+                    await websocket.send(response)
                 
             except json.JSONDecodeError as e:
                 print(f"Error decoding JSON: {str(e)}")
@@ -74,6 +72,7 @@ async def handle_connection(websocket):
                     "message": "Invalid JSON message"
                 }))
             except Exception as e:
+                increment("errors")
                 print(f"Error processing message: {str(e)}")
                 await websocket.send(json.dumps({
                     "status": "error",
@@ -85,21 +84,21 @@ async def handle_connection(websocket):
     except Exception as e:
         print(f"Unexpected error: {str(e)}")
     finally:
-        if metrics["total_messages"] > 0:
-            duration = time.time() - metrics["start_time"]
-            avg_process = sum(metrics["processing_times"]) / len(metrics["processing_times"]) * 1000
-            print(f"\nBase64 performance metrics:")
-            print(f"Total images processed: {metrics['total_messages']}")
-            print(f"Total bytes received: {metrics['total_bytes'] / (1024*1024):.2f} MB")
-            print(f"Average processing time: {avg_process:.2f} ms")
-            print(f"Total processing time: {duration:.2f} s")
-            print(f"Throughput: {metrics['total_messages']/duration:.2f} img/s")
-            print(f"Bandwidth: {(metrics['total_bytes'] / duration) / (1024*1024):.2f} MB/s")
+        stop_connection_profile(profile)
+        registry.close_connection(connection)
+        report_connection("Base64", connection)
 
 async def main():
-    server = await websockets.serve(handle_connection, "localhost", 8765)
+    await start_instrumentation("base64", 8765)
+    pose_pool.start()
+    server = await websockets.serve(handle_connection, "localhost", 8765, **serve_options())
     print("Base64 WebSocket Server started on: ws://localhost:8765")
-    await server.wait_closed()
+    # The benchmark runner stops servers with SIGTERM: close the connections, then the pose workers
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+    try:
+        await server.wait_closed()
+    finally:
+        pose_pool.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,60 +1,61 @@
 import asyncio
+import signal
 import websockets # type: ignore
-import time
 import json
 import numpy as np # type: ignore
-from PIL import Image # type: ignore
-import io
-
-metrics = {
-    "total_messages": 0,
-    "total_bytes": 0,
-    "start_time": 0,
-    "processing_times": []
-}
+from instrumentation import (
+    increment, registry, report_connection, span, start_connection_profile, start_instrumentation,
+    stop_connection_profile,
+)
+from pose_pool import estimate_pose_pixels, pose_pool
+from transport import serve_options
+from timing import clock_sync_reply, server_timing, wall_ns
 
 async def process_image_matrix(image_data):
-    """Simulates image processing (pose estimation) from matrix"""
-    start = time.time()
-    
+    """Pose estimation of a pixel matrix on the pose worker pool"""
     height = image_data['height']
     width = image_data['width']
     channels = image_data['channels']
     flat_data = image_data['data']
     
-    matrix = np.array(flat_data, dtype=np.uint8).reshape(height, width, channels)
-    
-    image = Image.fromarray(matrix)
+    with span("decode"):
+        matrix = np.array(flat_data, dtype=np.uint8).reshape(height, width, channels)
     
-    process_time = time.time() - start
-    metrics["processing_times"].append(process_time)
-    
-    return {
-        "width": width,
-        "height": height,
-        "channels": channels,
-        "process_time_ms": process_time * 1000
-    }
+    with span("pose"):
+        return await estimate_pose_pixels(matrix)
 
 async def handle_connection(websocket):
     """Handles the WebSocket connection with the client"""
     print(f"Client connected from {websocket.remote_address}")
-    metrics["start_time"] = time.time()
+    connection = registry.open_connection(websocket.id.hex[:8])
+    profile = start_connection_profile(connection.connection_id)
     
     try:
         async for message in websocket:
+            received_ns = wall_ns()
             try:
-                metrics["total_messages"] += 1
-                metrics["total_bytes"] += len(message)
-                
-                data = json.loads(message)
+                with span("decode"):
+                    data = json.loads(message)
+                reply = clock_sync_reply(data, received_ns)
+                if reply is not None:
+                    await websocket.send(reply)
+                    continue
+                connection.record_message(len(message))
                 
+                started_ns = wall_ns()
                 result = await process_image_matrix(data)
+                finished_ns = wall_ns()
+                connection.record_processing(result["process_time_ms"] / 1000)
                 
-                await websocket.send(json.dumps({
-                    "status": "processed",
-                    "image_info": result
-                }))
+                with span("serialize"):
+                    response = json.dumps({
+                        "status": "processed",
+                        "image_info": result,
+                        "sequence": data.get("sequence"),
+                        "server_timing": server_timing(received_ns, started_ns, finished_ns)
+                    })
+                with span("send"):
+                    await websocket.send(response)
                 
             except json.JSONDecodeError as e:
                 print(f"Error decoding JSON: {str(e)}")
@@ -63,6 +64,7 @@ async def handle_connection(websocket):
                     "message": "Invalid JSON message"
                 }))
             except Exception as e:
+                increment("errors")
                 print(f"Error processing message: {str(e)}")
                 await websocket.send(json.dumps({
                     "status": "error",
@@ -74,28 +76,28 @@ async def handle_connection(websocket):
     except Exception as e:
         print(f"Unexpected error: {str(e)}")
     finally:
-        if metrics["total_messages"] > 0:
-            duration = time.time() - metrics["start_time"]
-            avg_process = sum(metrics["processing_times"]) / len(metrics["processing_times"]) * 1000
-            print(f"\nMatrix performance metrics:")
-            print(f"Total images processed: {metrics['total_messages']}")
-            print(f"Total bytes received: {metrics['total_bytes'] / (1024*1024):.2f} MB")
-            print(f"Average processing time: {avg_process:.2f} ms")
-            print(f"Total processing time: {duration:.2f} s")
-            print(f"Throughput: {metrics['total_messages']/duration:.2f} img/s")
-            print(f"Bandwidth: {(metrics['total_bytes'] / duration) / (1024*1024):.2f} MB/s")
+        stop_connection_profile(profile)
+        registry.close_connection(connection)
+        report_connection("Matrix", connection)
 
 async def main():
+    await start_instrumentation("matrix", 8767)
+    pose_pool.start()
     # Configure the server with a larger message limit (2MB)
     server = await websockets.serve(
         handle_connection,
         "localhost",
         8767,
-        max_size=2 * 1024 * 1024  # 2MB
+        **serve_options(2 * 1024 * 1024)  # 2MB
     )
     print("Matrix WebSocket Server started on: ws://localhost:8767")
     
-    await server.wait_closed()
+    # The benchmark runner stops servers with SIGTERM: close the connections, then the pose workers
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+    try:
+        await server.wait_closed()
+    finally:
+        pose_pool.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
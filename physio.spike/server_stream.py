@@ -1,17 +1,16 @@
 import asyncio
+import signal
 import websockets # type: ignore
-import time
 import json
-from PIL import Image # type: ignore
-import io
+from instrumentation import (
+    increment, registry, report_connection, span, start_connection_profile, start_instrumentation,
+    stop_connection_profile,
+)
+from pose_pool import estimate_pose, pose_pool
+from transport import serve_options
+from timing import clock_sync_reply, server_timing, wall_ns
 import struct
-
-metrics = {
-    "total_messages": 0,
-    "total_bytes": 0,
-    "start_time": 0,
-    "processing_times": []
-}
+from envelope import is_batch, unpack_batch
 
 class ImageStreamProcessor:
     def __init__(self):
@@ -38,53 +37,77 @@ class ImageStreamProcessor:
         return self.buffer[:self.expected_size], self.image_id, self.fragments_received
 
 async def process_image(image_bytes):
-    """Simulates image processing (pose estimation)"""
-    start = time.time()
-    
-    image = Image.open(io.BytesIO(image_bytes))
-    
-    width, height = image.size
-    format = image.format
-    mode = image.mode
-    
-    process_time = time.time() - start
-    metrics["processing_times"].append(process_time)
-    
-    return {
-        "width": width,
-        "height": height,
-        "format": format,
-        "mode": mode,
-        "process_time_ms": process_time * 1000
-    }
+    """Pose estimation of one image on the pose worker pool"""
+    with span("pose"):
+        return await estimate_pose(image_bytes)
+
+async def process_batch(message):
+    """Estimate the poses of the K images of a batch envelope concurrently on the pose worker pool"""
+    with span("decode"):
+        images = unpack_batch(message)
+    with span("pose"):
+        return await asyncio.gather(*(estimate_pose(image) for image in images))
 
 async def handle_connection(websocket):
     """Handles the WebSocket connection with the client"""
     print(f"Client connected from {websocket.remote_address}")
-    metrics["start_time"] = time.time()
+    connection = registry.open_connection(websocket.id.hex[:8])
+    profile = start_connection_profile(connection.connection_id)
     
     stream_processor = ImageStreamProcessor()
     
     try:
         async for message in websocket:
+            received_ns = wall_ns()
             try:
                 if isinstance(message, bytes):
-                    metrics["total_bytes"] += len(message)
+                    connection.record_bytes(len(message))
+                    increment("fragments")
                     
-                    is_complete = stream_processor.add_fragment(message)
+                    with span("reassemble"):
+                        is_complete = stream_processor.add_fragment(message)
                     
-                    if is_complete:
+                    if is_complete and is_batch(stream_processor.buffer):
+                        batch_data, image_id, fragments = stream_processor.get_image_data()
+                        started_ns = wall_ns()
+                        results = await process_batch(batch_data)
+                        finished_ns = wall_ns()
+                        connection.record_message(images=len(results))
+                        for result in results:
+                            connection.record_processing(result["process_time_ms"] / 1000)
+                        
+                        with span("serialize"):
+                            response = json.dumps({
+                                "status": "processed",
+                                "batch_size": len(results),
+                                "batch_id": image_id,
+                                "fragments_received": fragments,
+                                "images_info": results,
+                                "server_timing": server_timing(received_ns, started_ns, finished_ns)
+                            })
+                        with span("send"):
+                            await websocket.send(response)
+                        
+                        stream_processor.reset()
+                    elif is_complete:
                         image_data, image_id, fragments = stream_processor.get_image_data()
-                        metrics["total_messages"] += 1
+                        connection.record_message()
                         
+                        started_ns = wall_ns()
                         result = await process_image(image_data)
+                        finished_ns = wall_ns()
+                        connection.record_processing(result["process_time_ms"] / 1000)
                         result["fragments_received"] = fragments
                         result["image_id"] = image_id
                         
-                        await websocket.send(json.dumps({
-                            "status": "processed",
-                            "image_info": result
-                        }))
+                        with span("serialize"):
+                            response = json.dumps({
+                                "status": "processed",
+                                "image_info": result,
+                                "server_timing": server_timing(received_ns, started_ns, finished_ns)
+                            })
+                        with span("send"):
+                            await websocket.send(response)
                         
                         stream_processor.reset()
                     else:
@@ -92,6 +115,8 @@ async def handle_connection(websocket):
                             "status": "fragment_received",
                             "fragments": stream_processor.fragments_received
                         }))
+                elif (reply := clock_sync_reply(json.loads(message), received_ns)) is not None:
+                    await websocket.send(reply)
                 else:
                     print(f"Received non-binary message: {type(message)}")
                     await websocket.send(json.dumps({
@@ -99,6 +124,7 @@ async def handle_connection(websocket):
                         "message": "Expected a binary message"
                     }))
             except Exception as e:
+                increment("errors")
                 print(f"Error processing message: {str(e)}")
                 await websocket.send(json.dumps({
                     "status": "error",
@@ -110,22 +136,22 @@ async def handle_connection(websocket):
     except Exception as e:
         print(f"Unexpected error: {str(e)}")
     finally:
-        if metrics["total_messages"] > 0:
-            duration = time.time() - metrics["start_time"]
-            avg_process = sum(metrics["processing_times"]) / len(metrics["processing_times"]) * 1000
-            print(f"\nStream performance metrics:")
-            print(f"Total images processed: {metrics['total_messages']}")
-            print(f"Total bytes received: {metrics['total_bytes'] / (1024*1024):.2f} MB")
-            print(f"Average processing time: {avg_process:.2f} ms")
-            print(f"Total time: {duration:.2f} s")
-            print(f"Throughput: {metrics['total_messages']/duration:.2f} img/s")
-            print(f"Bandwidth: {(metrics['total_bytes'] / duration) / (1024*1024):.2f} MB/s")
+        stop_connection_profile(profile)
+        registry.close_connection(connection)
+        report_connection("Stream", connection)
 
 async def main():
-    server = await websockets.serve(handle_connection, "localhost", 8768)
+    await start_instrumentation("stream", 8768)
+    pose_pool.start()
+    server = await websockets.serve(handle_connection, "localhost", 8768, **serve_options())
     print("Stream WebSocket Server started on: ws://localhost:8768")
     
-    await server.wait_closed()
+    # The benchmark runner stops servers with SIGTERM: close the connections, then the pose workers
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+    try:
+        await server.wait_closed()
+    finally:
+        pose_pool.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,103 @@
+import itertools
+import json
+import math
+import time
+
+# Durations come from the monotonic high-resolution counter; only timestamps that
+# have to be compared across processes (clock sync, latency breakdown) use the wall clock.
+now_ns = time.perf_counter_ns
+wall_ns = time.time_ns
+
+CLOCK_SYNC_SAMPLES = 8
+
+
+def elapsed_ms(start_ns):
+    return (time.perf_counter_ns() - start_ns) / 1e6
+
+
+def sequence_ids(start=1):
+    """Monotonic frame IDs; unlike millisecond timestamps they never collide"""
+    return itertools.count(start)
+
+
+def server_timing(received_ns, started_ns, finished_ns):
+    """Wall-clock stamps the server adds to a response so the client can split its latency"""
+    return {
+        "received_ns": received_ns,
+        "started_ns": started_ns,
+        "finished_ns": finished_ns,
+        "replied_ns": wall_ns(),
+    }
+
+
+def clock_sync_reply(data, received_ns):
+    """Reply to a decoded NTP-style clock sync request, or None for any other message"""
+    if not isinstance(data, dict) or data.get("type") != "clock_sync":
+        return None
+    return json.dumps({"type": "clock_sync", "t0": data.get("t0"), "t1": received_ns, "t2": wall_ns()})
+
+
+async def estimate_clock_offset(websocket, samples=CLOCK_SYNC_SAMPLES):
+    """Offset of the server clock relative to ours, from the exchange with the lowest round trip.
+
+    Returns (offset_ns, round_trip_ns); server_time - offset_ns maps a server
+    timestamp onto the client clock.
+    """
+    best = None
+    for _ in range(samples):
+        t0 = wall_ns()
+        await websocket.send(json.dumps({"type": "clock_sync", "t0": t0}))
+        reply = json.loads(await websocket.recv())
+        t3 = wall_ns()
+        t1, t2 = reply["t1"], reply["t2"]
+        round_trip = (t3 - t0) - (t2 - t1)
+        offset = ((t1 - t0) + (t2 - t3)) // 2
+        if best is None or round_trip < best[1]:
+            best = (offset, round_trip)
+    return best
+
+
+def latency_breakdown(sent_ns, received_ns, timing, offset_ns):
+    """Split one request's latency (client wall clock stamps) into upload, queueing, processing and response, in ms"""
+    return {
+        "upload": (timing["received_ns"] - offset_ns - sent_ns) / 1e6,
+        "queueing": (timing["started_ns"] - timing["received_ns"]) / 1e6,
+        "processing": (timing["finished_ns"] - timing["started_ns"]) / 1e6,
+        "response": (received_ns - (timing["replied_ns"] - offset_ns)) / 1e6,
+    }
+
+
+def print_latency_summary(breakdowns):
+    """Average latency components, in the "<name>: <value> ms" form benchmark_runner parses"""
+    if not breakdowns:
+        return
+    for component in ("upload", "queueing", "processing", "response"):
+        average = sum(b[component] for b in breakdowns) / len(breakdowns)
+        print(f"Average {component} time: {average:.2f} ms")
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of samples"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def client_summary(metrics, duration):
+    """The figures a client prints in its summary, keyed like the printed labels"""
+    times = metrics["transmission_times"]
+    summary = {
+        "Total images sent": metrics["total_images"],
+        "Total data sent": metrics["total_bytes"] / (1024*1024),
+        "Average transmission time": sum(times) / len(times) * 1000 if times else 0.0,
+        "P99 transmission time": percentile(times, 0.99) * 1000,
+        "Total time": duration,
+        "Throughput": metrics["total_images"] / duration if duration else 0.0,
+        "Bandwidth": (metrics["total_bytes"] / duration) / (1024*1024) if duration else 0.0,
+    }
+    for component in ("upload", "queueing", "processing", "response"):
+        breakdowns = metrics["latency_breakdowns"]
+        if breakdowns:
+            summary[f"Average {component} time"] = sum(b[component] for b in breakdowns) / len(breakdowns)
+    return summary
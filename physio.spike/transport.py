@@ -0,0 +1,37 @@
+import os
+
+# WebSocket transport knobs. Each server keeps its own defaults; benchmark_runner's
+# sweep overrides them through the environment of the server process.
+COMPRESSIONS = {"deflate": "deflate", "none": None}
+DEFAULT_MAX_SIZE = 1024 * 1024  # websockets' own default
+
+
+def serve_options(max_size=DEFAULT_MAX_SIZE):
+    """Keyword arguments for websockets.serve; SPIKE_MAX_SIZE and SPIKE_COMPRESSION override the defaults"""
+    compression = os.environ.get("SPIKE_COMPRESSION", "deflate").lower()
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"SPIKE_COMPRESSION must be one of {', '.join(COMPRESSIONS)}")
+    return {
+        "max_size": int(os.environ.get("SPIKE_MAX_SIZE", max_size)),
+        "compression": COMPRESSIONS[compression],
+    }
+
+
+def server_environment(max_size=None, compression=None):
+    """Environment overrides read by serve_options; None keeps the server default"""
+    environment = {}
+    if max_size:
+        environment["SPIKE_MAX_SIZE"] = str(max_size)
+    if compression:
+        environment["SPIKE_COMPRESSION"] = compression
+    return environment
+
+
+def client_options(max_size=None, compression=None):
+    """websockets.connect keyword arguments matching a server configuration"""
+    options = {}
+    if max_size:
+        options["max_size"] = max_size
+    if compression:
+        options["compression"] = COMPRESSIONS[compression]
+    return options